@@ -0,0 +1,222 @@
+# async_worker.py
+"""
+Worker assíncrono do Dramatiq para tarefas limitadas por I/O.
+
+O 'dramatiq worker' padrão executa uma mensagem por thread, e cada process_ai_request
+ainda abre o próprio loop de eventos (asyncio.run). Aqui um único loop por processo
+executa até --max-in-flight orquestrações ao mesmo tempo (process_ai_request_async);
+as chamadas bloqueantes (SDK do Gemini, ferramentas, MongoDB) dividem um pool de
+--blocking-threads threads.
+
+Contrapressão: o limite em voo é dividido entre as filas consumidas (prefetch de
+cada uma, com pelo menos uma mensagem por fila), então o processo não reserva no
+broker mais mensagens do que consegue executar; as demais ficam na fila para outros
+processos. Com --queues só as filas de orquestração, todo o limite vai para elas.
+
+Actors sem corrotina em worker.ASYNC_HANDLERS (ex.: deliver_webhook) rodam no pool
+de threads. O time_limit dos actors é aplicado com asyncio.wait_for; para os que
+rodam em thread, o worker deixa de esperar, mas a thread segue até o fim.
+
+Uso:
+    python -m async_worker --max-in-flight 200 --blocking-threads 64
+    python -m async_worker --queues default
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+
+import dramatiq
+from dramatiq.errors import RateLimitExceeded
+from dramatiq.middleware import ShutdownNotifications, SkipMessage, TimeLimit, TimeLimitExceeded
+from dramatiq.worker import WorkerThread
+
+from config import settings
+from worker import ASYNC_HANDLERS, broker
+
+logger = logging.getLogger(__name__)
+
+# Interrompem a thread que processa a mensagem (exceção assíncrona na thread):
+# aqui essa thread é a do loop, compartilhada por todas as tarefas.
+_THREAD_BOUND_MIDDLEWARE = (TimeLimit, ShutdownNotifications)
+
+
+class _EventLoopWorkerThread(WorkerThread):
+    """Thread única que tira mensagens da fila de trabalho e as executa como tarefas do loop."""
+
+    def __init__(self, *, max_in_flight: int, blocking_threads: int, **kwargs):
+        super().__init__(**kwargs)
+        self.max_in_flight = max_in_flight
+        self.blocking_threads = blocking_threads
+        self.in_flight = 0
+
+    def run(self):
+        self.running = True
+        self.broker.emit_after("worker_thread_boot", self)
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(ThreadPoolExecutor(self.blocking_threads, thread_name_prefix="async-worker-io"))
+        try:
+            loop.run_until_complete(self._dispatch())
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            loop.close()
+        self.broker.emit_before("worker_thread_shutdown", self)
+
+    async def _dispatch(self):
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        # A espera na fila de trabalho bloqueia: fica numa thread própria, fora do pool das tarefas.
+        poller = ThreadPoolExecutor(1, thread_name_prefix="async-worker-poll")
+        loop = asyncio.get_running_loop()
+        try:
+            while self.running:
+                await slots.acquire()
+                try:
+                    item = await loop.run_in_executor(poller, self.work_queue.get, True, self.timeout)
+                except Empty:
+                    slots.release()
+                    continue
+                task = loop.create_task(self._run(item.message, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            # Encerramento: as tarefas em andamento terminam antes de os consumidores fecharem.
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            poller.shutdown(wait=False)
+
+    async def _run(self, message, slots: asyncio.Semaphore):
+        self.in_flight += 1
+        try:
+            await self.process_message_async(message)
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    def _emit_before(self, signal_name: str, *args, **kwargs):
+        for middleware in self.broker.middleware:
+            if not isinstance(middleware, _THREAD_BOUND_MIDDLEWARE):
+                getattr(middleware, "before_" + signal_name)(self.broker, *args, **kwargs)
+
+    def _emit_after(self, signal_name: str, *args, **kwargs):
+        for middleware in reversed(self.broker.middleware):
+            if isinstance(middleware, _THREAD_BOUND_MIDDLEWARE):
+                continue
+            try:
+                getattr(middleware, "after_" + signal_name)(self.broker, *args, **kwargs)
+            except Exception:
+                logger.critical("Erro no middleware %r (after_%s).", middleware, signal_name, exc_info=True)
+
+    def _post_process(self, message, signal_name: str, **kwargs):
+        # Middlewares (Retries reenfileira pelo broker) e ack/nack fazem I/O: executados no pool.
+        self._emit_after(signal_name, message, **kwargs)
+        self.consumers[message.queue_name].post_process_message(message)
+
+    async def process_message_async(self, message):
+        """Equivalente a WorkerThread.process_message, com o actor aguardado no loop."""
+        actor = None
+        signal_name, after_kwargs = "process_message", {}
+        try:
+            self._emit_before("process_message", message)
+            result = None
+            if not message.failed:
+                actor = self.broker.get_actor(message.actor_name)
+                handler = ASYNC_HANDLERS.get(actor.actor_name)
+                if handler is not None:
+                    call = handler(*message.args, **message.kwargs)
+                else:
+                    call = asyncio.to_thread(actor, *message.args, **message.kwargs)
+                time_limit = message.options.get("time_limit") or actor.options.get("time_limit")
+                try:
+                    result = await asyncio.wait_for(call, time_limit / 1000 if time_limit else None)
+                except asyncio.TimeoutError:
+                    raise TimeLimitExceeded(f"Mensagem {message.message_id} excedeu {time_limit} ms.") from None
+            after_kwargs = {"result": result}
+
+        except SkipMessage:
+            logger.warning("Mensagem %s ignorada.", message)
+            signal_name = "skip_message"
+
+        except BaseException as e:
+            message.stuff_exception(e)
+            throws = message.options.get("throws") or (actor and actor.options.get("throws"))
+            if isinstance(e, RateLimitExceeded) or (throws and isinstance(e, throws)):
+                logger.info("Mensagem %s terminou com a exceção esperada %s.", message, type(e).__name__)
+            else:
+                logger.error("Falha ao processar a mensagem %s.", message, exc_info=True)
+            after_kwargs = {"exception": e}
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+        finally:
+            await asyncio.to_thread(self._post_process, message, signal_name, **after_kwargs)
+            self.work_queue.task_done()
+            message.clear_exception()
+
+
+class AsyncWorker(dramatiq.Worker):
+    """
+    dramatiq.Worker com uma única thread de execução rodando um loop de eventos.
+    Os consumidores de fila, o shutdown e os middlewares são os do Dramatiq.
+    """
+
+    def __init__(self, broker, *, queues=None, max_in_flight: int = None, blocking_threads: int = None,
+                 worker_timeout: int = 1000):
+        super().__init__(broker, queues=queues, worker_timeout=worker_timeout, worker_threads=1)
+        self.max_in_flight = max_in_flight or settings.ASYNC_WORKER_MAX_IN_FLIGHT
+        self.blocking_threads = blocking_threads or settings.ASYNC_WORKER_BLOCKING_THREADS
+        # Contrapressão: o prefetch vale por consumidor, então o limite em voo é dividido entre
+        # as filas consumidas e a soma das mensagens reservadas no broker não passa dele.
+        queues = [
+            name for name in broker.get_declared_queues()
+            if not name.endswith((".DQ", ".XQ")) and (not self.consumer_whitelist or name in self.consumer_whitelist)
+        ]
+        self.queue_prefetch = max(1, self.max_in_flight // max(1, len(queues)))
+
+    def _add_worker(self):
+        worker = _EventLoopWorkerThread(
+            broker=self.broker,
+            consumers=self.consumers,
+            work_queue=self.work_queue,
+            worker_timeout=self.worker_timeout,
+            max_in_flight=self.max_in_flight,
+            blocking_threads=self.blocking_threads,
+        )
+        worker.start()
+        self.workers.append(worker)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(worker.in_flight for worker in self.workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker assíncrono: várias tarefas por processo num loop de eventos.")
+    parser.add_argument("--queues", nargs="+", help="Filas consumidas (padrão: todas as declaradas).")
+    parser.add_argument("--max-in-flight", type=int, default=settings.ASYNC_WORKER_MAX_IN_FLIGHT)
+    parser.add_argument("--blocking-threads", type=int, default=settings.ASYNC_WORKER_BLOCKING_THREADS)
+    args = parser.parse_args()
+
+    # Como no 'dramatiq worker': inicia o endpoint de métricas do processo.
+    broker.emit_after("process_boot")
+    worker = AsyncWorker(broker, queues=args.queues, max_in_flight=args.max_in_flight,
+                         blocking_threads=args.blocking_threads)
+    worker.start()
+    logger.info(f"Worker assíncrono iniciado: até {args.max_in_flight} tarefas em voo, "
+                f"{args.blocking_threads} threads para chamadas bloqueantes.")
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    stop.wait()
+
+    logger.info("Encerrando o worker assíncrono (aguardando as tarefas em andamento)...")
+    worker.stop()
+    broker.close()
+
+
+if __name__ == "__main__":
+    main()
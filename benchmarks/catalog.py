@@ -0,0 +1,95 @@
+# benchmarks/catalog.py
+"""
+Gerador de catálogos sintéticos de managers (ManagerSchema -> AgentSchema -> ToolSchema)
+para medir como o custo das funções do fluxo cresce com o tamanho do catálogo.
+O catálogo é determinístico para a mesma semente.
+"""
+import random
+from typing import List
+
+from models.schemas import AgentSchema, ApiAuthConfig, ApiConfigSchema, ManagerSchema, ParameterSchema, ToolSchema
+
+# Vocabulário dos domínios e ações: dá descrições variadas e com termos repetidos entre
+# managers, como em um catálogo real (útil também para índices lexicais).
+DOMAINS = [
+    "vendas", "estoque", "financeiro", "clientes", "logistica", "compras", "fiscal", "rh",
+    "marketing", "suporte", "contratos", "frota", "producao", "qualidade", "juridico", "projetos",
+]
+ACTIONS = ["consultar", "listar", "atualizar", "cancelar", "calcular", "exportar", "aprovar", "simular"]
+OBJECTS = ["pedido", "nota", "saldo", "titulo", "produto", "cadastro", "relatorio", "meta", "prazo", "contrato"]
+PARAM_TYPES = ["string", "integer", "number", "boolean", "date"]
+
+
+def generate_catalog(
+    managers: int,
+    agents_per_manager: int = 2,
+    tools_per_agent: int = 5,
+    params_per_tool: int = 3,
+    api_ratio: float = 0.5,
+    inactive_ratio: float = 0.05,
+    seed: int = 42,
+) -> List[ManagerSchema]:
+    """
+    Monta 'managers' managers com 'agents_per_manager' agentes cada e 'tools_per_agent'
+    ferramentas por agente. Uma fração 'api_ratio' das ferramentas é ApiTool (com
+    placeholders de path e body) e 'inactive_ratio' das ferramentas fica inativa.
+    """
+    rng = random.Random(seed)
+    catalog = []
+    for m in range(managers):
+        domain = DOMAINS[m % len(DOMAINS)]
+        manager_id = f"{domain.upper()}_{m:04d}"
+        agents = []
+        for a in range(agents_per_manager):
+            tools = []
+            for t in range(tools_per_agent):
+                action, obj = rng.choice(ACTIONS), rng.choice(OBJECTS)
+                tool_name = f"{action}_{obj}_{m}_{a}_{t}"
+                params = [
+                    ParameterSchema(
+                        name=f"{obj}_{p}" if p else f"{obj}_id",
+                        type=rng.choice(PARAM_TYPES),
+                        description=f"Parâmetro {p} usado para {action} {obj} em {domain}.",
+                        required=p == 0,
+                    )
+                    for p in range(params_per_tool)
+                ]
+                is_api = rng.random() < api_ratio
+                api_config = None
+                if is_api:
+                    api_config = ApiConfigSchema(
+                        method=rng.choice(["GET", "POST"]),
+                        base_url=f"https://api.exemplo.com/{domain}/{obj}/{{{params[0].name}}}" if params else f"https://api.exemplo.com/{domain}/{obj}",
+                        auth=ApiAuthConfig(type="bearer", token="token-sintetico"),
+                        headers={"Accept": "application/json"},
+                        body_template={p.name: f"{{{p.name}}}" for p in params[1:]} or None,
+                    )
+                tools.append(ToolSchema(
+                    tool_name=tool_name,
+                    description=f"Permite {action} {obj} no domínio de {domain}. Retorna os dados do {obj} encontrado.",
+                    parameters_mandatory=params,
+                    isApi=is_api,
+                    api_config=api_config,
+                    isLLM=not is_api,
+                    prompt_template=None if is_api else f"Responda sobre {obj}: {{pergunta}}",
+                    isActive=rng.random() >= inactive_ratio,
+                ))
+            agents.append(AgentSchema(
+                agent_id=f"{manager_id}_AGENT_{a}",
+                description=f"Agente {a} do domínio de {domain}, especialista em {', '.join(sorted({t.tool_name.split('_')[1] for t in tools}))}.",
+                isActive=True,
+                tools=tools,
+                response_guideline=f"Apresente os dados de {domain} em tópicos curtos.",
+            ))
+        catalog.append(ManagerSchema(
+            manager_id=manager_id,
+            description=f"Especialista em {domain}: {', '.join(rng.sample(OBJECTS, 3))}.",
+            isActive=True,
+            agents=agents,
+        ))
+    return catalog
+
+
+def catalog_size(managers: List[ManagerSchema]) -> int:
+    """Quantidade total de ferramentas no catálogo."""
+    return sum(len(agent.tools) for manager in managers for agent in manager.agents)
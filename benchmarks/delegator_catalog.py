@@ -0,0 +1,123 @@
+# benchmarks/delegator_catalog.py
+"""
+Tamanho do prompt do delegador conforme o catálogo de managers cresce, com e sem a poda
+do catálogo (services.routing.catalog_pruning).
+
+Para cada tamanho, sorteia perguntas sobre ferramentas do catálogo sintético
+(benchmarks.catalog.generate_catalog) e chama decide_next_manager_action com o LLM
+roteirizado. Informa, por modo, os tokens de prompt por chamada (estimativa de 4
+caracteres por token, a mesma do ScriptedBackend), os managers enviados, a fração de
+chamadas podadas, o recall (algum manager que atende a pergunta está no prompt) e o
+tempo da seleção.
+
+Uso:
+    python -m benchmarks.delegator_catalog
+    python -m benchmarks.delegator_catalog --managers 10 100 1000 --questions 200 --output benchmarks/results/catalog.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from config import settings
+from models.schemas import ExecutionContext
+from services.llm.backends import ScriptedBackend, set_llm_backend
+
+from benchmarks.catalog import generate_catalog
+
+
+class _PromptRecorder:
+    """Envolve o backend roteirizado guardando o tamanho de cada prompt."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.prompt_tokens = []
+
+    def generate(self, model, prompt, system_instruction, operation):
+        self.prompt_tokens.append(len(prompt) // 4)
+        return self.backend.generate(model, prompt, system_instruction, operation)
+
+
+def _questions(catalog, count: int, seed: int) -> list:
+    """Perguntas sobre ferramentas ativas sorteadas, com os managers que atendem cada uma."""
+    rng = random.Random(seed)
+    offers = {}
+    for manager in catalog:
+        domain = manager.manager_id.split("_")[0].lower()
+        for agent in manager.agents:
+            for tool in agent.tools:
+                if tool.isActive:
+                    action, obj = tool.tool_name.split("_")[:2]
+                    offers.setdefault((action, obj, domain), set()).add(manager.manager_id)
+    keys = sorted(offers)
+    questions = []
+    for _ in range(count):
+        action, obj, domain = rng.choice(keys)
+        questions.append((f"Preciso {action} o {obj} de {domain}, pode me ajudar?", offers[(action, obj, domain)]))
+    return questions
+
+
+def measure(adapter, recorder, catalog, questions, pruning: bool) -> dict:
+    settings.CATALOG_PRUNING_ENABLED = pruning
+    recorder.prompt_tokens.clear()
+    managers_sent, hits, pruned, select_ms = [], 0, 0, []
+    active = sum(1 for manager in catalog if manager.isActive)
+    for question, expected in questions:
+        context = ExecutionContext(session_id="bench", user_id="bench", user_question=question, available_managers=catalog)
+        started = time.perf_counter()
+        selected = adapter.catalog_pruner.select(context, [])
+        select_ms.append((time.perf_counter() - started) * 1000)
+        ids = {manager.manager_id for manager in selected if manager.isActive}
+        managers_sent.append(len(ids))
+        hits += bool(ids & expected)
+        pruned += len(ids) < active
+        adapter.decide_next_manager_action(context, [])
+    return {
+        "prompt_tokens_mean": round(statistics.fmean(recorder.prompt_tokens), 1),
+        "managers_in_prompt_mean": round(statistics.fmean(managers_sent), 1),
+        "pruned_ratio": round(pruned / len(questions), 3),
+        "recall": round(hits / len(questions), 3),
+        "select_ms_mean": round(statistics.fmean(select_ms), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokens do prompt do delegador por tamanho do catálogo, com e sem poda.")
+    parser.add_argument("--managers", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Grava o resultado em JSON neste arquivo.")
+    args = parser.parse_args()
+
+    from services.llm.gemini_adapter import GeminiAdapter
+    adapter = GeminiAdapter()
+    recorder = _PromptRecorder(ScriptedBackend(time_scale=0))
+    set_llm_backend(recorder)
+
+    report = {}
+    for size in args.managers:
+        catalog = generate_catalog(size)
+        questions = _questions(catalog, args.questions, args.seed)
+        point = {mode: measure(adapter, recorder, catalog, questions, mode == "pruned") for mode in ("full", "pruned")}
+        report[str(size)] = point
+        print(
+            f"managers={size:<5} tokens: completo {point['full']['prompt_tokens_mean']:>9.0f}"
+            f"  podado {point['pruned']['prompt_tokens_mean']:>9.0f}"
+            f"  (podadas {point['pruned']['pruned_ratio']:.0%}, recall {point['pruned']['recall']:.0%},"
+            f" seleção {point['pruned']['select_ms_mean']:.2f} ms)"
+        )
+
+    set_llm_backend(None)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+# benchmarks/e2e_throughput.py
+"""
+Benchmark de ponta a ponta do fluxo de tarefas, sem nenhuma dependência externa:
+LLM roteirizado (ScriptedBackend), MongoDB em memória (mongomock), servidor HTTP local
+para as APIs do ApiTool e para o webhook, broker do Dramatiq em memória e, quando o
+qdrant_client está instalado, um Qdrant em memória para a ferramenta de memória.
+
+Dois modos de disparo:
+    actor -> chama process_ai_request diretamente, em N threads (mede o worker isolado;
+             um dramatiq.Worker consome apenas a fila de webhooks)
+    api   -> POST /api/v1/ask pelo TestClient, com um dramatiq.Worker consumindo o
+             StubBroker; a latência vai do POST até a chegada do webhook
+
+Para cada cenário mede tarefas/s, latência p50/p95/p99, chamadas ao LLM por tarefa e
+memória (pico do tracemalloc e RSS máximo). O resultado é gravado em JSON em
+benchmarks/results/; com --baseline o relatório compara com uma execução anterior.
+
+Uso:
+    python -m benchmarks.e2e_throughput
+    python -m benchmarks.e2e_throughput --driver api --tasks 200 --concurrency 16
+    python -m benchmarks.e2e_throughput --scenarios single_manager --baseline benchmarks/results/<arquivo>.json
+"""
+import os
+
+# O broker é escolhido na importação do worker: precisa estar definido antes dela.
+os.environ.setdefault("DRAMATIQ_BROKER", "stub")
+
+import argparse
+import copy
+import json
+import logging
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from config import settings
+from models.schemas import AgentSchema, ApiAuthConfig, ApiConfigSchema, ManagerSchema, ParameterSchema, ToolSchema
+from services.database.mongo_connection import mongo_connection
+from services.llm.backends import DEFAULT_SCRIPT, ScriptedBackend, set_llm_backend
+
+from benchmarks.standins import InMemoryMongoClient, StaticDefinitionLoader, StubHttpServer
+
+DEFAULT_SCENARIOS = ["single_manager", "multi_manager", "pending_input", "large_tool_output", "memory_recall"]
+
+# Variação acima deste limite em relação ao baseline é marcada como regressão.
+REGRESSION_THRESHOLD = 0.10
+
+
+def _api_manager(manager_id: str, base_url: str, required_param: bool = False) -> ManagerSchema:
+    """Manager com um agente e um ApiTool apontando para o servidor local."""
+    parameters = []
+    if required_param:
+        parameters.append(ParameterSchema(name="cidade", type="string", description="Cidade da consulta.", required=True))
+    tool = ToolSchema(
+        tool_name=f"consultar_{manager_id.lower()}",
+        description=f"Consulta os dados do domínio {manager_id}.",
+        parameters_mandatory=parameters,
+        isApi=True,
+        api_config=ApiConfigSchema(method="GET", base_url=base_url, auth=ApiAuthConfig(type="none"), headers={}),
+        isLLM=False,
+        isActive=True,
+    )
+    agent = AgentSchema(
+        agent_id=f"{manager_id}_AGENT",
+        description=f"Agente do domínio {manager_id}.",
+        isActive=True,
+        tools=[tool],
+    )
+    return ManagerSchema(manager_id=manager_id, description=f"Especialista no domínio {manager_id}.", isActive=True, agents=[agent])
+
+
+def _delegator_script(manager_ids: list) -> list:
+    """Respostas do delegador: chama cada manager em sequência e depois encerra."""
+    responses = [
+        json.dumps({"thought": f"Consultar {manager_id}.", "decision": "call_manager",
+                    "manager_id": manager_id, "new_question": "Responda à pergunta do usuário."})
+        for manager_id in manager_ids
+    ]
+    responses.append(json.dumps({"thought": "Já tenho o necessário.", "decision": "final_answer"}))
+    return responses
+
+
+def build_scenario(name: str, stub_url: str):
+    """Retorna (managers, roteiro do LLM) do cenário, ou None quando ele não pode rodar aqui."""
+    script = copy.deepcopy(DEFAULT_SCRIPT)
+    operations = script["operations"]
+
+    if name == "single_manager":
+        managers = [_api_manager("VENDAS", f"{stub_url}/data/512/5")]
+    elif name == "multi_manager":
+        managers = [_api_manager(m, f"{stub_url}/data/512/5") for m in ("VENDAS", "ESTOQUE", "FINANCEIRO")]
+        operations["delegator"]["responses"] = _delegator_script(["VENDAS", "ESTOQUE", "FINANCEIRO"])
+    elif name == "pending_input":
+        # A ferramenta exige 'cidade' e o LLM não a informa: a tarefa termina pedindo o dado ao usuário.
+        managers = [_api_manager("CLIMA", f"{stub_url}/data/256/5", required_param=True)]
+    elif name == "large_tool_output":
+        # ~200 KB por chamada: exercita o offload para o blob store e prompts grandes.
+        managers = [_api_manager("RELATORIOS", f"{stub_url}/data/200000/5")]
+    elif name == "memory_recall":
+        managers = _memory_scenario_managers()
+        if managers is None:
+            return None
+        operations["react"]["responses"][0] = (
+            '[THOUGHT]: Vou buscar na memória.\n'
+            '[ACTION]: {"tool_name": "searchLongTermMemory", "params": {"query": "decisão sobre o orçamento"}}'
+        )
+    else:
+        raise ValueError(f"Cenário desconhecido: '{name}'")
+    return managers, script
+
+
+def _memory_scenario_managers():
+    """Instala o Qdrant em memória na ferramenta de memória. Sem qdrant_client o cenário é pulado."""
+    try:
+        from tools.plugins.memory_tools import SearchLongTermMemoryTool
+    except ImportError:
+        return None
+    from benchmarks.standins import InMemoryQdrantClient, hash_embedding
+    from services.definitions.system_managers import MEMORY_MANAGER_DEFINITION
+
+    client = InMemoryQdrantClient(latency_ms=2)
+    for i in range(200):
+        summary = f"Conversa {i} sobre orçamento, metas e prazos do projeto {i % 7}."
+        client.upsert(hash_embedding(summary), {
+            "user_id": "bench_user", "summary": summary, "conversation_end": "2024-01-15T10:00:00",
+        })
+    SearchLongTermMemoryTool._qdrant_client = client
+    SearchLongTermMemoryTool._embed_text = lambda self, text: hash_embedding(text)
+    return [MEMORY_MANAGER_DEFINITION]
+
+
+def _payload(task_id: str, session_id: str, webhook_url: str) -> dict:
+    return {
+        "task_id": task_id,
+        "session_id": session_id,
+        "user_id": "bench_user",
+        "user_input": "Qual é a situação atual?",
+        "callback_details": {"webhook_url": webhook_url, "addressing_info": {}},
+    }
+
+
+def _run_actor(tasks: int, concurrency: int, sessions: int, stub: StubHttpServer) -> tuple:
+    """Chama o actor diretamente; cada thread espera a tarefa terminar antes de pegar a próxima."""
+    from worker import process_ai_request
+
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    webhook_url = f"{stub.url}/webhook"
+    failures = 0
+    lock = threading.Lock()
+
+    def run_one(i: int) -> float:
+        nonlocal failures
+        task_id = str(uuid.uuid4())
+        started = time.perf_counter()
+        try:
+            process_ai_request.fn(_payload(task_id, session_ids[i % sessions], webhook_url))
+        except Exception:
+            with lock:
+                failures += 1
+        stub.wait_for_callback(task_id, timeout=5)
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(run_one, range(tasks)))
+    return latencies, failures
+
+
+def _run_api(tasks: int, concurrency: int, sessions: int, stub: StubHttpServer) -> tuple:
+    """POST /api/v1/ask com o worker do Dramatiq consumindo o StubBroker; latência até o webhook chegar."""
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    webhook_url = f"{stub.url}/webhook"
+    failures = 0
+    lock = threading.Lock()
+
+    def run_one(client: TestClient, i: int) -> float:
+        nonlocal failures
+        started = time.perf_counter()
+        response = client.post("/api/v1/ask", json={
+            "user_id": "bench_user",
+            "question": "Qual é a situação atual?",
+            "session_id": session_ids[i % sessions],
+            "webhook_url": webhook_url,
+        })
+        callback = None
+        if response.status_code < 300:
+            callback = stub.wait_for_callback(response.json()["task_id"], timeout=120)
+        if callback is None or callback[1].get("status") != "completed":
+            with lock:
+                failures += 1
+            return (time.perf_counter() - started) * 1000
+        return (callback[0] - started) * 1000
+
+    with TestClient(app) as client:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lambda i: run_one(client, i), range(tasks)))
+    return latencies, failures
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_scenario(name: str, args, stub: StubHttpServer, orchestrator) -> dict:
+    built = build_scenario(name, stub.url)
+    if built is None:
+        return {"skipped": "dependência opcional ausente (qdrant_client)"}
+    managers, script = built
+
+    orchestrator.definition_loader = StaticDefinitionLoader(managers)
+    # O primeiro manager já responde com [FINAL_ANSWER]: com o atalho, os demais não seriam chamados.
+    settings.FINAL_ANSWER_SHORTCUT_ENABLED = name != "multi_manager"
+    runner = _run_api if args.driver == "api" else _run_actor
+
+    # Aquecimento: imports tardios, registro de ferramentas e caches fora da medição.
+    set_llm_backend(ScriptedBackend(script, time_scale=args.llm_latency_scale))
+    runner(min(2, args.tasks), 1, 1, stub)
+
+    backend = ScriptedBackend(script, time_scale=args.llm_latency_scale)
+    set_llm_backend(backend)
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    latencies, failures = runner(args.tasks, args.concurrency, args.sessions, stub)
+    elapsed = time.perf_counter() - started
+    peak_mb = None
+    if args.tracemalloc:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    llm_calls = sum(backend.calls.values())
+    return {
+        "tasks": args.tasks,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "tasks_per_s": round(args.tasks / elapsed, 3),
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordered), 3),
+            "p50": round(_percentile(ordered, 0.50), 3),
+            "p95": round(_percentile(ordered, 0.95), 3),
+            "p99": round(_percentile(ordered, 0.99), 3),
+        },
+        "llm_calls_per_task": round(llm_calls / args.tasks, 3),
+        "llm_calls_by_operation": dict(backend.calls),
+        "tracemalloc_peak_mb": round(peak_mb, 3) if peak_mb is not None else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 3),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare_with_baseline(report: dict, baseline: dict) -> list:
+    """Lista as métricas que pioraram mais que REGRESSION_THRESHOLD em relação ao baseline."""
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or "skipped" in current or "skipped" in previous:
+            continue
+        checks = [("tasks_per_s", current["tasks_per_s"], previous["tasks_per_s"], False)]
+        checks += [(f"latency_ms.{p}", current["latency_ms"][p], previous["latency_ms"][p], True) for p in ("p50", "p95", "p99")]
+        checks.append(("llm_calls_per_task", current["llm_calls_per_task"], previous["llm_calls_per_task"], True))
+        for metric, value, old, higher_is_worse in checks:
+            if not old:
+                continue
+            change = (value - old) / old
+            if (change > REGRESSION_THRESHOLD) if higher_is_worse else (change < -REGRESSION_THRESHOLD):
+                regressions.append({"scenario": name, "metric": metric, "baseline": old, "current": value,
+                                    "change_pct": round(change * 100, 1)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta com dependências simuladas localmente.")
+    parser.add_argument("--scenarios", nargs="+", default=DEFAULT_SCENARIOS, choices=DEFAULT_SCENARIOS)
+    parser.add_argument("--driver", choices=["actor", "api"], default="actor")
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=10, help="Sessões distintas entre as quais as tarefas se repartem.")
+    parser.add_argument("--llm-latency-scale", type=float, default=0.05,
+                        help="Multiplica as latências do roteiro do LLM (1.0 = latências de produção).")
+    parser.add_argument("--mongo-latency-ms", type=float, default=0.5, help="Latência simulada por operação no MongoDB em memória.")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="Desliga o tracemalloc (ele sozinho reduz bastante a vazão).")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: benchmarks/results/e2e_<data>.json).")
+    parser.add_argument("--baseline", help="Resultado anterior para comparação.")
+    args = parser.parse_args()
+
+    mongo_connection.set_client(InMemoryMongoClient(latency_ms=args.mongo_latency_ms))
+    try:
+        import fakeredis
+        from services.cache.redis_connection import redis_connection
+        redis_connection.set_client(fakeredis.FakeRedis())
+        try:
+            redis_connection.get_client().eval("return 1", 0)
+        except Exception:
+            # fakeredis sem suporte a Lua (extra 'lua'): a rota /ask envia direto para process_ai_request
+            settings.SCHEDULER_ENABLED = False
+    except ImportError:
+        # Sem Redis simulado, o histórico quente não é usado: só o MongoDB em memória.
+        settings.CONVERSATION_HOT_TIER_ENABLED = False
+
+    # Todas as tarefas do benchmark são do mesmo usuário: sem limite por usuário no escalonador.
+    settings.SCHEDULER_TIERS = dict(settings.SCHEDULER_TIERS, bench={"priority": "default", "weight": 1, "max_in_flight": 0})
+    settings.SCHEDULER_USER_TIERS = dict(settings.SCHEDULER_USER_TIERS, bench_user="bench")
+    # O benchmark mede a vazão com a fila cheia de propósito: a admissão recusaria o excesso.
+    settings.ADMISSION_ENABLED = False
+    # As sessões só repartem o histórico entre as tarefas; em ordem, as de uma sessão não rodariam juntas.
+    settings.SESSION_ORDERING_ENABLED = False
+
+    from worker import get_orchestrator
+    orchestrator = get_orchestrator()
+    # O worker configura o logging em INFO na importação; um log por passo distorce a medição.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stub = StubHttpServer().start()
+    import dramatiq
+    from worker import broker
+    # No modo actor o worker só consome a fila de webhooks (os callbacks são entregues por ela).
+    queues = None if args.driver == "api" else {settings.WEBHOOK_QUEUE_NAME}
+    dramatiq_worker = dramatiq.Worker(broker, queues=queues, worker_threads=args.concurrency, worker_timeout=100)
+    dramatiq_worker.start()
+    report = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenarios:
+            report["scenarios"][name] = run_scenario(name, args, stub, orchestrator)
+    finally:
+        dramatiq_worker.stop()
+        stub.stop()
+        set_llm_backend(None)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            report["regressions"] = compare_with_baseline(report, json.load(file))
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"e2e_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Resultado gravado em {output}")
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
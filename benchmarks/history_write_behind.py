@@ -0,0 +1,72 @@
+# benchmarks/history_write_behind.py
+"""
+Compara o tempo em que o fluxo de orquestração fica bloqueado ao registrar mensagens
+no conversation_history com gravação síncrona e com write-behind.
+
+Cada tarefa registra duas mensagens (pergunta e resposta), como no Orquestrador.
+
+Uso:
+    python -m benchmarks.history_write_behind --tasks 500
+    python -m benchmarks.history_write_behind --in-memory --latency-ms 2
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+from config import settings
+from services.conversation.conversation_history import conversation_history
+from services.database.mongo_connection import mongo_connection
+
+
+def _run(tasks: int, sessions: int) -> list:
+    """Executa as tarefas e retorna o tempo bloqueado (ms) de cada uma."""
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    per_task_ms = []
+    for i in range(tasks):
+        session_id = session_ids[i % sessions]
+        started = time.perf_counter()
+        conversation_history.log_message(session_id, f"exec_{i}", "user", "bench", "pergunta")
+        # A leitura logo após a escrita precisa enxergar a mensagem mesmo que ainda esteja na fila.
+        conversation_history.get_last_messages(session_id, num_messages=10)
+        conversation_history.log_message(session_id, f"exec_{i}", "system", "orchestrator", "resposta")
+        per_task_ms.append((time.perf_counter() - started) * 1000)
+    return per_task_ms
+
+
+def _summary(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[int(len(ordered) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do write-behind do conversation_history.")
+    parser.add_argument("--tasks", type=int, default=300)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--in-memory", action="store_true", help="Usa um MongoDB em memória (mongomock).")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latência simulada por operação no modo em memória.")
+    args = parser.parse_args()
+
+    if args.in_memory:
+        from benchmarks.standins import InMemoryMongoClient
+        mongo_connection.set_client(InMemoryMongoClient(latency_ms=args.latency_ms))
+
+    report = {}
+    for mode in (False, True):
+        settings.CONVERSATION_WRITE_BEHIND = mode
+        samples = _run(args.tasks, args.sessions)
+        flushed = conversation_history.flush()
+        report["write_behind" if mode else "sync"] = {**_summary(samples), "flushed": flushed}
+
+    report["saved_per_task_ms"] = report["sync"]["mean_ms"] - report["write_behind"]["mean_ms"]
+    report["write_stats"] = conversation_history.get_write_stats()
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# benchmarks/load_generator.py
+"""
+Gerador de carga para POST /api/v1/ask, com um receptor de webhook local que
+correlaciona cada callback pelo task_id.
+
+Para cada tarefa mede:
+    accept_ms      -> tempo de resposta do POST (202)
+    queue_wait_ms  -> enfileiramento na API até o início no worker
+    processing_ms  -> início até o fim do processamento no worker
+    total_ms       -> envio do POST até a chegada do callback
+
+queue_wait e processing vêm dos instantes em 'timings' no callback; comparam relógios
+da API e do worker, então pressupõem máquinas sincronizadas (ou a mesma máquina).
+
+Modos:
+    open   -> dispara --qps requisições por segundo durante --duration segundos,
+              sem esperar as respostas (mede a fila sob taxa de chegada fixa)
+    closed -> --concurrency clientes, cada um envia e espera o callback antes da próxima
+              (--think-time entre elas); cada cliente conversa em sessões próprias
+
+Com --turns > 1 cada sessão recebe várias perguntas em sequência, exercitando
+o histórico de conversa (conversation_history) em sessões multi-turno.
+
+Uso:
+    python -m benchmarks.load_generator --mode open --qps 20 --duration 60
+    python -m benchmarks.load_generator --mode closed --concurrency 8 --turns 5 --requests 400
+    python -m benchmarks.load_generator --webhook-host 0.0.0.0 --webhook-url http://<ip-desta-maquina>:9300/webhook
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.standins import StubHttpServer
+
+DEFAULT_QUESTIONS = [
+    "Qual é a situação atual dos pedidos?",
+    "E do estoque?",
+    "Resuma o que conversamos até agora.",
+]
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.ask_url = args.url.rstrip("/") + "/api/v1/ask"
+        self.webhook = StubHttpServer(args.webhook_host, args.webhook_port).start()
+        self.webhook_url = args.webhook_url or f"{self.webhook.url}/webhook"
+        self.questions = self._load_questions(args.questions_file)
+        self.http = requests.Session()
+        self.http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max(args.concurrency, 32)))
+        self._lock = threading.Lock()
+        self.samples = []
+        self.errors = {"http": 0, "failed": 0, "timeout": 0}
+
+    @staticmethod
+    def _load_questions(path):
+        if not path:
+            return DEFAULT_QUESTIONS
+        with open(path, "r", encoding="utf-8") as file:
+            return [line.strip() for line in file if line.strip()]
+
+    def _submit(self, session_id: str, turn: int):
+        """Envia uma pergunta; retorna (task_id, instante do envio, accept_ms) ou None em erro HTTP."""
+        task_id = str(uuid.uuid4())
+        sent = time.perf_counter()
+        try:
+            response = self.http.post(self.ask_url, timeout=self.args.http_timeout, json={
+                "user_id": self.args.user_id,
+                "question": self.questions[turn % len(self.questions)],
+                "session_id": session_id,
+                "task_id": task_id,
+                "webhook_url": self.webhook_url,
+                "addressing_info": {"load_generator": True, "turn": turn},
+            })
+            response.raise_for_status()
+        except requests.RequestException:
+            with self._lock:
+                self.errors["http"] += 1
+            return None
+        return task_id, sent, (time.perf_counter() - sent) * 1000
+
+    def _collect(self, task_id: str, sent: float, accept_ms: float, timeout: float):
+        callback = self.webhook.wait_for_callback(task_id, timeout=timeout)
+        with self._lock:
+            if callback is None:
+                self.errors["timeout"] += 1
+                return
+            received, payload = callback
+            if payload.get("status") != "completed":
+                self.errors["failed"] += 1
+            sample = {"accept_ms": accept_ms, "total_ms": (received - sent) * 1000}
+            timings = payload.get("timings") or {}
+            if timings.get("enqueued_at") and timings.get("started_at"):
+                sample["queue_wait_ms"] = (timings["started_at"] - timings["enqueued_at"]) * 1000
+            if timings.get("started_at") and timings.get("finished_at"):
+                sample["processing_ms"] = (timings["finished_at"] - timings["started_at"]) * 1000
+            self.samples.append(sample)
+
+    def run_open(self) -> float:
+        """Taxa de chegada fixa: o envio não espera o resultado das tarefas anteriores."""
+        args = self.args
+        total = args.requests or int(args.qps * args.duration)
+        sessions = [str(uuid.uuid4()) for _ in range(args.sessions)]
+        turns = {}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as senders:
+            futures = []
+            for i in range(total):
+                # Agenda cada envio no seu instante, sem acumular atraso dos anteriores
+                delay = started + i / args.qps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                session_id = sessions[i % len(sessions)]
+                turn = turns.get(session_id, 0)
+                turns[session_id] = turn + 1
+                futures.append(senders.submit(self._submit, session_id, turn))
+            pending = [f.result() for f in futures]
+
+        deadline = time.perf_counter() + args.callback_timeout
+        for submitted in pending:
+            if submitted is not None:
+                self._collect(*submitted, timeout=max(0.0, deadline - time.perf_counter()))
+        return time.perf_counter() - started
+
+    def run_closed(self) -> float:
+        """Clientes em laço fechado: cada um conversa em sessões próprias, turno a turno."""
+        args = self.args
+        # Sem --requests, o limite é só a duração
+        total = args.requests or float("inf")
+        counter = itertools.count()
+        stop_at = time.perf_counter() + args.duration if not args.requests else None
+
+        def client():
+            session_id, turn = str(uuid.uuid4()), 0
+            while next(counter) < total and (stop_at is None or time.perf_counter() < stop_at):
+                if turn >= args.turns:
+                    session_id, turn = str(uuid.uuid4()), 0
+                submitted = self._submit(session_id, turn)
+                turn += 1
+                if submitted is not None:
+                    self._collect(*submitted, timeout=args.callback_timeout)
+                if args.think_time:
+                    time.sleep(args.think_time)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+            for _ in range(args.concurrency):
+                clients.submit(client)
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        def summary(key):
+            values = sorted(s[key] for s in self.samples if key in s)
+            if not values:
+                return None
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            return {"p50": round(pick(0.50), 2), "p95": round(pick(0.95), 2), "p99": round(pick(0.99), 2),
+                    "max": round(values[-1], 2), "mean": round(sum(values) / len(values), 2)}
+
+        completed = len(self.samples)
+        return {
+            "mode": self.args.mode,
+            "target_qps": self.args.qps if self.args.mode == "open" else None,
+            "concurrency": self.args.concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "completed": completed,
+            "errors": dict(self.errors),
+            "throughput_per_s": round(completed / elapsed, 3) if elapsed else None,
+            "accept_ms": summary("accept_ms"),
+            "queue_wait_ms": summary("queue_wait_ms"),
+            "processing_ms": summary("processing_ms"),
+            "total_ms": summary("total_ms"),
+        }
+
+    def close(self):
+        self.webhook.stop()
+        self.http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para /api/v1/ask com receptor de webhook local.")
+    parser.add_argument("--url", default="http://localhost:8000", help="Endereço base da API.")
+    parser.add_argument("--mode", choices=["open", "closed"], default="open")
+    parser.add_argument("--qps", type=float, default=5.0, help="Taxa de chegada no modo open.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duração do envio (s).")
+    parser.add_argument("--requests", type=int, help="Total de requisições (substitui qps * duration).")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Clientes no modo closed; threads de envio no modo open.")
+    parser.add_argument("--sessions", type=int, default=50, help="Sessões reutilizadas no modo open.")
+    parser.add_argument("--turns", type=int, default=1, help="Perguntas por sessão no modo closed.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pausa (s) entre turnos no modo closed.")
+    parser.add_argument("--user-id", default="load_test")
+    parser.add_argument("--questions-file", help="Arquivo com uma pergunta por linha (usadas em ordem, por turno).")
+    parser.add_argument("--webhook-host", default="127.0.0.1")
+    parser.add_argument("--webhook-port", type=int, default=9300)
+    parser.add_argument("--webhook-url", help="URL do webhook vista pelo worker (padrão: o receptor local).")
+    parser.add_argument("--http-timeout", type=float, default=10.0)
+    parser.add_argument("--callback-timeout", type=float, default=120.0, help="Espera máxima por um callback (s).")
+    parser.add_argument("--output", help="Grava o relatório em JSON neste arquivo.")
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args)
+    try:
+        elapsed = generator.run_open() if args.mode == "open" else generator.run_closed()
+        report = generator.report(elapsed)
+    finally:
+        generator.close()
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
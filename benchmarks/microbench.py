@@ -0,0 +1,203 @@
+# benchmarks/microbench.py
+"""
+Microbenchmarks das funções executadas a cada passo do fluxo de orquestração,
+com entradas sintéticas que crescem até milhares de ferramentas e históricos longos.
+
+Cada benchmark varia um eixo (tamanho do catálogo, do histórico ou da quantidade de
+parâmetros) e informa o tempo por chamada em cada ponto, o que dá a curva de
+crescimento. O catálogo vem de benchmarks.catalog.generate_catalog.
+
+Uso:
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --catalog-sizes 100 1000 5000 --only deepcopy_context format_tools
+    python -m benchmarks.microbench --output benchmarks/results/micro.json
+"""
+import argparse
+import copy
+import json
+import os
+import timeit
+
+from models.schemas import ApiAuthConfig, ApiConfigSchema, ExecutionContext, ParameterSchema, ToolSchema
+from services.llm.backends import ScriptedBackend, set_llm_backend
+
+from benchmarks.catalog import generate_catalog
+
+# Ferramentas por agente no catálogo sintético (10 por manager, com 2 agentes).
+_TOOLS_PER_AGENT = 5
+_AGENTS_PER_MANAGER = 2
+
+
+def measure(func, min_time: float = 0.2, repeat: int = 5) -> float:
+    """Tempo por chamada em microssegundos (melhor de 'repeat' rodadas de pelo menos 'min_time' s)."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e6
+
+
+def _catalog(tools: int):
+    managers = max(1, tools // (_TOOLS_PER_AGENT * _AGENTS_PER_MANAGER))
+    return generate_catalog(managers, agents_per_manager=_AGENTS_PER_MANAGER, tools_per_agent=_TOOLS_PER_AGENT)
+
+
+def _react_response(sentences: int) -> str:
+    thought = " ".join(f"Passo {i}: analisei o resultado anterior e preciso de mais dados." for i in range(sentences))
+    action = json.dumps({"tool_name": "consultar_pedido_0_0_0", "params": {"pedido_id": "123", "cliente": "ACME"}})
+    return f"[THOUGHT]: {thought}\n[ACTION]: {action}"
+
+
+def _delegator_response(sentences: int) -> str:
+    preface = " ".join(f"Observação {i} sobre o histórico da conversa." for i in range(sentences))
+    decision = {"thought": preface, "decision": "call_manager", "manager_id": "VENDAS_0000",
+                "new_question": "Qual é o saldo do pedido?"}
+    return f"Claro, segue a decisão:\n```json\n{json.dumps(decision, ensure_ascii=False)}\n```\n"
+
+
+def _params_tool(params: int) -> ToolSchema:
+    names = [f"campo_{i}" for i in range(params)]
+    return ToolSchema(
+        tool_name="atualizar_cadastro",
+        description="Atualiza um cadastro.",
+        parameters_mandatory=[ParameterSchema(name=n, type="string", description=n, required=True) for n in names],
+        isApi=True,
+        api_config=ApiConfigSchema(
+            method="POST",
+            base_url="https://api.exemplo.com/cadastro/{campo_0}",
+            auth=ApiAuthConfig(type="bearer", token="token"),
+            headers={"Accept": "application/json"},
+            body_template={n: f"{{{n}}}" for n in names[: params // 2]},
+        ),
+        isLLM=False,
+        isActive=True,
+    )
+
+
+def _previous_results(tools: int) -> dict:
+    results = {}
+    for i in range(tools):
+        results.setdefault(f"AGENT_{i // _TOOLS_PER_AGENT}", {})[f"tool_{i}"] = f"saída da ferramenta {i} " * 10
+    return results
+
+
+def _context(tools: int, history: int) -> ExecutionContext:
+    managers = _catalog(tools)
+    context = ExecutionContext(
+        session_id="sessao",
+        user_id="bench_user",
+        user_question="Qual é o saldo do pedido 123?",
+        previous_results=_previous_results(min(tools, 50)),
+        react_history=[f"[OBSERVATION]: resultado do passo {i} " + "x" * 200 for i in range(history)],
+        execution_id="exec_00000000",
+        user_data={"user_id": "bench_user"},
+        available_managers=managers,
+    )
+    # Como em Orchestrator.get_manager_agent: os agentes entram como dicionário, por atribuição.
+    context.available_agents = {agent.agent_id: agent for manager in managers for agent in manager.agents}
+    return context
+
+
+def build_benchmarks(adapter, manager_executor, api_tool, orchestrator) -> dict:
+    """Nome -> (eixo, função que recebe o tamanho e devolve o chamável medido)."""
+
+    def simplified_manager_list(size):
+        catalog = _catalog(size)
+        return lambda: adapter._create_simplified_manager_list(catalog)
+
+    def format_tools(size):
+        manager = generate_catalog(1, agents_per_manager=max(1, size // 50), tools_per_agent=min(size, 50))[0]
+        return lambda: adapter._format_tools(manager)
+
+    def parse_react_response(size):
+        response = _react_response(size)
+        return lambda: adapter._parse_react_response(response)
+
+    def parse_json_response(size):
+        response = _delegator_response(size)
+        return lambda: adapter.parse_json_response(response)
+
+    def parse_action_json(size):
+        action = json.dumps({"tool_name": "atualizar_cadastro", "params": {f"campo_{i}": f"valor {i}" for i in range(size)}})
+        return lambda: manager_executor._parse_action_json(action)
+
+    def parse_params(size):
+        params_str = ", ".join(f'campo_{i}="valor {i}"' for i in range(size))
+        return lambda: manager_executor._parse_params(params_str)
+
+    def prepare_request_data(size):
+        tool = _params_tool(size)
+        params = {f"campo_{i}": f"valor {i}" for i in range(size)}
+        return lambda: api_tool._prepare_request_data(tool.api_config, params, tool)
+
+    def consolidate_results(size):
+        source = _previous_results(size)
+        return lambda: orchestrator._consolidate_results({}, source)
+
+    def deepcopy_context(size):
+        # Mesma cópia feita em Orchestrator._execute_single_manager a cada manager chamado.
+        context = _context(size, history=20)
+        return lambda: copy.deepcopy(context)
+
+    def deepcopy_context_history(size):
+        context = _context(100, history=size)
+        return lambda: copy.deepcopy(context)
+
+    return {
+        "simplified_manager_list": ("tools", simplified_manager_list),
+        "format_tools": ("tools", format_tools),
+        "consolidate_results": ("tools", consolidate_results),
+        "deepcopy_context": ("tools", deepcopy_context),
+        "deepcopy_context_history": ("history", deepcopy_context_history),
+        "parse_react_response": ("history", parse_react_response),
+        "parse_json_response": ("history", parse_json_response),
+        "parse_action_json": ("params", parse_action_json),
+        "parse_params": ("params", parse_params),
+        "prepare_request_data": ("params", prepare_request_data),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks das funções do fluxo de orquestração.")
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[10, 100, 1000, 5000],
+                        help="Quantidade total de ferramentas no catálogo.")
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Tamanho do histórico / quantidade de frases na resposta do LLM.")
+    parser.add_argument("--param-sizes", type=int, nargs="+", default=[2, 10, 100])
+    parser.add_argument("--only", nargs="+", help="Executa apenas estes benchmarks.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Tempo mínimo (s) de cada rodada de medição.")
+    parser.add_argument("--output", help="Grava o resultado em JSON neste arquivo.")
+    args = parser.parse_args()
+
+    # Nada aqui chama o LLM; o backend simulado só evita configurar o SDK do Gemini.
+    set_llm_backend(ScriptedBackend())
+    from services.orchestration.orchestrator import Orchestrator
+    from tools.plugins.api_tool import ApiTool
+    orchestrator = Orchestrator()
+
+    benchmarks = build_benchmarks(orchestrator.gemini, orchestrator.manager_executor, ApiTool({}), orchestrator)
+    axes = {"tools": args.catalog_sizes, "history": args.history_sizes, "params": args.param_sizes}
+
+    report = {}
+    for name, (axis, factory) in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        points = []
+        for size in axes[axis]:
+            us_per_call = measure(factory(size), min_time=args.min_time)
+            points.append({"size": size, "us_per_call": round(us_per_call, 3)})
+            print(f"{name:<26} {axis}={size:<6} {us_per_call:>12.2f} us")
+        report[name] = {"axis": axis, "points": points}
+
+    set_llm_backend(None)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# benchmarks/standins.py
+"""
+Substitutos locais das dependências externas usados pelos benchmarks.
+Nenhum deles é usado em produção.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _LatencyCollection:
+    """Envolve uma coleção do mongomock e adiciona uma latência fixa por operação (simula o round-trip)."""
+
+    _SLOW_METHODS = {
+        "insert_one", "insert_many", "find", "find_one", "aggregate", "update_one", "update_many",
+        "delete_many", "bulk_write", "create_index", "count_documents", "replace_one",
+    }
+
+    def __init__(self, collection, latency_ms: float):
+        self._collection = collection
+        self._latency = latency_ms / 1000
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in self._SLOW_METHODS and self._latency:
+            def slowed(*args, **kwargs):
+                time.sleep(self._latency)
+                return attr(*args, **kwargs)
+            return slowed
+        return attr
+
+
+class _LatencyDatabase:
+    def __init__(self, database, latency_ms: float):
+        self._database = database
+        self._latency_ms = latency_ms
+
+    def __getitem__(self, name):
+        return _LatencyCollection(self._database[name], self._latency_ms)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name, **kwargs):
+        return self[name]
+
+
+class InMemoryMongoClient:
+    """
+    Cliente MongoDB em memória (mongomock) com latência opcional por operação.
+    Pode ser injetado com mongo_connection.set_client(InMemoryMongoClient()).
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        try:
+            import mongomock
+        except ImportError as e:
+            raise RuntimeError("Instale 'mongomock' para usar o MongoDB em memória nos benchmarks.") from e
+        self._client = mongomock.MongoClient()
+        self._latency_ms = latency_ms
+
+    def get_database(self, name, **kwargs):
+        # Read preference e write concern não se aplicam ao banco em memória.
+        return _LatencyDatabase(self._client[name], self._latency_ms)
+
+    def __getitem__(self, name):
+        return self.get_database(name)
+
+    def close(self):
+        self._client.close()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    GET  /data/<bytes>[/<latency_ms>]  -> JSON com aproximadamente <bytes> bytes (alvo do ApiTool)
+    POST /webhook                      -> registra o callback da tarefa
+    """
+
+    def do_GET(self):
+        parts = [p for p in self.path.split("?", 1)[0].split("/") if p]
+        if not parts or parts[0] != "data":
+            self.send_error(404)
+            return
+        size = int(parts[1]) if len(parts) > 1 else 256
+        latency_ms = float(parts[2]) if len(parts) > 2 else 0.0
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        row = {"id": 0, "descricao": "x" * 40, "valor": 12.5}
+        rows = [dict(row, id=i) for i in range(max(1, size // 80))]
+        body = json.dumps({"items": rows}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.startswith("/webhook"):
+            # Lotes de callbacks (WEBHOOK_BATCH_MAX_SIZE > 1) chegam em {"callbacks": [...]}
+            for callback in payload.get("callbacks", [payload]):
+                self.server.record_callback(callback)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHttpServer(ThreadingHTTPServer):
+    """Servidor HTTP local que faz o papel das APIs chamadas pelo ApiTool e do receptor de webhooks."""
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _StubHandler)
+        self._callbacks = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubHttpServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-http", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def record_callback(self, payload: dict):
+        with self._condition:
+            self._callbacks[payload.get("task_id")] = (time.perf_counter(), payload)
+            self._condition.notify_all()
+
+    def wait_for_callback(self, task_id: str, timeout: float = 60.0):
+        """Bloqueia até o webhook da tarefa chegar. Retorna (instante perf_counter, payload) ou None."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while task_id not in self._callbacks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return self._callbacks.pop(task_id)
+
+
+class StaticDefinitionLoader:
+    """
+    Substitui o definition_loader com um catálogo fixo. O mongomock não implementa o
+    $lookup com 'pipeline' usado pelo loader real.
+    """
+
+    def __init__(self, managers: list):
+        self.managers = managers
+        self.agents = {agent.agent_id: agent for manager in managers for agent in manager.agents}
+
+    def load_definitions_for_user(self, user_id: str):
+        return list(self.managers), dict(self.agents)
+
+
+class _QdrantHit:
+    def __init__(self, score: float, payload: dict):
+        self.score = score
+        self.payload = payload
+
+
+class InMemoryQdrantClient:
+    """Qdrant em memória com o mesmo 'search' usado pelo SearchLongTermMemoryTool (similaridade por cosseno)."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self._points = []
+        self._latency = latency_ms / 1000
+
+    def upsert(self, vector: list, payload: dict):
+        self._points.append((vector, payload))
+
+    def search(self, collection_name: str, query_vector: list, query_filter=None, limit: int = 3):
+        if self._latency:
+            time.sleep(self._latency)
+        user_ids = set()
+        for condition in getattr(query_filter, "must", None) or []:
+            user_ids.add(condition.match.value)
+
+        def cosine(a, b):
+            dot = sum(x * y for x, y in zip(a, b))
+            norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+            return dot / norm if norm else 0.0
+
+        hits = [
+            _QdrantHit(cosine(query_vector, vector), payload)
+            for vector, payload in self._points
+            if not user_ids or payload.get("user_id") in user_ids
+        ]
+        return sorted(hits, key=lambda hit: hit.score, reverse=True)[:limit]
+
+
+def hash_embedding(text: str, dims: int = 64) -> list:
+    """Embedding determinístico (sem rede) para o Qdrant em memória."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i % len(digest)] - 128) / 128 for i in range(dims)]
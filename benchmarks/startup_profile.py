@@ -0,0 +1,132 @@
+# benchmarks/startup_profile.py
+"""
+Mede o custo de inicialização (tempo de import, memória residente, módulos
+carregados e clientes do MongoDB abertos) dos processos da API e do worker.
+
+Cada alvo é importado em um subprocesso limpo para que um não contamine o outro.
+
+Uso:
+    python -m benchmarks.startup_profile
+    python -m benchmarks.startup_profile --targets main worker tools --repeat 5 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_TARGETS = ["tools", "main", "worker"]
+
+# Script executado no subprocesso. Mantido como string para que o processo filho
+# não importe nada além do estritamente necessário antes da medição.
+_PROBE = r"""
+import gc, importlib, json, sys, time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+target = sys.argv[1]
+modules_before = len(sys.modules)
+rss_before = rss_kb()
+start = time.perf_counter()
+error = None
+try:
+    importlib.import_module(target)
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+elapsed_ms = (time.perf_counter() - start) * 1000
+rss_after = rss_kb()
+
+mongo_clients = 0
+if "pymongo" in sys.modules:
+    # Contagem feita após o import para não distorcer o tempo medido.
+    mongo_client_cls = sys.modules["pymongo"].MongoClient
+    mongo_clients = sum(1 for obj in gc.get_objects() if isinstance(obj, mongo_client_cls))
+
+print("__PROBE__" + json.dumps({
+    "import_ms": elapsed_ms,
+    "rss_kb": rss_after,
+    "rss_delta_kb": (rss_after - rss_before) if rss_after and rss_before else None,
+    "modules_loaded": len(sys.modules) - modules_before,
+    "mongo_clients": mongo_clients,
+    "error": error,
+}))
+"""
+
+
+def _probe(target: str, env: dict) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE, target],
+        capture_output=True, text=True, env=env, cwd=os.getcwd()
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("__PROBE__"):
+            return json.loads(line[len("__PROBE__"):])
+    return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "sem saída"}
+
+
+def profile_targets(targets: list, repeat: int) -> dict:
+    env = os.environ.copy()
+    # Valores fictícios apenas para que o Settings seja instanciável sem um .env
+    env.setdefault("GEMINI_API_KEY", "startup-profile")
+    env.setdefault("QDRANT_URL", "localhost")
+
+    report = {}
+    for target in targets:
+        runs = [_probe(target, env) for _ in range(repeat)]
+        ok_runs = [r for r in runs if not r.get("error")]
+        if not ok_runs:
+            report[target] = {"error": runs[-1].get("error")}
+            continue
+        report[target] = {
+            "import_ms_median": statistics.median(r["import_ms"] for r in ok_runs),
+            "rss_kb_median": statistics.median(r["rss_kb"] for r in ok_runs if r["rss_kb"] is not None),
+            "rss_delta_kb_median": statistics.median(r["rss_delta_kb"] for r in ok_runs if r["rss_delta_kb"] is not None),
+            "modules_loaded": ok_runs[-1]["modules_loaded"],
+            "mongo_clients": ok_runs[-1]["mongo_clients"],
+            "runs": len(ok_runs),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o custo de inicialização dos processos.")
+    parser.add_argument("--targets", nargs="+", default=DEFAULT_TARGETS, help="Módulos a importar.")
+    parser.add_argument("--repeat", type=int, default=3, help="Número de execuções por alvo.")
+    parser.add_argument("--json", action="store_true", help="Imprime o relatório em JSON.")
+    args = parser.parse_args()
+
+    report = profile_targets(args.targets, args.repeat)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for target, data in report.items():
+        if "error" in data:
+            print(f"{target:<10} ERRO: {data['error']}")
+            continue
+        print(
+            f"{target:<10} import={data['import_ms_median']:.1f}ms "
+            f"rss={data['rss_kb_median'] / 1024:.1f}MB "
+            f"(+{data['rss_delta_kb_median'] / 1024:.1f}MB) "
+            f"módulos={data['modules_loaded']} "
+            f"mongo_clients={data['mongo_clients']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
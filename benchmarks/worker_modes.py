@@ -0,0 +1,240 @@
+# benchmarks/worker_modes.py
+"""
+Compara o worker padrão do Dramatiq (uma thread por mensagem, worker.py) com o worker
+assíncrono (async_worker.py) no mesmo cenário do benchmark de ponta a ponta: LLM
+roteirizado, MongoDB e Redis em memória, StubBroker e servidor HTTP local.
+
+Para cada modo e nível de concorrência (threads do worker padrão, --max-in-flight do
+assíncrono) envia --tasks mensagens de uma vez e mede tarefas/s, latência até o
+webhook, pico de threads e memória por tarefa em voo (crescimento do RSS, e do
+tracemalloc quando ligado, dividido pela concorrência).
+
+Cada medição roda num subprocesso, para que RSS e threads de uma não contaminem a outra.
+
+Uso:
+    python -m benchmarks.worker_modes
+    python -m benchmarks.worker_modes --concurrency 8 64 256 --tasks 500 --llm-latency-scale 0.5
+"""
+import os
+
+# O broker é escolhido na importação do worker: precisa estar definido antes dela.
+os.environ.setdefault("DRAMATIQ_BROKER", "stub")
+
+import argparse
+import json
+import logging
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from config import settings
+from services.database.mongo_connection import mongo_connection
+from services.llm.backends import ScriptedBackend, set_llm_backend
+
+from benchmarks.e2e_throughput import _payload, _percentile, build_scenario
+from benchmarks.standins import InMemoryMongoClient, StaticDefinitionLoader, StubHttpServer
+
+MODES = ["threaded", "async"]
+
+
+def _rss_mb() -> float:
+    """RSS atual do processo (Linux); fora dele, o máximo até agora."""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Sampler(threading.Thread):
+    """Amostra RSS e quantidade de threads durante a medição."""
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self.peak_threads = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_rss_mb = max(self.peak_rss_mb, _rss_mb())
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _start_worker(mode: str, concurrency: int, blocking_threads: int) -> list:
+    import dramatiq
+    from worker import broker, process_ai_request
+    if mode == "async":
+        from async_worker import AsyncWorker
+        # Como em produção: o limite em voo inteiro para a fila das orquestrações; os
+        # callbacks ficam com um worker de threads à parte
+        workers = [
+            AsyncWorker(broker, queues={process_ai_request.queue_name}, max_in_flight=concurrency,
+                        blocking_threads=blocking_threads, worker_timeout=100),
+            dramatiq.Worker(broker, queues={settings.WEBHOOK_QUEUE_NAME}, worker_threads=4, worker_timeout=100),
+        ]
+    else:
+        workers = [dramatiq.Worker(broker, worker_threads=concurrency, worker_timeout=100)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def _send_and_wait(tasks: int, sessions: int, stub: StubHttpServer) -> tuple:
+    """Envia todas as tarefas de uma vez; retorna (latências em ms, falhas)."""
+    from worker import process_ai_request
+
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    webhook_url = f"{stub.url}/webhook"
+    sent = {}
+    for i in range(tasks):
+        task_id = str(uuid.uuid4())
+        sent[task_id] = time.perf_counter()
+        process_ai_request.send(_payload(task_id, session_ids[i % sessions], webhook_url))
+
+    latencies, failures = [], 0
+    for task_id, started in sent.items():
+        callback = stub.wait_for_callback(task_id, timeout=300)
+        if callback is None or callback[1].get("status") != "completed":
+            failures += 1
+            continue
+        latencies.append((callback[0] - started) * 1000)
+    return latencies, failures
+
+
+def run_child(args) -> dict:
+    """Uma medição (modo, concorrência) neste processo."""
+    mongo_connection.set_client(InMemoryMongoClient(latency_ms=args.mongo_latency_ms))
+    try:
+        import fakeredis
+        from services.cache.redis_connection import redis_connection
+        redis_connection.set_client(fakeredis.FakeRedis(decode_responses=True))
+    except ImportError:
+        settings.CONVERSATION_HOT_TIER_ENABLED = False
+
+    from worker import get_orchestrator
+    orchestrator = get_orchestrator()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stub = StubHttpServer().start()
+    managers, script = build_scenario(args.scenario, stub.url)
+    orchestrator.definition_loader = StaticDefinitionLoader(managers)
+    # Como no e2e_throughput: no cenário com vários managers o atalho encerraria no primeiro.
+    settings.FINAL_ANSWER_SHORTCUT_ENABLED = args.scenario != "multi_manager"
+    set_llm_backend(ScriptedBackend(script, time_scale=args.llm_latency_scale))
+
+    workers = _start_worker(args.mode, args.concurrency_level, args.blocking_threads)
+    try:
+        # Aquecimento: imports tardios, registro de ferramentas e caches fora da medição.
+        _send_and_wait(min(args.concurrency_level, 4), 1, stub)
+        backend = ScriptedBackend(script, time_scale=args.llm_latency_scale)
+        set_llm_backend(backend)
+
+        idle_rss = _rss_mb()
+        if args.tracemalloc:
+            tracemalloc.start()
+        sampler = _Sampler()
+        sampler.start()
+        started = time.perf_counter()
+        latencies, failures = _send_and_wait(args.tasks, args.sessions, stub)
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        traced_peak_mb = None
+        if args.tracemalloc:
+            traced_peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+    finally:
+        for worker in workers:
+            worker.stop()
+        stub.stop()
+
+    # Com menos tarefas que a concorrência, só 'tasks' ficam em voo.
+    in_flight = min(args.concurrency_level, args.tasks)
+    ordered = sorted(latencies) or [0.0]
+    return {
+        "mode": args.mode,
+        "concurrency": args.concurrency_level,
+        "tasks": args.tasks,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "tasks_per_s": round(args.tasks / elapsed, 3),
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordered), 3),
+            "p50": round(_percentile(ordered, 0.50), 3),
+            "p95": round(_percentile(ordered, 0.95), 3),
+            "p99": round(_percentile(ordered, 0.99), 3),
+        },
+        "peak_threads": sampler.peak_threads,
+        "rss_idle_mb": round(idle_rss, 3),
+        "rss_peak_mb": round(sampler.peak_rss_mb, 3),
+        "rss_mb_per_in_flight": round(max(0.0, sampler.peak_rss_mb - idle_rss) / in_flight, 4),
+        "traced_kb_per_in_flight": round(traced_peak_mb * 1024 / in_flight, 3) if traced_peak_mb is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker padrão (threads) vs. worker assíncrono.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64, 256],
+                        help="Threads do worker padrão / tarefas em voo do assíncrono.")
+    parser.add_argument("--blocking-threads", type=int, default=settings.ASYNC_WORKER_BLOCKING_THREADS,
+                        help="Pool de threads do worker assíncrono para as chamadas bloqueantes.")
+    parser.add_argument("--tasks", type=int, default=300)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--scenario", default="single_manager")
+    parser.add_argument("--llm-latency-scale", type=float, default=0.2,
+                        help="Multiplica as latências do roteiro do LLM (1.0 = latências de produção).")
+    parser.add_argument("--mongo-latency-ms", type=float, default=0.5)
+    parser.add_argument("--tracemalloc", action="store_true", help="Mede também a memória alocada em Python (mais lento).")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: benchmarks/results/worker_modes_<data>.json).")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--concurrency-level", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    results = []
+    for concurrency in args.concurrency:
+        for mode in args.modes:
+            command = [sys.executable, "-m", "benchmarks.worker_modes", "--child", "--mode", mode,
+                       "--concurrency-level", str(concurrency), "--blocking-threads", str(args.blocking_threads),
+                       "--tasks", str(args.tasks), "--sessions", str(args.sessions), "--scenario", args.scenario,
+                       "--llm-latency-scale", str(args.llm_latency_scale), "--mongo-latency-ms", str(args.mongo_latency_ms)]
+            if args.tracemalloc:
+                command.append("--tracemalloc")
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stderr[-2000:], file=sys.stderr)
+                raise SystemExit(f"Falha na medição {mode} com concorrência {concurrency}.")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{mode:<9} concorrência={concurrency:<5} {result['tasks_per_s']:>9.2f} tarefas/s  "
+                  f"p95={result['latency_ms']['p95']:>9.1f} ms  threads={result['peak_threads']:<5} "
+                  f"RSS/tarefa={result['rss_mb_per_in_flight'] * 1024:>8.1f} KB  falhas={result['failures']}")
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"worker_modes_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({"args": vars(args), "results": results}, file, indent=2)
+    print(f"Resultado gravado em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 # config.py
+import json
 import os
 from pydantic_settings import BaseSettings
 
@@ -6,11 +7,116 @@ class Settings(BaseSettings):
     # LLM GEMINI
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
     GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-preview-05-20")
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "gemini")  # gemini | scripted | record | replay
+    LLM_SCRIPT_PATH: str = os.getenv("LLM_SCRIPT_PATH", "")  # roteiro JSON do backend 'scripted' (vazio = padrão)
+    LLM_LATENCY_SCALE: float = float(os.getenv("LLM_LATENCY_SCALE", 1.0))  # multiplica as latências simuladas
+    LLM_RECORDINGS_PATH: str = os.getenv("LLM_RECORDINGS_PATH", "recordings/llm.jsonl")
+    LLM_REPLAY_LATENCY: bool = os.getenv("LLM_REPLAY_LATENCY", "False") == "True"  # reproduz a latência gravada
     
     # MONGODB
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     MONGO_DB: str = os.getenv("MONGO_DB", "ai_agents")
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 0))  # 0 = sem limite
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))  # 0 = espera indefinida
+    MONGO_DEFINITIONS_READ_PREFERENCE: str = os.getenv("MONGO_DEFINITIONS_READ_PREFERENCE", "secondaryPreferred")
+    MONGO_LOGS_WRITE_CONCERN: str = os.getenv("MONGO_LOGS_WRITE_CONCERN", "1")
+    MONGO_HISTORY_WRITE_CONCERN: str = os.getenv("MONGO_HISTORY_WRITE_CONCERN", "")  # vazio = padrão do servidor
+
+    # REDIS
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    DRAMATIQ_BROKER: str = os.getenv("DRAMATIQ_BROKER", "redis")  # redis | stub (em memória)
+    REDIS_SOCKET_TIMEOUT_MS: int = int(os.getenv("REDIS_SOCKET_TIMEOUT_MS", 2000))
+
+    # WORKER ASSÍNCRONO (python -m async_worker)
+    ASYNC_WORKER_MAX_IN_FLIGHT: int = int(os.getenv("ASYNC_WORKER_MAX_IN_FLIGHT", 100))  # tarefas simultâneas por processo
+    ASYNC_WORKER_BLOCKING_THREADS: int = int(os.getenv("ASYNC_WORKER_BLOCKING_THREADS", 64))  # LLM, ferramentas, MongoDB
+
+    # ESCALONAMENTO (filas por prioridade e fair share entre usuários)
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "True") == "True"
+    SCHEDULER_QUEUE_PREFIX: str = os.getenv("SCHEDULER_QUEUE_PREFIX", "ai_")  # filas ai_high, ai_default, ai_low
+    SCHEDULER_KEY_PREFIX: str = os.getenv("SCHEDULER_KEY_PREFIX", "sched:")
+    # Tier -> prioridade, peso no round-robin e limite de tarefas em voo por usuário (0 = sem limite)
+    SCHEDULER_TIERS: dict = json.loads(os.getenv(
+        "SCHEDULER_TIERS",
+        '{"default": {"priority": "default", "weight": 1, "max_in_flight": 4},'
+        ' "premium": {"priority": "high", "weight": 3, "max_in_flight": 10}}'
+    ))
+    SCHEDULER_USER_TIERS: dict = json.loads(os.getenv("SCHEDULER_USER_TIERS", "{}"))  # user_id -> tier
+    SCHEDULER_DEFAULT_TIER: str = os.getenv("SCHEDULER_DEFAULT_TIER", "default")
+    SCHEDULER_ALLOW_PRIORITY_HINT: bool = os.getenv("SCHEDULER_ALLOW_PRIORITY_HINT", "True") == "True"
+    SCHEDULER_DEFER_MS: int = int(os.getenv("SCHEDULER_DEFER_MS", 500))  # espera do ticket sem tarefa elegível
+    SCHEDULER_CLAIM_TTL_SECONDS: int = int(os.getenv("SCHEDULER_CLAIM_TTL_SECONDS", 900))  # > time_limit da tarefa
+
+    # ADMISSÃO (429 com Retry-After na rota /ask quando o sistema está sobrecarregado; 0 = sem limite)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "True") == "True"
+    ADMISSION_MAX_QUEUE_DEPTH: int = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", 2000))  # mensagens à frente da tarefa
+    ADMISSION_MAX_ESTIMATED_WAIT_SECONDS: float = float(os.getenv("ADMISSION_MAX_ESTIMATED_WAIT_SECONDS", 120))
+    ADMISSION_MAX_USER_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_USER_IN_FLIGHT", 50))  # aceitas e não terminadas
+    ADMISSION_RATE_WINDOW_SECONDS: int = int(os.getenv("ADMISSION_RATE_WINDOW_SECONDS", 60))  # janela da taxa de processamento
+    ADMISSION_CACHE_MS: int = int(os.getenv("ADMISSION_CACHE_MS", 500))  # cache da profundidade e da taxa na API
+    ADMISSION_RETRY_AFTER_SECONDS: int = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 5))  # quando não há taxa para estimar
+    ADMISSION_TASK_TTL_SECONDS: int = int(os.getenv("ADMISSION_TASK_TTL_SECONDS", 900))  # validade da vaga de uma tarefa perdida
+    ADMISSION_KEY_PREFIX: str = os.getenv("ADMISSION_KEY_PREFIX", "admission:")
+
+    # IDEMPOTÊNCIA E ORDEM POR SESSÃO
+    IDEMPOTENCY_ENABLED: bool = os.getenv("IDEMPOTENCY_ENABLED", "True") == "True"
+    IDEMPOTENCY_KEY_PREFIX: str = os.getenv("IDEMPOTENCY_KEY_PREFIX", "idem:")
+    IDEMPOTENCY_LEASE_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_LEASE_TTL_SECONDS", 900))  # > time_limit da tarefa
+    SESSION_ORDERING_ENABLED: bool = os.getenv("SESSION_ORDERING_ENABLED", "True") == "True"
+    SESSION_ORDERING_DEFER_MS: int = int(os.getenv("SESSION_ORDERING_DEFER_MS", 250))  # espera da tarefa atrás de outra da sessão
+
+    # ROTEAMENTO RÁPIDO (manager escolhido sem o LLM delegador quando a pergunta é óbvia)
+    FAST_PATH_ROUTER_ENABLED: bool = os.getenv("FAST_PATH_ROUTER_ENABLED", "True") == "True"
+    FAST_PATH_MIN_CONFIDENCE: float = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", 0.75))  # fração da pergunta coberta
+    FAST_PATH_MIN_MARGIN: float = float(os.getenv("FAST_PATH_MIN_MARGIN", 0.35))  # folga sobre o segundo manager
+    FAST_PATH_LOG_CANDIDATES: int = int(os.getenv("FAST_PATH_LOG_CANDIDATES", 3))  # candidatos registrados por decisão
+    # Poda do catálogo no prompt do delegador (mesmo índice do roteador rápido)
+    CATALOG_PRUNING_ENABLED: bool = os.getenv("CATALOG_PRUNING_ENABLED", "True") == "True"
+    CATALOG_PRUNING_TOP_K: int = int(os.getenv("CATALOG_PRUNING_TOP_K", 10))  # managers mais relevantes no prompt
+    CATALOG_PRUNING_MIN_MANAGERS: int = int(os.getenv("CATALOG_PRUNING_MIN_MANAGERS", 20))  # catálogos menores vão inteiros
+    CATALOG_PRUNING_MIN_CONFIDENCE: float = float(os.getenv("CATALOG_PRUNING_MIN_CONFIDENCE", 0.9))  # cobertura da pergunta
+    CATALOG_PRUNING_HISTORY_MESSAGES: int = int(os.getenv("CATALOG_PRUNING_HISTORY_MESSAGES", 2))  # mensagens do usuário na consulta
+    CATALOG_INDEX_CACHE_SIZE: int = int(os.getenv("CATALOG_INDEX_CACHE_SIZE", 256))  # versões de catálogo indexadas
+    CATALOG_INDEX_CACHE_TTL_SECONDS: int = int(os.getenv("CATALOG_INDEX_CACHE_TTL_SECONDS", 3600))
+
+    # ATALHO DA RESPOSTA FINAL (resposta do único manager sem novo ciclo do delegador e sem consolidação)
+    FINAL_ANSWER_SHORTCUT_ENABLED: bool = os.getenv("FINAL_ANSWER_SHORTCUT_ENABLED", "True") == "True"
+    FINAL_ANSWER_SHORTCUT_MAX_CHARS: int = int(os.getenv("FINAL_ANSWER_SHORTCUT_MAX_CHARS", 4000))  # maiores passam pela consolidação
+
+    # LOG DE EXECUÇÃO
+    EXECUTION_EVENTS_BATCH_SIZE: int = int(os.getenv("EXECUTION_EVENTS_BATCH_SIZE", 20))
+    EXECUTION_BLOB_THRESHOLD_BYTES: int = int(os.getenv("EXECUTION_BLOB_THRESHOLD_BYTES", 4096))
+    EXECUTION_BLOB_ZSTD_LEVEL: int = int(os.getenv("EXECUTION_BLOB_ZSTD_LEVEL", 3))
+
+    # HISTÓRICO DE CONVERSA (camada quente no Redis)
+    CONVERSATION_HOT_TIER_ENABLED: bool = os.getenv("CONVERSATION_HOT_TIER_ENABLED", "True") == "True"
+    CONVERSATION_HOT_TIER_SIZE: int = int(os.getenv("CONVERSATION_HOT_TIER_SIZE", 20))
+    CONVERSATION_HOT_TIER_TTL_SECONDS: int = int(os.getenv("CONVERSATION_HOT_TIER_TTL_SECONDS", 86400))
+    SESSION_CACHE_MAX_SIZE: int = int(os.getenv("SESSION_CACHE_MAX_SIZE", 1000))
+    SESSION_CACHE_TTL_SECONDS: int = int(os.getenv("SESSION_CACHE_TTL_SECONDS", 300))
+
+    # HISTÓRICO DE CONVERSA (write-behind)
+    CONVERSATION_WRITE_BEHIND: bool = os.getenv("CONVERSATION_WRITE_BEHIND", "False") == "True"
+    CONVERSATION_FLUSH_BATCH_SIZE: int = int(os.getenv("CONVERSATION_FLUSH_BATCH_SIZE", 100))
+    CONVERSATION_FLUSH_INTERVAL_MS: int = int(os.getenv("CONVERSATION_FLUSH_INTERVAL_MS", 200))
+    CONVERSATION_MAX_PENDING: int = int(os.getenv("CONVERSATION_MAX_PENDING", 10000))
     
+    # MÉTRICAS
+    WORKER_METRICS_PORT: int = int(os.getenv("WORKER_METRICS_PORT", 9191))  # 0 = desativado
+    WORKER_METRICS_PORT_ATTEMPTS: int = int(os.getenv("WORKER_METRICS_PORT_ATTEMPTS", 16))  # um por processo worker
+
+    # TRACING
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "False") == "True"
+    TRACING_SAMPLE_RATE: float = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))
+    TRACING_EXPORT_PATH: str = os.getenv("TRACING_EXPORT_PATH", "traces/spans-{pid}.jsonl")  # {pid} = processo
+    TRACING_EXPORT_BATCH_SIZE: int = int(os.getenv("TRACING_EXPORT_BATCH_SIZE", 256))
+
+    # PROFILING
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", 0.0))  # fração das tarefas; 'profile' no payload força
+    PROFILING_INTERVAL_MS: int = int(os.getenv("PROFILING_INTERVAL_MS", 10))
+
     # RAG
     RAG_BASE_URL: str = os.getenv("RAG_BASE_URL", "http://localhost:3333")
     RAG_API_TOKEN: str = os.getenv("RAG_API_TOKEN", "")
@@ -23,6 +129,31 @@ class Settings(BaseSettings):
     APP_NAME: str = "IA Agent Orchestrator"
     DEBUG: bool = os.getenv("DEBUG", "True") == "True"
 
+    # ESTADO DAS TAREFAS (Redis com TTL; estados finais também no MongoDB)
+    TASK_STATUS_KEY_PREFIX: str = os.getenv("TASK_STATUS_KEY_PREFIX", "task_status:")
+    TASK_STATUS_TTL_SECONDS: int = int(os.getenv("TASK_STATUS_TTL_SECONDS", 86400))
+    TASK_STATUS_BATCH_MAX: int = int(os.getenv("TASK_STATUS_BATCH_MAX", 500))
+
+    # LOTES (POST /api/v1/ask/batch)
+    ASK_BATCH_MAX: int = int(os.getenv("ASK_BATCH_MAX", 500))  # perguntas por requisição
+    TASK_BATCH_KEY_PREFIX: str = os.getenv("TASK_BATCH_KEY_PREFIX", "task_batch:")
+
+    # RESPOSTA SÍNCRONA E STREAMING (eventos da tarefa via pub/sub do Redis)
+    TASK_EVENTS_CHANNEL_PREFIX: str = os.getenv("TASK_EVENTS_CHANNEL_PREFIX", "task_events:")
+    ASK_WAIT_MAX_SECONDS: float = float(os.getenv("ASK_WAIT_MAX_SECONDS", 30))  # teto de 'wait_timeout_seconds'
+    ASK_STREAM_TIMEOUT_SECONDS: float = float(os.getenv("ASK_STREAM_TIMEOUT_SECONDS", 300))
+    ASK_STREAM_KEEPALIVE_SECONDS: float = float(os.getenv("ASK_STREAM_KEEPALIVE_SECONDS", 15))
+
+    # WEBHOOKS (entrega na fila 'webhooks', com retry exponencial e dead-letter)
+    WEBHOOK_QUEUE_NAME: str = os.getenv("WEBHOOK_QUEUE_NAME", "webhooks")
+    WEBHOOK_TIMEOUT_SECONDS: float = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", 15))
+    WEBHOOK_MAX_RETRIES: int = int(os.getenv("WEBHOOK_MAX_RETRIES", 8))
+    WEBHOOK_MIN_BACKOFF_MS: int = int(os.getenv("WEBHOOK_MIN_BACKOFF_MS", 1000))
+    WEBHOOK_MAX_BACKOFF_MS: int = int(os.getenv("WEBHOOK_MAX_BACKOFF_MS", 300000))
+    WEBHOOK_POOL_MAX_CONNECTIONS: int = int(os.getenv("WEBHOOK_POOL_MAX_CONNECTIONS", 100))
+    WEBHOOK_BATCH_MAX_SIZE: int = int(os.getenv("WEBHOOK_BATCH_MAX_SIZE", 1))  # 1 = sem lotes
+    WEBHOOK_BATCH_MAX_WAIT_MS: int = int(os.getenv("WEBHOOK_BATCH_MAX_WAIT_MS", 50))
+
     # API Version
     API_VERSION: str = "1.0.0"
 
@@ -2,10 +2,10 @@
 import os
 import uuid
 import google.generativeai as genai
-from pymongo import MongoClient
 from qdrant_client import QdrantClient, models
 from datetime import datetime, timedelta, timezone
 from config import settings
+from services.database.mongo_connection import mongo_connection
 from dotenv import load_dotenv
 
 # --- Configuração ---
@@ -13,8 +13,6 @@ load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 # Configs do MongoDB (para a Memória de Curto Prazo)
-MONGO_URI = settings.MONGO_URI
-MONGO_DB = settings.MONGO_DB
 CONVERSATION_HISTORY_COLLECTION = "conversation_history"
 
 # Configs do Qdrant (para a Memória de Longo Prazo)
@@ -63,9 +61,8 @@ def embed_text(text: str) -> list:
 def main():
     print("Iniciando rotina de criação de memória de longo prazo...")
     
-    # Conexão com a Memória de Curto Prazo (MongoDB)
-    mongo_client = MongoClient(MONGO_URI)
-    stm_collection = mongo_client[MONGO_DB][CONVERSATION_HISTORY_COLLECTION]
+    # Conexão com a Memória de Curto Prazo (MongoDB), usando o cliente compartilhado
+    stm_collection = mongo_connection.get_collection(CONVERSATION_HISTORY_COLLECTION, usage="history")
     
     # Conexão com a Memória de Longo Prazo (Qdrant)
     qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
@@ -158,6 +155,7 @@ def main():
             stm_collection.delete_many({"_id": {"$in": ids_to_delete}})
             print(f"  - {len(ids_to_delete)} mensagens limpas da memória de curto prazo (MongoDB).")
 
+    mongo_connection.close()
     print("Rotina finalizada.")
 
 if __name__ == "__main__":
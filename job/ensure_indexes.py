@@ -0,0 +1,32 @@
+# job/ensure_indexes.py
+from services.conversation.conversation_history import conversation_history
+from services.logging.execution_logger import execution_logger
+from services.tasks.task_status import task_status_store
+from services.webhooks.webhook_delivery import webhook_delivery
+
+
+def main():
+    """
+    Cria os índices das coleções usadas pelo orquestrador.
+    Deve ser executado no deploy (ou uma vez por ambiente), e não a cada import dos serviços.
+    """
+    print("Criando índices do MongoDB...")
+
+    conversation_history.ensure_indexes()
+    print("  - Índices de 'conversation_history' garantidos.")
+
+    execution_logger.ensure_indexes()
+    print("  - Índices de 'execution_logs' garantidos.")
+
+    task_status_store.ensure_indexes()
+    print("  - Índices de 'task_results' garantidos.")
+
+    webhook_delivery.ensure_indexes()
+    print("  - Índices de 'webhook_dead_letters' garantidos.")
+
+    print("Rotina finalizada.")
+
+if __name__ == "__main__":
+    main()
+
+# iniciar o job python -m job.ensure_indexes
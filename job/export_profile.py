@@ -0,0 +1,36 @@
+# job/export_profile.py
+import argparse
+
+from services.database.mongo_connection import mongo_connection
+from services.logging.execution_logger import execution_logger
+
+
+def main():
+    """
+    Exporta o profile de uma tarefa (pilhas colapsadas) para um arquivo, pronto para
+    'flamegraph.pl perfil.folded > perfil.svg' ou para abrir no speedscope.
+    """
+    parser = argparse.ArgumentParser(description="Exporta o profile de uma execução em formato colapsado.")
+    parser.add_argument("--execution-id", help="execution_id do log de execução.")
+    parser.add_argument("--task-id", help="task_id devolvido pela rota /ask.")
+    parser.add_argument("-o", "--output", help="Arquivo de saída (padrão: <id>.folded).")
+    args = parser.parse_args()
+
+    if not args.execution_id and not args.task_id:
+        parser.error("Informe --execution-id ou --task-id.")
+
+    collapsed = execution_logger.get_profile(execution_id=args.execution_id, task_id=args.task_id)
+    if collapsed is None:
+        print("Nenhum profile encontrado.")
+    else:
+        output = args.output or f"{args.execution_id or args.task_id}.folded"
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(collapsed + "\n")
+        print(f"Profile gravado em {output} ({len(collapsed.splitlines())} pilhas distintas).")
+
+    mongo_connection.close()
+
+if __name__ == "__main__":
+    main()
+
+# iniciar o job python -m job.export_profile --task-id <task_id>
@@ -0,0 +1,30 @@
+# job/replay_webhooks.py
+import argparse
+
+from services.database.mongo_connection import mongo_connection
+from services.webhooks.webhook_delivery import webhook_delivery
+from worker import deliver_webhook
+
+
+def main():
+    """
+    Reenfileira os callbacks da dead-letter (coleção 'webhook_dead_letters') na fila de webhooks.
+    Cada callback reenviado volta a ter WEBHOOK_MAX_RETRIES tentativas.
+    """
+    parser = argparse.ArgumentParser(description="Reenvia os callbacks que esgotaram as tentativas de entrega.")
+    parser.add_argument("--limit", type=int, default=100, help="Quantidade máxima de callbacks reenviados.")
+    parser.add_argument("--url", help="Substitui a webhook_url original (ex.: receptor migrado).")
+    args = parser.parse_args()
+
+    documents = webhook_delivery.pending_dead_letters(limit=args.limit)
+    for document in documents:
+        deliver_webhook.send(args.url or document["webhook_url"], document["callback_payload"])
+        webhook_delivery.mark_replayed(document["_id"])
+    print(f"{len(documents)} callback(s) reenfileirado(s).")
+
+    mongo_connection.close()
+
+if __name__ == "__main__":
+    main()
+
+# iniciar o job python -m job.replay_webhooks --limit 100
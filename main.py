@@ -1,8 +1,10 @@
 # main.py
 import logging
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request, Response
 from routers.api_router import router as api_router
 from config import settings
+from services.monitoring.metrics import CONTENT_TYPE_LATEST, metrics, observe_phase
 import uvicorn
 
 logging.basicConfig(
@@ -20,6 +22,26 @@ app = FastAPI(
 
 app.include_router(api_router, prefix="/api/v1")
 
+HTTP_REQUESTS = metrics.counter(
+    "agent_http_requests_total", "Requisições HTTP atendidas pela API.", ("method", "route", "status")
+)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Mede a latência de cada rota (pelo template da rota, para não explodir a cardinalidade)."""
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        observe_phase("http", f"{request.method} {route_path}", time.perf_counter() - started, error=status_code >= 500)
+        HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status_code)
+
 @app.get("/health")
 def health_check():
     """
@@ -28,6 +50,12 @@ def health_check():
     return {"status": "healthy", "version": app.version}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Métricas do processo da API no formato texto do Prometheus."""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field  
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 
 class ParameterSchema(BaseModel):
     name: str
@@ -27,6 +27,7 @@ class ToolSchema(BaseModel):
     isLLM: bool
     prompt_template: Optional[str] = None
     isActive: bool
+    routing_hints: Optional[List[str]] = Field(None, description="Exemplos de perguntas atendidas pela ferramenta, usados pelo roteador rápido.")
 
 class AgentSchema(BaseModel):
     agent_id: str
@@ -49,6 +50,18 @@ class UserRequest(BaseModel):
     task_id: Optional[str] = Field(None, description="ID único para rastrear esta tarefa específica.")
     webhook_url: Optional[str] = Field(None, description="URL de callback para notificar o resultado final.")
     addressing_info: Optional[Dict[str, Any]] = Field(default_factory=dict, description="Dados adicionais a serem retornados no callback.")
+    wait_for_result: bool = Field(False, description="Se verdadeiro, a rota /ask espera o resultado (até wait_timeout_seconds) em vez de responder 202 de imediato.")
+    wait_timeout_seconds: Optional[float] = Field(None, description="Tempo máximo de espera no modo síncrono (limitado por ASK_WAIT_MAX_SECONDS).")
+    priority: Optional[Literal["high", "default", "low"]] = Field(None, description="Fila de prioridade da tarefa; sem ela, vale a do tier do usuário.")
+
+class BatchUserRequest(BaseModel):
+    requests: List[UserRequest] = Field(..., description="Perguntas do lote (até ASK_BATCH_MAX); 'wait_for_result' é ignorado.")
+    batch_id: Optional[str] = Field(None, description="ID do lote; gerado se ausente.")
+    webhook_url: Optional[str] = Field(None, description="Callback único, chamado quando todas as tarefas aceitas do lote terminarem.")
+    addressing_info: Optional[Dict[str, Any]] = Field(default_factory=dict, description="Dados adicionais a serem retornados no callback do lote.")
+
+class TaskStatusQuery(BaseModel):
+    task_ids: List[str] = Field(..., description="IDs das tarefas a consultar (até TASK_STATUS_BATCH_MAX).")
 
 class ToolResult(BaseModel):
     success: bool
@@ -1,52 +1,428 @@
 # routers/api_router.py
-from fastapi import APIRouter, HTTPException, status
-from models.schemas import UserRequest
-from worker import process_ai_request
-import uuid
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from config import settings
+from models.schemas import BatchUserRequest, TaskStatusQuery, UserRequest
+from services.admission.admission_control import AdmissionRejected, admission_control
+from services.events.task_events import RESULT_EVENT, task_events
+from services.idempotency.task_idempotency import task_guard
+from services.monitoring.tracing import tracer
+from services.scheduling.fair_scheduler import PRIORITIES, fair_scheduler
+from services.tasks import task_status
+from services.tasks.task_batches import task_batches
+from services.tasks.task_status import task_status_store
+from worker import SCHEDULED_TASK_ACTORS, process_ai_request, send_batch_callback
+from collections import Counter
+from typing import List, Optional
+import asyncio
+import json
 import logging
+import time
+import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+
+def _queues_ahead(request: UserRequest) -> list:
+    """Filas do Dramatiq cujas mensagens seriam processadas antes da tarefa: a dela e as de maior prioridade."""
+    if settings.SCHEDULER_ENABLED:
+        priority = fair_scheduler.resolve(request.user_id, request.priority)[0]
+        return [fair_scheduler.queue_name(p) for p in PRIORITIES[:PRIORITIES.index(priority) + 1]]
+    return [process_ai_request.queue_name]
+
+
+def _build_job_payload(request: UserRequest, task_id: str, session_id: str) -> dict:
+    """Payload que o worker espera receber. Chamado dentro do span da rota (o trace_context aponta para ele)."""
+    return {
+        "task_id": task_id,
+        "user_id": request.user_id,
+        "session_id": session_id,
+        "user_input": request.question,
+        "callback_details": {
+            "webhook_url": request.webhook_url,
+            "addressing_info": request.addressing_info
+        },
+        # Vincula o span da tarefa no worker a este span
+        "trace_context": tracer.inject(),
+        # Devolvido no callback: permite medir o tempo de espera na fila
+        "enqueued_at": time.time(),
+        # Dono do lease da tarefa no worker: retries desta submissão podem retomá-la
+        "submission_id": str(uuid.uuid4())
+    }
+
+
+def _enqueue_task(request: UserRequest, http_request: Request, stream_events: bool = False) -> tuple:
+    """
+    Monta o payload da tarefa e o envia para a fila do Dramatiq.
+    Retorna (task_id, session_id, duplicate). Com 'duplicate' o task_id já tinha sido
+    submetido (retry do cliente) e nada foi enfileirado: quem chama acompanha a tarefa existente.
+    """
+    # Garante que a tarefa e a sessão tenham um ID único
+    task_id = request.task_id or str(uuid.uuid4())
+    session_id = request.session_id or str(uuid.uuid4())
+
+    # Continua o trace do cliente, se ele enviou um header traceparent
+    with tracer.start_span(
+        "POST /ask",
+        attributes={"task_id": task_id, "session_id": session_id, "user_id": request.user_id},
+        parent=tracer.extract(http_request.headers)
+    ):
+        job_payload = _build_job_payload(request, task_id, session_id)
+        if stream_events:
+            # O worker publica o progresso da tarefa no pub/sub do Redis
+            job_payload["stream_events"] = True
+
+        # O mesmo task_id já submetido não volta para a fila
+        existing = task_guard.register_submission(job_payload)
+        if existing is not None:
+            logger.info(f"Tarefa {task_id} já submetida: a requisição acompanha a execução existente.")
+            return task_id, existing.get("session_id") or session_id, True
+
+        try:
+            # Recusa (AdmissionRejected) antes de qualquer escrita se o sistema estiver sobrecarregado
+            admission_control.admit(request.user_id, task_id, _queues_ahead(request))
+
+            # Gravado antes do envio: o worker pode marcar 'running' antes desta rota continuar
+            task_status_store.set_status(job_payload, task_status.QUEUED)
+
+            # Envie a tarefa para a fila do Dramatiq.
+            # Esta chamada é instantânea, apenas coloca a mensagem no Redis.
+            if settings.SCHEDULER_ENABLED:
+                # A tarefa fica na fila do usuário; o Dramatiq recebe um ticket na fila da prioridade
+                priority = fair_scheduler.submit(job_payload, request.priority)
+                actor = SCHEDULED_TASK_ACTORS[priority]
+                with tracer.start_span("dramatiq.enqueue", attributes={"actor": actor.actor_name}):
+                    actor.send({"ticket_id": str(uuid.uuid4())})
+            else:
+                with tracer.start_span("dramatiq.enqueue", attributes={"actor": process_ai_request.actor_name}):
+                    process_ai_request.send(job_payload)
+        except Exception:
+            # A tarefa não chegou ao worker: a vaga da admissão e o registro da submissão
+            # não seriam liberados por ele, e o cliente precisa poder reenviar o mesmo task_id
+            admission_control.release(request.user_id, task_id)
+            task_guard.forget_submission(job_payload)
+            raise
+
+    logger.info(f"Tarefa {task_id} para o usuário {request.user_id} foi enfileirada com sucesso.")
+    return task_id, session_id, False
+
+
+def _stored_result(task_id: str) -> Optional[dict]:
+    """Estado guardado de uma tarefa já terminada (para submissões duplicadas), ou None."""
+    record = task_status_store.get(task_id)
+    if record is not None and record.get("status") in task_status.TERMINAL_STATUSES:
+        return record
+    return None
+
+
+def _enqueue_error(e: Exception) -> HTTPException:
+    if isinstance(e, AdmissionRejected):
+        logger.warning(f"Tarefa recusada pela admissão ({e.reason}): {e}")
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Sistema sobrecarregado, tente novamente mais tarde: {e}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    logger.exception("Erro CRÍTICO ao enfileirar a tarefa na rota /ask")
+    return HTTPException(
+        status_code=500,
+        detail=f"Não foi possível enfileirar a tarefa para processamento: {e}"
+    )
+
+
 @router.post("/ask", status_code=status.HTTP_202_ACCEPTED)
-def ask_question(request: UserRequest):
+async def ask_question(request: UserRequest, http_request: Request, response: Response):
     """
     Recebe uma pergunta, a enfileira para processamento assíncrono
-    e retorna imediatamente.
+    e retorna imediatamente. Com 'wait_for_result', espera o resultado até o prazo
+    e o devolve com 200; se o prazo acabar antes, responde 202 como no modo assíncrono.
+    Reenviar um task_id já submetido não cria outra tarefa: devolve o resultado guardado
+    (200) ou acompanha a execução em andamento.
+
+    A rota é assíncrona: a espera usa o pub/sub do redis.asyncio e o envio (chamadas
+    síncronas ao Redis) roda em asyncio.to_thread, sem prender uma thread durante a espera.
     """
+    subscription = None
     try:
-        # 3. Garante que a tarefa e a sessão tenham um ID único
-        task_id = request.task_id or str(uuid.uuid4())
-        session_id = request.session_id or str(uuid.uuid4())
+        if request.wait_for_result:
+            # A inscrição é aberta antes do envio para não perder o resultado de uma tarefa rápida
+            task_id = request.task_id or str(uuid.uuid4())
+            request = request.model_copy(update={"task_id": task_id})
+            subscription = await task_events.subscribe(task_id)
+        task_id, session_id, duplicate = await asyncio.to_thread(
+            _enqueue_task, request, http_request, stream_events=request.wait_for_result
+        )
+    except Exception as e:
+        if subscription is not None:
+            await subscription.close()
+        raise _enqueue_error(e)
 
-        # 4. Monte o payload que o seu worker espera receber
-        job_payload = {
+    stored = await asyncio.to_thread(_stored_result, task_id) if duplicate else None
+    if stored is not None:
+        if subscription is not None:
+            await subscription.close()
+        response.status_code = status.HTTP_200_OK
+        return {
             "task_id": task_id,
-            "user_id": request.user_id,
             "session_id": session_id,
-            "user_input": request.question,
-            "callback_details": {
-                "webhook_url": request.webhook_url,
-                "addressing_info": request.addressing_info
-            }
+            "status": stored.get("status"),
+            "final_output": stored.get("final_output"),
+            "required_params": stored.get("required_params")
         }
 
-        # 5. Envie a tarefa para a fila do Dramatiq.
-        #    Esta chamada é instantânea, apenas coloca a mensagem no Redis.
-        process_ai_request.send(job_payload)
+    if subscription is not None:
+        timeout = min(request.wait_timeout_seconds or settings.ASK_WAIT_MAX_SECONDS, settings.ASK_WAIT_MAX_SECONDS)
+        try:
+            result = await subscription.wait_for_result(timeout)
+        finally:
+            await subscription.close()
+        if result is not None:
+            response.status_code = status.HTTP_200_OK
+            return {
+                "task_id": task_id,
+                "session_id": session_id,
+                "status": result["data"].get("status"),
+                "final_output": result["data"].get("final_output"),
+                "required_params": result["data"].get("required_params")
+            }
 
-        logger.info(f"Tarefa {task_id} para o usuário {request.user_id} foi enfileirada com sucesso.")
+    # Responda IMEDIATAMENTE ao usuário com os IDs para rastreamento.
+    return {
+        "message": "Sua requisição foi aceita e está sendo processada em segundo plano.",
+        "task_id": task_id,
+        "session_id": session_id
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
 
-        # 6. Responda IMEDIATAMENTE ao usuário com os IDs para rastreamento.
-        return {
-            "message": "Sua requisição foi aceita e está sendo processada em segundo plano.",
-            "task_id": task_id,
-            "session_id": session_id
-        }
 
+@router.post("/ask/stream")
+async def ask_question_stream(request: UserRequest, http_request: Request):
+    """
+    Enfileira a pergunta e responde com Server-Sent Events: 'accepted', o progresso
+    da orquestração ('started', 'manager', 'tool'), os pedaços da resposta final ('token')
+    e por fim 'result'. Se a tarefa passar de ASK_STREAM_TIMEOUT_SECONDS, envia 'timeout'
+    e encerra; o webhook, se informado, continua valendo. Um task_id já submetido recebe
+    o resultado guardado ou acompanha a execução em andamento (o progresso só é publicado
+    se a primeira submissão também pediu eventos; o 'result', sempre).
+    """
+    task_id = request.task_id or str(uuid.uuid4())
+    request = request.model_copy(update={"task_id": task_id})
+    subscription = await task_events.subscribe(task_id)
+    try:
+        task_id, session_id, duplicate = await asyncio.to_thread(_enqueue_task, request, http_request, stream_events=True)
     except Exception as e:
-        logger.exception("Erro CRÍTICO ao enfileirar a tarefa na rota /ask")
+        await subscription.close()
+        raise _enqueue_error(e)
+    stored = await asyncio.to_thread(_stored_result, task_id) if duplicate else None
+
+    async def event_stream():
+        try:
+            yield _sse("accepted", {"task_id": task_id, "session_id": session_id})
+            if stored is not None:
+                yield _sse(RESULT_EVENT, {"status": stored.get("status"), "final_output": stored.get("final_output"),
+                                          "required_params": stored.get("required_params")})
+                return
+            finished = False
+            async for event in subscription.events(settings.ASK_STREAM_TIMEOUT_SECONDS, keepalive=settings.ASK_STREAM_KEEPALIVE_SECONDS):
+                if event is None:
+                    # Comentário SSE: mantém a conexão aberta em proxies com timeout de inatividade
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event["event"], event["data"])
+                finished = event["event"] == RESULT_EVENT
+            if not finished:
+                yield _sse("timeout", {"task_id": task_id})
+        finally:
+            await subscription.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _withdraw_unticketed(accepted: list, tickets: Counter) -> List[dict]:
+    """
+    Com o escalonador, os tickets não levam a tarefa: para cada prioridade, faltam tantos
+    tickets quanto tarefas gravadas sem ticket enviado. Essas tarefas (as últimas do lote
+    ainda não reservadas) saem da fila do usuário e são devolvidas como não enviadas.
+    """
+    unsent = []
+    by_priority = {}
+    for _, job_payload in accepted:
+        by_priority.setdefault(job_payload["priority"], []).append(job_payload)
+    for priority, job_payloads in by_priority.items():
+        missing = len(job_payloads) - tickets[priority]
+        for job_payload in reversed(job_payloads):
+            if missing <= 0:
+                break
+            try:
+                if fair_scheduler.withdraw(job_payload):
+                    unsent.append(job_payload)
+                    missing -= 1
+            except Exception as e:
+                logger.error(f"Falha ao retirar a tarefa {job_payload['task_id']} da fila do escalonador: {e}")
+    return unsent
+
+
+def _rollback_unsent(batch_id: Optional[str], accepted: list, unsent: List[dict]):
+    """
+    Desfaz as tarefas do lote que não chegaram ao worker: vaga da admissão, registro da
+    submissão (o cliente pode reenviar o mesmo task_id) e estado 'queued'. O lote passa a
+    contar só as enviadas.
+    """
+    unsent_ids = {job_payload["task_id"] for job_payload in unsent}
+    logger.error(f"{len(unsent)} de {len(accepted)} tarefas do lote não foram enviadas; as demais continuam na fila.")
+    try:
+        for job_payload in unsent:
+            admission_control.release(job_payload["user_id"], job_payload["task_id"])
+            task_guard.forget_submission(job_payload)
+        task_status_store.delete_many(list(unsent_ids))
+        if batch_id:
+            remaining = task_batches.shrink(batch_id, [job_payload["task_id"] for _, job_payload in accepted
+                                                       if job_payload["task_id"] not in unsent_ids])
+            if remaining is not None:
+                send_batch_callback(remaining)
+    except Exception:
+        # A vaga e a submissão expiram sozinhas; o erro original é o que volta ao cliente
+        logger.exception("Falha ao desfazer as tarefas não enviadas do lote")
+
+
+@router.post("/ask/batch", status_code=status.HTTP_202_ACCEPTED)
+def ask_batch(batch: BatchUserRequest, http_request: Request):
+    """
+    Enfileira várias perguntas numa só requisição (ex.: relatórios agendados por usuário).
+    As escritas no Redis (submissões, admissão, estados, filas do escalonador) vão em
+    pipelines para o lote inteiro. Com 'webhook_url', o lote recebe um único callback
+    quando todas as tarefas aceitas terminarem; os callbacks de cada pergunta continuam valendo.
+
+    Cada pergunta volta, na ordem do lote, com 'queued', 'duplicate' (task_id já submetido
+    ou repetido no próprio lote: só a primeira ocorrência é enfileirada) ou 'rejected'
+    (limite de tarefas do usuário, com 'retry_after'). Filas sobrecarregadas recusam o lote inteiro (429).
+    """
+    if len(batch.requests) > settings.ASK_BATCH_MAX:
+        raise HTTPException(
+            status_code=422,
+            detail=f"No máximo {settings.ASK_BATCH_MAX} perguntas por lote."
+        )
+    batch_id = batch.batch_id or str(uuid.uuid4())
+
+    with tracer.start_span(
+        "POST /ask/batch",
+        attributes={"batch_id": batch_id, "size": len(batch.requests)},
+        parent=tracer.extract(http_request.headers)
+    ):
+        # Um task_id repetido no lote é registrado e enfileirado uma vez só. 'entries' guarda,
+        # por pergunta do lote, (posição da tarefa em job_payloads, se é uma repetição)
+        requests, job_payloads, positions, entries = [], [], {}, []
+        for request in batch.requests:
+            task_id = request.task_id or str(uuid.uuid4())
+            if task_id in positions:
+                entries.append((positions[task_id], True))
+                continue
+            job_payload = _build_job_payload(request, task_id, request.session_id or str(uuid.uuid4()))
+            if batch.webhook_url:
+                job_payload["batch_id"] = batch_id
+            positions[task_id] = len(job_payloads)
+            entries.append((positions[task_id], False))
+            requests.append(request)
+            job_payloads.append(job_payload)
+
+        duplicates = task_guard.register_submissions(job_payloads)
+        new = [(request, job_payload) for request, job_payload in zip(requests, job_payloads)
+               if job_payload["task_id"] not in duplicates]
+        try:
+            # As filas verificadas são as da menor prioridade do lote (e todas as acima dela)
+            queue_names = max((_queues_ahead(request) for request, _ in new), key=len, default=[])
+            rejected = admission_control.admit_batch(
+                [(job_payload["user_id"], job_payload["task_id"]) for _, job_payload in new], queue_names
+            )
+        except Exception as e:
+            for _, job_payload in new:
+                task_guard.forget_submission(job_payload)
+            raise _enqueue_error(e)
+        for _, job_payload in new:
+            if job_payload["task_id"] in rejected:
+                task_guard.forget_submission(job_payload)
+        accepted = [(request, job_payload) for request, job_payload in new if job_payload["task_id"] not in rejected]
+
+        # O envio ao Dramatiq é uma mensagem por tarefa: numa falha no meio, só as tarefas
+        # que não chegaram ao worker são desfeitas (as enviadas executam normalmente)
+        sent, tickets, submitted = set(), Counter(), False
+        try:
+            if batch.webhook_url and accepted:
+                task_batches.create(batch_id, [job_payload["task_id"] for _, job_payload in accepted],
+                                    batch.webhook_url, batch.addressing_info)
+            task_status_store.set_status_many([job_payload for _, job_payload in accepted], task_status.QUEUED)
+            if settings.SCHEDULER_ENABLED and accepted:
+                priorities = fair_scheduler.submit_many(
+                    [job_payload for _, job_payload in accepted], [request.priority for request, _ in accepted]
+                )
+                submitted = True
+                with tracer.start_span("dramatiq.enqueue", attributes={"tasks": len(accepted)}):
+                    for priority in priorities:
+                        SCHEDULED_TASK_ACTORS[priority].send({"ticket_id": str(uuid.uuid4())})
+                        tickets[priority] += 1
+            else:
+                with tracer.start_span("dramatiq.enqueue", attributes={"tasks": len(accepted)}):
+                    for _, job_payload in accepted:
+                        process_ai_request.send(job_payload)
+                        sent.add(job_payload["task_id"])
+        except Exception as e:
+            if submitted:
+                unsent = _withdraw_unticketed(accepted, tickets)
+            else:
+                unsent = [job_payload for _, job_payload in accepted if job_payload["task_id"] not in sent]
+            _rollback_unsent(batch_id if batch.webhook_url else None, accepted, unsent)
+            raise _enqueue_error(e)
+
+    results = []
+    for job_payload in job_payloads:
+        task_id = job_payload["task_id"]
+        if task_id in duplicates:
+            results.append({"task_id": task_id, "session_id": duplicates[task_id].get("session_id") or job_payload["session_id"],
+                            "status": "duplicate"})
+        elif task_id in rejected:
+            results.append({"task_id": task_id, "session_id": job_payload["session_id"], "status": "rejected",
+                            "detail": str(rejected[task_id]), "retry_after": rejected[task_id].retry_after})
+        else:
+            results.append({"task_id": task_id, "session_id": job_payload["session_id"], "status": "queued"})
+    tasks = [
+        {"task_id": results[position]["task_id"], "session_id": results[position]["session_id"], "status": "duplicate"}
+        if repeated else results[position]
+        for position, repeated in entries
+    ]
+    logger.info(f"Lote {batch_id}: {len(accepted)} de {len(batch.requests)} tarefas enfileiradas.")
+    return {
+        "message": "Lote aceito; as tarefas enfileiradas estão sendo processadas em segundo plano.",
+        "batch_id": batch_id,
+        "tasks": tasks
+    }
+
+
+@router.get("/tasks/{task_id}")
+def get_task_status(task_id: str):
+    """
+    Estado da tarefa (queued, running, retrying, pending_input, completed, failed) e, quando
+    terminada, a resposta final. Lido do Redis; após a expiração, do MongoDB.
+    """
+    record = task_status_store.get(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Tarefa '{task_id}' não encontrada.")
+    return record
+
+
+@router.post("/tasks/status")
+def get_tasks_status(query: TaskStatusQuery):
+    """Estado de várias tarefas em uma chamada; IDs desconhecidos voltam como null."""
+    if len(query.task_ids) > settings.TASK_STATUS_BATCH_MAX:
         raise HTTPException(
-            status_code=500,
-            detail=f"Não foi possível enfileirar a tarefa para processamento: {e}"
-        )
\ No newline at end of file
+            status_code=422,
+            detail=f"No máximo {settings.TASK_STATUS_BATCH_MAX} task_ids por consulta."
+        )
+    return {"tasks": task_status_store.get_many(query.task_ids)}
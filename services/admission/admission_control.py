@@ -0,0 +1,282 @@
+# services/admission/admission_control.py
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from config import settings
+from services.cache.redis_connection import redis_connection
+from services.monitoring.metrics import metrics
+
+ADMISSION_ACCEPTED = metrics.counter(
+    "agent_admission_accepted_total",
+    "Tarefas aceitas pela admissão na rota /ask.",
+)
+ADMISSION_SHED = metrics.counter(
+    "agent_admission_shed_total",
+    "Tarefas recusadas (429) pela admissão na rota /ask, por motivo.",
+    ("reason",),
+)
+QUEUE_DEPTH = metrics.gauge(
+    "agent_queue_depth",
+    "Mensagens aguardando em cada fila do Dramatiq (inclui as adiadas).",
+    ("queue",),
+)
+PROCESSING_RATE = metrics.gauge(
+    "agent_processing_rate_per_second",
+    "Tarefas concluídas por segundo pelos workers, na janela ADMISSION_RATE_WINDOW_SECONDS.",
+)
+ESTIMATED_WAIT = metrics.gauge(
+    "agent_queue_estimated_wait_seconds",
+    "Espera estimada de uma nova tarefa: profundidade das filas / taxa de processamento.",
+    ("queue",),
+)
+
+
+class AdmissionRejected(Exception):
+    """A tarefa foi recusada pela admissão. 'retry_after' em segundos, para o header Retry-After."""
+
+    def __init__(self, reason: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Controle de admissão da rota /ask. Antes de enfileirar, recusa a tarefa quando:
+      - as filas à frente dela têm ADMISSION_MAX_QUEUE_DEPTH mensagens ou mais;
+      - a espera estimada (profundidade / tarefas concluídas por segundo na janela
+        recente) passa de ADMISSION_MAX_ESTIMATED_WAIT_SECONDS;
+      - o usuário já tem ADMISSION_MAX_USER_IN_FLIGHT tarefas aceitas e não terminadas.
+
+    Profundidade e taxa são lidas do Redis e guardadas por ADMISSION_CACHE_MS no processo
+    da API. As tarefas em voo de cada usuário ficam num ZSET com validade por membro
+    (uma tarefa perdida não prende a vaga para sempre). Falhas do Redis liberam a admissão.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AdmissionController, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._snapshot = {}
+        return cls._instance
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._snapshot = {}
+
+    @staticmethod
+    def _key(*parts) -> str:
+        return settings.ADMISSION_KEY_PREFIX + ":".join(str(part) for part in parts)
+
+    # --- Leituras (com cache) ---
+
+    @staticmethod
+    def _read_queue_depth(queue_name: str) -> int:
+        # Importado aqui: o worker importa este módulo para registrar as conclusões.
+        from worker import broker
+        if hasattr(broker, "do_qsize"):
+            # RedisBroker: mensagens da fila e da fila de adiadas (.DQ)
+            return int(broker.do_qsize(queue_name))
+        # StubBroker (benchmarks e testes)
+        queue = broker.queues.get(queue_name)
+        delayed = broker.queues.get(f"{queue_name}.DQ")
+        return (queue.qsize() if queue else 0) + (delayed.qsize() if delayed else 0)
+
+    def _read_processing_rate(self) -> float:
+        now = int(time.time())
+        window = settings.ADMISSION_RATE_WINDOW_SECONDS
+        # O segundo atual ainda está em andamento: a janela termina no anterior
+        keys = [self._key("done", second) for second in range(now - window, now)]
+        values = redis_connection.get_client().mget(keys)
+        return sum(int(value) for value in values if value) / window
+
+    def _cached(self, name: str, loader):
+        now = time.monotonic()
+        cached = self._snapshot.get(name)
+        if cached is not None and now - cached[0] < settings.ADMISSION_CACHE_MS / 1000:
+            return cached[1]
+        value = loader()
+        with self._lock:
+            self._snapshot[name] = (now, value)
+        return value
+
+    def queue_depths(self, queue_names: List[str]) -> Dict[str, int]:
+        depths = {name: self._cached(f"depth:{name}", lambda name=name: self._read_queue_depth(name)) for name in queue_names}
+        for name, depth in depths.items():
+            QUEUE_DEPTH.set(depth, queue=name)
+        return depths
+
+    def processing_rate(self) -> float:
+        rate = self._cached("rate", self._read_processing_rate)
+        PROCESSING_RATE.set(rate)
+        return rate
+
+    # --- Decisão ---
+
+    def admit(self, user_id: str, task_id: str, queue_names: List[str]):
+        """
+        Aceita a tarefa (e reserva a vaga do usuário) ou levanta AdmissionRejected.
+        'queue_names' são as filas à frente da tarefa: a dela e as de maior prioridade.
+        """
+        if not settings.ADMISSION_ENABLED:
+            return
+        try:
+            self._check_queues(queue_names)
+            self._reserve_user_slot(user_id, task_id)
+        except AdmissionRejected as rejected:
+            ADMISSION_SHED.inc(reason=rejected.reason)
+            raise
+        except RedisError as e:
+            print(f"[ADMISSION] Redis indisponível, tarefa {task_id} admitida sem verificação: {e}")
+        ADMISSION_ACCEPTED.inc()
+
+    def admit_batch(self, tasks: List[Tuple[str, str]], queue_names: List[str]) -> Dict[str, AdmissionRejected]:
+        """
+        Admissão de um lote (POST /ask/batch) de pares (user_id, task_id). A verificação das
+        filas conta o lote inteiro e, se falhar, levanta AdmissionRejected para todo ele. O limite
+        por usuário é verificado em uma única transação: retorna {task_id: recusa} das tarefas
+        recusadas individualmente.
+        """
+        if not settings.ADMISSION_ENABLED or not tasks:
+            return {}
+        rejected = {}
+        try:
+            self._check_queues(queue_names, incoming=len(tasks))
+            rejected = self._reserve_user_slots(tasks)
+        except AdmissionRejected as e:
+            ADMISSION_SHED.inc(len(tasks), reason=e.reason)
+            raise
+        except RedisError as e:
+            print(f"[ADMISSION] Redis indisponível, lote de {len(tasks)} tarefas admitido sem verificação: {e}")
+        for rejection in rejected.values():
+            ADMISSION_SHED.inc(reason=rejection.reason)
+        if len(tasks) > len(rejected):
+            ADMISSION_ACCEPTED.inc(len(tasks) - len(rejected))
+        return rejected
+
+    def _check_queues(self, queue_names: List[str], incoming: int = 1):
+        depth = sum(self.queue_depths(queue_names).values())
+        # Mensagens à frente da última tarefa que entra (para uma tarefa só, a profundidade atual)
+        ahead = depth + incoming - 1
+        rate = self.processing_rate()
+        estimated_wait = ahead / rate if rate > 0 else None
+        if estimated_wait is not None:
+            ESTIMATED_WAIT.set(estimated_wait, queue=queue_names[-1])
+        batch_note = f", lote de {incoming}" if incoming > 1 else ""
+
+        max_depth = settings.ADMISSION_MAX_QUEUE_DEPTH
+        if max_depth and ahead >= max_depth:
+            # Tempo para a fila voltar abaixo do limite no ritmo atual
+            retry_after = (ahead - max_depth + 1) / rate if rate > 0 else settings.ADMISSION_RETRY_AFTER_SECONDS
+            raise AdmissionRejected(
+                "queue_depth", f"Fila com {depth} tarefas aguardando (limite {max_depth}{batch_note}).",
+                self._seconds(retry_after)
+            )
+
+        max_wait = settings.ADMISSION_MAX_ESTIMATED_WAIT_SECONDS
+        if max_wait and estimated_wait is not None and estimated_wait > max_wait:
+            raise AdmissionRejected(
+                "estimated_wait", f"Espera estimada de {estimated_wait:.0f}s (limite {max_wait:.0f}s{batch_note}).",
+                self._seconds(estimated_wait - max_wait)
+            )
+
+    def _reserve_user_slot(self, user_id: str, task_id: str):
+        limit = settings.ADMISSION_MAX_USER_IN_FLIGHT
+        if not limit:
+            return
+        now = time.time()
+        key = self._key("user", user_id)
+        # Adiciona e conta numa transação; se passou do limite, desfaz
+        with redis_connection.get_client().pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zadd(key, {task_id: now + settings.ADMISSION_TASK_TTL_SECONDS})
+            pipe.zcard(key)
+            pipe.expire(key, settings.ADMISSION_TASK_TTL_SECONDS)
+            in_flight = pipe.execute()[2]
+        if in_flight > limit:
+            redis_connection.get_client().zrem(key, task_id)
+            raise AdmissionRejected(
+                "user_in_flight", f"O usuário já tem {limit} tarefas em andamento.", settings.ADMISSION_RETRY_AFTER_SECONDS
+            )
+
+    def _reserve_user_slots(self, tasks: List[Tuple[str, str]]) -> Dict[str, AdmissionRejected]:
+        limit = settings.ADMISSION_MAX_USER_IN_FLIGHT
+        if not limit:
+            return {}
+        now = time.time()
+        client = redis_connection.get_client()
+        # Cada ZCARD vê as tarefas do lote já adicionadas antes dela, na mesma transação
+        with client.pipeline(transaction=True) as pipe:
+            for user_id in {user_id for user_id, _ in tasks}:
+                pipe.zremrangebyscore(self._key("user", user_id), "-inf", now)
+            for user_id, task_id in tasks:
+                key = self._key("user", user_id)
+                pipe.zadd(key, {task_id: now + settings.ADMISSION_TASK_TTL_SECONDS})
+                pipe.zcard(key)
+                pipe.expire(key, settings.ADMISSION_TASK_TTL_SECONDS)
+            results = pipe.execute()
+
+        counts = results[-3 * len(tasks) + 1::3]
+        over_limit = [(user_id, task_id) for (user_id, task_id), in_flight in zip(tasks, counts) if in_flight > limit]
+        if not over_limit:
+            return {}
+        with client.pipeline(transaction=False) as pipe:
+            for user_id, task_id in over_limit:
+                pipe.zrem(self._key("user", user_id), task_id)
+            pipe.execute()
+        return {
+            task_id: AdmissionRejected(
+                "user_in_flight", f"O usuário já tem {limit} tarefas em andamento.", settings.ADMISSION_RETRY_AFTER_SECONDS
+            )
+            for _, task_id in over_limit
+        }
+
+    @staticmethod
+    def _seconds(value: float) -> int:
+        return max(1, math.ceil(value))
+
+    # --- Registro ---
+
+    def release(self, user_id: Optional[str], task_id: Optional[str]):
+        """Libera a vaga do usuário (tarefa terminada ou não enfileirada)."""
+        if not settings.ADMISSION_ENABLED or not settings.ADMISSION_MAX_USER_IN_FLIGHT or not user_id or not task_id:
+            return
+        try:
+            redis_connection.get_client().zrem(self._key("user", user_id), task_id)
+        except RedisError as e:
+            print(f"[ADMISSION] Falha ao liberar a vaga da tarefa {task_id}: {e}")
+
+    def task_finished(self, job_payload: dict):
+        """Chamado pelo worker ao fim de cada tarefa: libera a vaga e alimenta a taxa de processamento."""
+        self.release(job_payload.get("user_id"), job_payload.get("task_id"))
+        key = self._key("done", int(time.time()))
+        try:
+            with redis_connection.get_client().pipeline(transaction=False) as pipe:
+                pipe.incr(key)
+                pipe.expire(key, settings.ADMISSION_RATE_WINDOW_SECONDS * 2)
+                pipe.execute()
+        except RedisError as e:
+            print(f"[ADMISSION] Falha ao registrar a conclusão da tarefa {job_payload.get('task_id')}: {e}")
+
+
+admission_control = AdmissionController()
+
+
+def _collect_queue_metrics():
+    """Atualiza profundidade das filas e taxa de processamento a cada leitura do /metrics."""
+    from worker import broker
+    queue_names = [name for name in broker.get_declared_queues() if not name.endswith((".DQ", ".XQ"))]
+    admission_control.queue_depths(sorted(queue_names))
+    admission_control.processing_rate()
+
+
+metrics.register_collector(_collect_queue_metrics)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=admission_control._reset_after_fork)
@@ -0,0 +1,87 @@
+# services/cache/redis_connection.py
+import os
+import threading
+
+import redis
+import redis.asyncio
+
+from config import settings
+
+
+class RedisConnectionManager:
+    """
+    Ponto único de acesso ao Redis para os serviços (cache de sessões, status de tarefas etc.).
+    O cliente é criado sob demanda, uma vez por processo.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RedisConnectionManager, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._client = None
+            cls._instance._async_client = None
+            cls._instance._scripts = {}
+        return cls._instance
+
+    def get_client(self) -> redis.Redis:
+        """Retorna o cliente Redis do processo atual, criando-o sob demanda."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = redis.Redis.from_url(
+                        settings.REDIS_URL,
+                        socket_timeout=settings.REDIS_SOCKET_TIMEOUT_MS / 1000,
+                        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_MS / 1000,
+                        decode_responses=True,
+                    )
+        return self._client
+
+    def get_async_client(self) -> redis.asyncio.Redis:
+        """
+        Cliente redis.asyncio do processo atual, para as rotas assíncronas da API (pub/sub
+        dos eventos de tarefa). Criado sob demanda e usado apenas no loop de eventos do servidor.
+        """
+        if self._async_client is None:
+            self._async_client = redis.asyncio.Redis.from_url(
+                settings.REDIS_URL,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT_MS / 1000,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_MS / 1000,
+                decode_responses=True,
+            )
+        return self._async_client
+
+    def set_client(self, client):
+        """Substitui o cliente do processo (ex.: fakeredis em benchmarks)."""
+        with self._lock:
+            self._client = client
+            self._scripts = {}
+
+    def register_script(self, script: str):
+        """
+        Script Lua registrado no cliente atual (EVALSHA, com EVAL quando o Redis ainda não o conhece).
+        O cache acompanha o cliente: 'set_client' e o fork descartam os scripts do cliente anterior.
+        """
+        client = self.get_client()
+        with self._lock:
+            scripts = self._scripts.get(id(client))
+            if scripts is None or scripts[0] is not client:
+                scripts = self._scripts[id(client)] = (client, {})
+            registered = scripts[1].get(script)
+            if registered is None:
+                registered = scripts[1][script] = client.register_script(script)
+        return registered
+
+    def _reset_after_fork(self):
+        """Descarta o cliente herdado do processo pai; o filho cria o próprio no primeiro uso."""
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._scripts = {}
+
+
+redis_connection = RedisConnectionManager()
+
+# Processos filhos (ex.: workers do Dramatiq) não devem reutilizar as conexões do pai.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=redis_connection._reset_after_fork)
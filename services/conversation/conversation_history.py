@@ -1,43 +1,104 @@
+import atexit
 import json
 import os
+import threading
+import time
 from datetime import datetime, timezone
-from collections import defaultdict
 
 # 1. Importar as bibliotecas do MongoDB
-from pymongo import MongoClient, DESCENDING
+from bson import ObjectId
+from pymongo import DESCENDING
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+from redis.exceptions import RedisError, WatchError
 
 from config import settings
+from services.cache.redis_connection import redis_connection
+from services.cache.ttl_cache import TTLCache
+from services.database.mongo_connection import mongo_connection
+
+_DUPLICATE_KEY_ERROR = 11000
+_LAST_MESSAGES_PROJECTION = {
+    "role": 1,
+    "user_id": 1,
+    "message": 1,
+    "timestamp": 1
+}
+
+
+def _as_naive_utc(value: datetime) -> datetime:
+    """Normaliza datetimes com e sem tzinfo para comparação (UTC sem tzinfo)."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 class ConversationHistory:
     _instance = None
-    
-    # 2. Atributos para a conexão com o banco de dados
-    _client: MongoClient = None
-    _db = None
-    _collection: Collection = None
+    _collection_name = "conversation_history"
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ConversationHistory, cls).__new__(cls)
-            
-            # 3. Conectar ao MongoDB na primeira inicialização
-            try:
-                cls._client = MongoClient(settings.MONGO_URI)
-                cls._db = cls._client[settings.MONGO_DB]
-                cls._collection = cls._db["conversation_history"]
-                # 4. Criar índices para otimizar buscas por sessão e data
-                cls._collection.create_index("session_id")
-                cls._collection.create_index([("session_id", 1), ("timestamp", 1)])
-                print("[CONVERSATION_HISTORY] Conectado ao MongoDB com sucesso.")
-            except Exception as e:
-                print(f"[CONVERSATION_HISTORY] ERRO CRÍTICO: Não foi possível conectar ao MongoDB. {e}")
-                cls._collection = None
-
-            # O cache em memória pode ser mantido para otimizar leituras repetidas na mesma sessão
-            cls._instance._session_registry_cache = defaultdict(list)
+            # 2. A conexão é compartilhada (mongo_connection) e aberta sob demanda no primeiro uso.
+            cls._instance._session_registry_cache = cls._new_session_cache()
+            cls._instance._init_write_behind_state()
         return cls._instance
 
+    @staticmethod
+    def _new_session_cache() -> TTLCache:
+        # O cache em memória otimiza leituras repetidas do histórico completo na mesma sessão.
+        # É limitado (LRU + TTL) para não crescer indefinidamente em workers de longa duração.
+        return TTLCache(max_size=settings.SESSION_CACHE_MAX_SIZE, ttl_seconds=settings.SESSION_CACHE_TTL_SECONDS)
+
+    def _init_write_behind_state(self):
+        """Estado do modo write-behind: fila em memória, thread de flush e estatísticas."""
+        self._pending = []
+        self._pending_lock = threading.Condition()
+        self._flusher_thread = None
+        self._stopping = False
+        self._write_stats = {
+            "sync_inserts": 0,
+            "sync_insert_ms_total": 0.0,
+            "enqueued": 0,
+            "enqueue_ms_total": 0.0,
+            "flushes": 0,
+            "flushed_messages": 0,
+            "flush_ms_total": 0.0,
+            "flush_failures": 0,
+        }
+
+    @classmethod
+    def _reset_after_fork(cls):
+        """
+        Descarta o cache e a fila herdados do processo pai. A fila pertence ao pai, que fará o flush;
+        a thread de flush não sobrevive ao fork e é recriada no primeiro uso.
+        A conexão é tratada pelo mongo_connection.
+        """
+        if cls._instance is not None:
+            cls._instance._session_registry_cache = cls._new_session_cache()
+            cls._instance._init_write_behind_state()
+
+    def _get_collection(self) -> Collection:
+        """
+        Retorna a coleção de histórico usando o cliente compartilhado do processo
+        (ou None se a conexão falhar).
+        """
+        try:
+            # 3. Conectar ao MongoDB no primeiro uso
+            return mongo_connection.get_collection(self._collection_name, usage="history")
+        except Exception as e:
+            print(f"[CONVERSATION_HISTORY] ERRO CRÍTICO: Não foi possível conectar ao MongoDB. {e}")
+            return None
+
+    def ensure_indexes(self):
+        """Cria os índices da coleção. Executado no bootstrap (job.ensure_indexes), não no import."""
+        collection = self._get_collection()
+        if collection is None:
+            raise RuntimeError("Sem conexão com o MongoDB para criar os índices de conversation_history.")
+        # Índices para otimizar buscas por sessão e data
+        collection.create_index("session_id")
+        collection.create_index([("session_id", 1), ("timestamp", 1)])
+
     def log_message(
         self,
         session_id: str,
@@ -46,12 +107,15 @@ class ConversationHistory:
         user_id: str,
         message: str
     ):
-        """Registra uma nova mensagem diretamente no MongoDB."""
-        if self._collection is None:
-            print("[CONVERSATION_HISTORY] ERRO: Não é possível logar mensagem. Sem conexão com o MongoDB.")
-            return None
-            
+        """
+        Registra uma nova mensagem no MongoDB. Com CONVERSATION_WRITE_BEHIND ativo, a mensagem
+        vai para uma fila em memória e é gravada em lote por uma thread de flush.
+        A mensagem só entra no hot tier do Redis depois de gravada (ou aceita na fila): o
+        Redis não pode mostrar um histórico que o MongoDB nunca vai ter.
+        """
         entry = {
+            # O _id é gerado aqui para que leituras possam mesclar fila e banco sem duplicatas.
+            "_id": ObjectId(),
             "session_id": session_id,
             "execution_id": execution_id,
             "role": role,
@@ -59,90 +123,394 @@ class ConversationHistory:
             "message": message,
             "timestamp": datetime.now(timezone.utc)
         }
-        
+
+        # Limpa o cache para esta sessão para forçar a releitura na próxima vez
+        self._session_registry_cache.pop(session_id)
+
+        if settings.CONVERSATION_WRITE_BEHIND:
+            if self._enqueue(entry):
+                self._push_hot_tier(entry)
+            return entry
+
+        collection = self._get_collection()
+        if collection is None:
+            print("[CONVERSATION_HISTORY] ERRO: Não é possível logar mensagem. Sem conexão com o MongoDB.")
+            return None
+
+        started = time.perf_counter()
         try:
             # 5. Insere a nova mensagem como um documento. Esta operação é atômica.
-            self._collection.insert_one(entry)
-            
-            # Limpa o cache para esta sessão para forçar a releitura do DB na próxima vez
-            if session_id in self._session_registry_cache:
-                del self._session_registry_cache[session_id]
-
+            collection.insert_one(entry)
         except Exception as e:
             if settings.DEBUG:
                 print(f"[CONVERSATION_HISTORY] Erro ao salvar mensagem no MongoDB: {str(e)}")
-        
+        else:
+            self._push_hot_tier(entry)
+        finally:
+            self._write_stats["sync_inserts"] += 1
+            self._write_stats["sync_insert_ms_total"] += (time.perf_counter() - started) * 1000
+
         return entry
 
+    # --- Write-behind ---
+
+    def _enqueue(self, entry: dict) -> bool:
+        """
+        Coloca a mensagem na fila do write-behind. Se a fila estiver cheia, grava de forma síncrona.
+        Retorna False se a mensagem não entrou na fila nem foi gravada.
+        """
+        started = time.perf_counter()
+        with self._pending_lock:
+            if len(self._pending) >= settings.CONVERSATION_MAX_PENDING:
+                # Contrapressão: o banco não está acompanhando, não deixamos a memória crescer.
+                overflow = True
+            else:
+                overflow = False
+                self._pending.append(entry)
+                if len(self._pending) >= settings.CONVERSATION_FLUSH_BATCH_SIZE:
+                    self._pending_lock.notify()
+        if overflow:
+            return not self._insert_batch([entry])
+
+        self._ensure_flusher()
+        self._write_stats["enqueued"] += 1
+        self._write_stats["enqueue_ms_total"] += (time.perf_counter() - started) * 1000
+        return True
+
+    def _ensure_flusher(self):
+        if self._flusher_thread is None or not self._flusher_thread.is_alive():
+            with self._pending_lock:
+                if self._flusher_thread is None or not self._flusher_thread.is_alive():
+                    self._stopping = False
+                    self._flusher_thread = threading.Thread(
+                        target=self._flush_loop, name="conversation-history-flusher", daemon=True
+                    )
+                    self._flusher_thread.start()
+
+    def _flush_loop(self):
+        """Grava a fila em lote quando ela atinge o tamanho configurado ou quando o intervalo expira."""
+        interval = settings.CONVERSATION_FLUSH_INTERVAL_MS / 1000
+        backoff = False
+        while True:
+            with self._pending_lock:
+                if not self._stopping and (backoff or len(self._pending) < settings.CONVERSATION_FLUSH_BATCH_SIZE):
+                    self._pending_lock.wait(timeout=interval)
+                if self._stopping:
+                    # O flush final é feito por shutdown()
+                    return
+            # Se nada foi gravado (ex.: banco indisponível), aguarda um intervalo completo antes de tentar de novo.
+            backoff = self._flush_pending() == 0
+
+    def _flush_pending(self) -> int:
+        """
+        Grava um lote da fila. As mensagens só saem da fila depois de gravadas, para que
+        get_last_messages continue enxergando-as durante o flush.
+        """
+        with self._pending_lock:
+            batch = self._pending[:settings.CONVERSATION_FLUSH_BATCH_SIZE]
+        if not batch:
+            return 0
+
+        failed_ids = self._insert_batch(batch)
+
+        with self._pending_lock:
+            done_ids = {entry["_id"] for entry in batch} - failed_ids
+            self._pending = [entry for entry in self._pending if entry["_id"] not in done_ids]
+        return len(done_ids)
+
+    def _insert_batch(self, batch: list) -> set:
+        """Executa o insert_many do lote e retorna os _id que precisam de nova tentativa."""
+        collection = self._get_collection()
+        if collection is None:
+            self._write_stats["flush_failures"] += 1
+            return {entry["_id"] for entry in batch}
+
+        started = time.perf_counter()
+        failed_ids = set()
+        try:
+            collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Chave duplicada significa que a mensagem já foi gravada numa tentativa anterior.
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != _DUPLICATE_KEY_ERROR:
+                    failed_ids.add(batch[error["index"]]["_id"])
+        except Exception as e:
+            failed_ids = {entry["_id"] for entry in batch}
+            if settings.DEBUG:
+                print(f"[CONVERSATION_HISTORY] Erro no flush do write-behind: {str(e)}")
+
+        self._write_stats["flushes"] += 1
+        self._write_stats["flushed_messages"] += len(batch) - len(failed_ids)
+        self._write_stats["flush_ms_total"] += (time.perf_counter() - started) * 1000
+        if failed_ids:
+            self._write_stats["flush_failures"] += 1
+        return failed_ids
+
+    def _pending_for_session(self, session_id: str) -> list:
+        """
+        Cópias das mensagens da sessão ainda na fila, com o timestamp no mesmo formato que o
+        pymongo devolve por padrão (UTC sem tzinfo).
+        """
+        with self._pending_lock:
+            pending = [dict(entry) for entry in self._pending if entry["session_id"] == session_id]
+        for entry in pending:
+            entry["timestamp"] = _as_naive_utc(entry["timestamp"])
+        return pending
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Grava imediatamente tudo o que estiver na fila. Retorna True se a fila foi esvaziada."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._pending_lock:
+                if not self._pending:
+                    return True
+            if self._flush_pending() == 0:
+                # Nada foi gravado nesta rodada (ex.: banco indisponível); espera antes de tentar de novo.
+                time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+        with self._pending_lock:
+            remaining = len(self._pending)
+        if remaining:
+            print(f"[CONVERSATION_HISTORY] ERRO: {remaining} mensagens não puderam ser gravadas no encerramento.")
+        return remaining == 0
+
+    def shutdown(self, timeout: float = 10.0):
+        """Para a thread de flush e grava o que restou na fila. Chamado no encerramento do processo."""
+        with self._pending_lock:
+            self._stopping = True
+            self._pending_lock.notify_all()
+        self.flush(timeout=timeout)
+
+    def get_write_stats(self) -> dict:
+        """
+        Estatísticas de escrita do processo: tempo que o fluxo de orquestração ficou bloqueado por mensagem
+        em cada modo e o custo dos flushes em lote. O ganho por tarefa é ~2x a diferença entre os modos,
+        já que cada tarefa registra a pergunta e a resposta.
+        """
+        stats = dict(self._write_stats)
+        stats["sync_insert_ms_avg"] = stats["sync_insert_ms_total"] / stats["sync_inserts"] if stats["sync_inserts"] else 0.0
+        stats["enqueue_ms_avg"] = stats["enqueue_ms_total"] / stats["enqueued"] if stats["enqueued"] else 0.0
+        stats["flush_ms_per_message"] = stats["flush_ms_total"] / stats["flushed_messages"] if stats["flushed_messages"] else 0.0
+        with self._pending_lock:
+            stats["pending"] = len(self._pending)
+        return stats
+
+    # --- Leituras ---
+
+    @staticmethod
+    def _merge_with_pending(persisted: list, pending: list) -> list:
+        """Mescla documentos do banco com mensagens ainda na fila, sem duplicatas, em ordem cronológica."""
+        if not pending:
+            return persisted
+        seen_ids = {doc.get("_id") for doc in persisted}
+        merged = persisted + [entry for entry in pending if entry["_id"] not in seen_ids]
+        return sorted(merged, key=lambda doc: _as_naive_utc(doc["timestamp"]))
+
     def get_conversation_history(self, session_id: str) -> list:
         """Recupera o histórico completo de uma sessão diretamente do MongoDB."""
         # Primeiro, verifica o cache para evitar chamadas repetidas ao DB
-        if session_id in self._session_registry_cache:
-            return self._session_registry_cache[session_id]
+        cached = self._session_registry_cache.get(session_id)
+        if cached is not None:
+            return cached
 
-        if self._collection is None:
+        collection = self._get_collection()
+        if collection is None:
             return []
 
         try:
             # 6. Busca todos os documentos da sessão, ordenados por tempo
-            history_cursor = self._collection.find(
+            history_cursor = collection.find(
                 {"session_id": session_id}
             ).sort("timestamp", 1) # 1 para ordem ascendente
-            
-            history = list(history_cursor)
-            
+
+            history = self._merge_with_pending(list(history_cursor), self._pending_for_session(session_id))
+
             # Atualiza o cache
-            self._session_registry_cache[session_id] = history
+            self._session_registry_cache.set(session_id, history)
             return history
         except Exception as e:
             if settings.DEBUG:
                 print(f"[CONVERSATION_HISTORY] Erro ao buscar histórico no MongoDB: {str(e)}")
-        
+
         return []
 
     def get_last_messages(self, session_id: str, num_messages: int = 5) -> list:
-        """Recupera as últimas N mensagens de forma otimizada do MongoDB."""
-        if self._collection is None:
+        """
+        Recupera as últimas N mensagens da sessão. Lê primeiro a camada quente no Redis e
+        usa o MongoDB (mais as mensagens ainda na fila do write-behind) como fallback.
+        """
+        hot = self._read_hot_tier(session_id, num_messages)
+        if hot is not None:
+            return hot
+
+        # Busca o suficiente para também reabastecer a camada quente
+        fetch_size = max(num_messages, settings.CONVERSATION_HOT_TIER_SIZE) if self._hot_tier_enabled() else num_messages
+        messages = self._get_last_messages_from_db(session_id, fetch_size)
+        if messages is None:
             return []
-            
+
+        self._hydrate_hot_tier(session_id, messages)
+        return messages[-num_messages:]
+
+    def _get_last_messages_from_db(self, session_id: str, num_messages: int):
+        """Recupera as últimas N mensagens de forma otimizada do MongoDB (incluindo as ainda na fila)."""
+        collection = self._get_collection()
+        if collection is None:
+            return None
+
         try:
-            projection = {
-                "role": 1,
-                "user_id": 1,
-                "message": 1,
-                "timestamp": 1
-            }
-
-            history_cursor = self._collection.find(
+            history_cursor = collection.find(
                 {"session_id": session_id},
-                projection  # Aplicando a projeção
+                _LAST_MESSAGES_PROJECTION  # Aplicando a projeção
             ).sort("timestamp", DESCENDING).limit(num_messages)
-            
+
             # O resultado vem do mais novo para o mais antigo, então revertemos para a ordem cronológica
-            return list(reversed(list(history_cursor)))
+            persisted = list(reversed(list(history_cursor)))
+
+            pending = [
+                {key: entry[key] for key in ("_id", *_LAST_MESSAGES_PROJECTION)}
+                for entry in self._pending_for_session(session_id)
+            ]
+            return self._merge_with_pending(persisted, pending)[-num_messages:]
         except Exception as e:
             if settings.DEBUG:
                 print(f"[CONVERSATION_HISTORY] Erro ao buscar últimas mensagens no MongoDB: {str(e)}")
-        
-        return []
+
+        return None
+
+    # --- Camada quente (Redis) ---
+
+    @staticmethod
+    def _hot_tier_enabled() -> bool:
+        return settings.CONVERSATION_HOT_TIER_ENABLED and settings.CONVERSATION_HOT_TIER_SIZE > 0
+
+    @staticmethod
+    def _hot_tier_keys(session_id: str) -> tuple:
+        # A lista guarda as últimas mensagens; a flag indica que ela já reflete o MongoDB
+        # (a sessão pode ter menos mensagens do que o tamanho do buffer).
+        return f"conversation:recent:{session_id}", f"conversation:recent:{session_id}:hydrated"
+
+    @staticmethod
+    def _serialize_hot_entry(entry: dict) -> str:
+        return json.dumps({
+            "_id": str(entry["_id"]),
+            "role": entry["role"],
+            "user_id": entry["user_id"],
+            "message": entry["message"],
+            "timestamp": _as_naive_utc(entry["timestamp"]).isoformat(),
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _deserialize_hot_entry(raw: str) -> dict:
+        # Mesmo formato devolvido pelo MongoDB com _LAST_MESSAGES_PROJECTION
+        data = json.loads(raw)
+        data["_id"] = ObjectId(data["_id"])
+        data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+        return data
+
+    def _push_hot_tier(self, entry: dict):
+        """Acrescenta a mensagem ao buffer circular da sessão no Redis."""
+        if not self._hot_tier_enabled():
+            return
+        key, hydrated_key = self._hot_tier_keys(entry["session_id"])
+        ttl = settings.CONVERSATION_HOT_TIER_TTL_SECONDS
+        try:
+            pipe = redis_connection.get_client().pipeline(transaction=False)
+            pipe.rpush(key, self._serialize_hot_entry(entry))
+            pipe.ltrim(key, -settings.CONVERSATION_HOT_TIER_SIZE, -1)
+            pipe.expire(key, ttl)
+            pipe.expire(hydrated_key, ttl)
+            pipe.execute()
+        except RedisError as e:
+            if settings.DEBUG:
+                print(f"[CONVERSATION_HISTORY] Erro ao gravar na camada quente (Redis): {str(e)}")
+            # Evita servir um buffer incompleto depois que o Redis voltar
+            self._clear_hot_tier(entry["session_id"])
+
+    def _read_hot_tier(self, session_id: str, num_messages: int):
+        """Retorna as últimas N mensagens do Redis, ou None se for preciso consultar o MongoDB."""
+        if not self._hot_tier_enabled() or num_messages > settings.CONVERSATION_HOT_TIER_SIZE:
+            return None
+        key, hydrated_key = self._hot_tier_keys(session_id)
+        try:
+            pipe = redis_connection.get_client().pipeline(transaction=False)
+            pipe.lrange(key, -num_messages, -1)
+            pipe.exists(hydrated_key)
+            raw_messages, hydrated = pipe.execute()
+        except RedisError as e:
+            if settings.DEBUG:
+                print(f"[CONVERSATION_HISTORY] Erro ao ler a camada quente (Redis): {str(e)}")
+            return None
+
+        if not hydrated and len(raw_messages) < num_messages:
+            return None
+        return [self._deserialize_hot_entry(raw) for raw in raw_messages]
+
+    def _hydrate_hot_tier(self, session_id: str, messages: list):
+        """
+        Reabastece o buffer da sessão com o resultado do MongoDB, preservando mensagens
+        gravadas por outros processos enquanto a consulta acontecia.
+        """
+        if not self._hot_tier_enabled():
+            return
+        key, hydrated_key = self._hot_tier_keys(session_id)
+        ttl = settings.CONVERSATION_HOT_TIER_TTL_SECONDS
+        try:
+            with redis_connection.get_client().pipeline(transaction=True) as pipe:
+                pipe.watch(key)
+                current = [self._deserialize_hot_entry(raw) for raw in pipe.lrange(key, 0, -1)]
+                merged = self._merge_with_pending(list(messages), current)
+                merged = merged[-settings.CONVERSATION_HOT_TIER_SIZE:]
+
+                pipe.multi()
+                pipe.delete(key)
+                if merged:
+                    pipe.rpush(key, *[self._serialize_hot_entry(entry) for entry in merged])
+                pipe.expire(key, ttl)
+                pipe.set(hydrated_key, 1, ex=ttl)
+                pipe.execute()
+        except WatchError:
+            # Outro processo alterou o buffer; a próxima leitura tenta novamente.
+            pass
+        except RedisError as e:
+            if settings.DEBUG:
+                print(f"[CONVERSATION_HISTORY] Erro ao reabastecer a camada quente (Redis): {str(e)}")
+
+    def _clear_hot_tier(self, session_id: str):
+        if not self._hot_tier_enabled():
+            return
+        try:
+            redis_connection.get_client().delete(*self._hot_tier_keys(session_id))
+        except RedisError as e:
+            if settings.DEBUG:
+                print(f"[CONVERSATION_HISTORY] Erro ao limpar a camada quente (Redis): {str(e)}")
 
     def clear_session_history(self, session_id: str):
         """Remove todo o histórico de uma sessão do MongoDB."""
-        # Limpa o cache
-        if session_id in self._session_registry_cache:
-            del self._session_registry_cache[session_id]
+        # Limpa os caches e as mensagens da sessão que ainda não foram gravadas
+        self._session_registry_cache.pop(session_id)
+        self._clear_hot_tier(session_id)
+        with self._pending_lock:
+            self._pending = [entry for entry in self._pending if entry["session_id"] != session_id]
 
-        if self._collection is None:
+        collection = self._get_collection()
+        if collection is None:
             return
 
         try:
             # 8. Deleta todos os documentos que correspondem ao session_id
-            result = self._collection.delete_many({"session_id": session_id})
+            result = collection.delete_many({"session_id": session_id})
             if settings.DEBUG:
                 print(f"[CONVERSATION_HISTORY] Histórico para a sessão {session_id} limpo. {result.deleted_count} mensagens removidas.")
         except Exception as e:
             if settings.DEBUG:
                 print(f"[CONVERSATION_HISTORY] Erro ao limpar histórico no MongoDB: {str(e)}")
 
-# Instância global do logger de histórico
-conversation_history = ConversationHistory()
\ No newline at end of file
+# Instância global do logger de histórico. Nenhuma conexão é aberta aqui.
+conversation_history = ConversationHistory()
+
+# Garante que mensagens ainda na fila do write-behind sejam gravadas no encerramento normal do processo.
+atexit.register(conversation_history.shutdown)
+
+# Processos filhos (ex.: workers do Dramatiq) não devem herdar o cache do pai.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ConversationHistory._reset_after_fork)
@@ -0,0 +1,257 @@
+# services/database/mongo_connection.py
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from pymongo import MongoClient, monitoring
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.read_preferences import ReadPreference
+from pymongo.write_concern import WriteConcern
+
+from config import settings
+from services.monitoring.metrics import metrics, observe_phase
+
+_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def _parse_write_concern(value: str) -> Optional[WriteConcern]:
+    """Converte '1', '0', 'majority' etc. em WriteConcern. Vazio usa o padrão do servidor."""
+    if not value:
+        return None
+    return WriteConcern(w=int(value) if value.isdigit() else value)
+
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """
+    Coleta métricas do pool de conexões: quantos checkouts foram feitos, quanto tempo
+    as threads esperaram por uma conexão livre e quantos checkouts falharam.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple, float] = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_ms_total = 0.0
+            self.wait_ms_max = 0.0
+            self.connections_open = 0
+            self.pool_clears = 0
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        # O checkout é síncrono: início e fim acontecem na mesma thread.
+        return (event.address, threading.get_ident())
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._pending[self._key(event)] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            started = self._pending.pop(self._key(event), None)
+            self.checkouts += 1
+            if started is not None:
+                wait_ms = (time.perf_counter() - started) * 1000
+                self.wait_ms_total += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._pending.pop(self._key(event), None)
+            self.checkout_failures += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_ms_total": round(self.wait_ms_total, 3),
+                "wait_ms_max": round(self.wait_ms_max, 3),
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "connections_open": self.connections_open,
+                "pool_clears": self.pool_clears,
+            }
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """
+    Registra a duração de cada comando enviado ao MongoDB como fase 'db',
+    rotulada por coleção e comando (ex.: 'execution_events.insert').
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._targets: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        target = f"{collection}.{event.command_name}" if isinstance(collection, str) else event.command_name
+        with self._lock:
+            self._targets[(event.connection_id, event.request_id)] = target
+
+    def _finish(self, event, error: bool):
+        with self._lock:
+            target = self._targets.pop((event.connection_id, event.request_id), event.command_name)
+        observe_phase("db", target, event.duration_micros / 1_000_000, error=error)
+
+    def succeeded(self, event):
+        self._finish(event, error=False)
+
+    def failed(self, event):
+        self._finish(event, error=True)
+
+
+class MongoConnectionManager:
+    """
+    Ponto único de acesso ao MongoDB. Mantém um MongoClient (e portanto um pool)
+    por processo, compartilhado por todos os serviços. Cada serviço declara o seu
+    'uso', que define read preference e write concern.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MongoConnectionManager, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._client = None
+            cls._instance._collections = {}
+            cls._instance.pool_listener = PoolWaitListener()
+            cls._instance.command_listener = CommandTimingListener()
+        return cls._instance
+
+    def _usage_options(self, usage: str) -> dict:
+        """Read preference e write concern para cada tipo de uso."""
+        profiles = {
+            # Definições mudam pouco e toleram leitura de secundários.
+            "definitions": {
+                "read_preference": _READ_PREFERENCES.get(settings.MONGO_DEFINITIONS_READ_PREFERENCE),
+            },
+            # Logs de execução são volumosos e não precisam de confirmação da maioria.
+            "logs": {
+                "write_concern": _parse_write_concern(settings.MONGO_LOGS_WRITE_CONCERN),
+            },
+            "history": {
+                "write_concern": _parse_write_concern(settings.MONGO_HISTORY_WRITE_CONCERN),
+            },
+        }
+        return {k: v for k, v in profiles.get(usage, {}).items() if v is not None}
+
+    def get_client(self) -> MongoClient:
+        """Retorna o MongoClient do processo atual, criando-o sob demanda."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(
+                        settings.MONGO_URI,
+                        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+                        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS or None,
+                        waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+                        event_listeners=[self.pool_listener, self.command_listener],
+                    )
+                    print(f"[MONGO] Processo PID:{os.getpid()}: Cliente criado para o banco '{settings.MONGO_DB}'.")
+        return self._client
+
+    def set_client(self, client):
+        """
+        Substitui o cliente do processo (ex.: um cliente em memória em benchmarks).
+        As coleções memorizadas são descartadas.
+        """
+        with self._lock:
+            self._client = client
+            self._collections = {}
+
+    def get_database(self, usage: str = "default") -> Database:
+        """Retorna o banco configurado com as opções do uso informado."""
+        return self.get_client().get_database(settings.MONGO_DB, **self._usage_options(usage))
+
+    def get_collection(self, name: str, usage: str = "default") -> Collection:
+        """Retorna (e memoriza) a coleção configurada com as opções do uso informado."""
+        key = (name, usage)
+        collection = self._collections.get(key)
+        if collection is None:
+            collection = self.get_database(usage)[name]
+            self._collections[key] = collection
+        return collection
+
+    def get_pool_metrics(self) -> dict:
+        """Métricas do pool de conexões do processo atual."""
+        metrics = self.pool_listener.snapshot()
+        metrics["max_pool_size"] = settings.MONGO_MAX_POOL_SIZE
+        metrics["min_pool_size"] = settings.MONGO_MIN_POOL_SIZE
+        return metrics
+
+    def close(self):
+        """Fecha o cliente do processo atual (ex.: ao final de um job)."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._collections = {}
+
+    def _reset_after_fork(self):
+        """Descarta o cliente herdado do processo pai sem fechá-lo (ele pertence ao pai)."""
+        self._lock = threading.Lock()
+        self._client = None
+        self._collections = {}
+        self.pool_listener._lock = threading.Lock()
+        self.pool_listener.reset()
+        self.command_listener._lock = threading.Lock()
+        self.command_listener._targets = {}
+
+
+mongo_connection = MongoConnectionManager()
+
+
+def _collect_pool_metrics():
+    """Exporta as métricas do pool como gauges no /metrics."""
+    for key, value in mongo_connection.get_pool_metrics().items():
+        _POOL_GAUGE.set(value, metric=key)
+
+
+_POOL_GAUGE = metrics.gauge("agent_mongo_pool", "Estado do pool de conexões do MongoDB no processo.", ("metric",))
+metrics.register_collector(_collect_pool_metrics)
+
+# Processos filhos (ex.: workers do Dramatiq) não devem reutilizar o MongoClient do pai.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=mongo_connection._reset_after_fork)
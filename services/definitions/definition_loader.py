@@ -5,6 +5,7 @@ from typing import Dict, List, Tuple
 from models.schemas import ManagerSchema, AgentSchema, ToolSchema
 from .system_managers import MEMORY_MANAGER_DEFINITION, META_MANAGER_DEFINITION
 from config import settings
+from services.database.mongo_connection import mongo_connection
 
 class DefinitionLoader:
     _instance = None
@@ -14,17 +15,18 @@ class DefinitionLoader:
             cls._instance = super(DefinitionLoader, cls).__new__(cls)
         return cls._instance
 
+    def _reset_after_fork(self):
+        """Descarta o banco herdado do processo pai; o filho obtém o próprio no primeiro uso."""
+        self.db = None
+
     def _connect_if_needed(self):
         """
-        Garante que uma conexão com o MongoDB exista para o processo atual.
-        Se a conexão não foi criada ainda neste processo, ela é estabelecida aqui.
+        Garante que o processo atual tenha acesso ao banco de definições.
+        Usa o cliente compartilhado (mongo_connection), com leitura permitida em secundários.
         """
-        if not hasattr(self, 'client') or self.client is None:
+        if getattr(self, 'db', None) is None:
             try:
-                self.client = pymongo.MongoClient(settings.MONGO_URI)
-                self.db = self.client[settings.MONGO_DB]
-                # Este log mostrará que cada processo worker está criando sua própria conexão
-                print(f"Processo PID:{os.getpid()}: Conectado com sucesso ao MongoDB no banco '{settings.MONGO_DB}'")
+                self.db = mongo_connection.get_database(usage="definitions")
             except pymongo.errors.ConnectionFailure as e:
                 print(f"Processo PID:{os.getpid()}: Falha ao conectar ao MongoDB: {e}")
                 raise RuntimeError(f"Não foi possível conectar ao MongoDB: {e}")
@@ -103,4 +105,8 @@ class DefinitionLoader:
         
         return all_managers, all_agents_dict
 
-definition_loader = DefinitionLoader()
\ No newline at end of file
+definition_loader = DefinitionLoader()
+
+# Processos filhos (ex.: workers do Dramatiq) não devem reutilizar o banco do pai.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=definition_loader._reset_after_fork)
\ No newline at end of file
@@ -7,7 +7,14 @@ LIST_CAPABILITIES_TOOL = ToolSchema(
     parameters_mandatory=[],
     isApi=False,
     isLLM=False,
-    isActive=True
+    isActive=True,
+    routing_hints=[
+        "O que você pode fazer?",
+        "Quais são as suas funcionalidades?",
+        "Como você pode me ajudar?",
+        "Quais ferramentas você tem?",
+        "Ajuda",
+    ]
 )
 META_MANAGER_DEFINITION = ManagerSchema(
     manager_id="SYS_META_MANAGER",
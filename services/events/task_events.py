@@ -0,0 +1,127 @@
+# services/events/task_events.py
+import contextvars
+import json
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional
+
+from config import settings
+from services.cache.redis_connection import redis_connection
+
+# Evento que encerra a tarefa (sucesso ou falha); quem escuta pode parar depois dele.
+RESULT_EVENT = "result"
+
+
+class TaskSubscription:
+    """
+    Inscrição assíncrona (redis.asyncio) no canal de eventos de uma tarefa, usada pelas rotas
+    async da API: a espera não ocupa uma thread do threadpool. Deve ser aberta antes do envio da tarefa.
+    """
+
+    def __init__(self, pubsub, channel: str):
+        self._pubsub = pubsub
+        self.channel = channel
+
+    async def events(self, timeout: float, keepalive: Optional[float] = None) -> AsyncIterator[Optional[dict]]:
+        """
+        Gera os eventos da tarefa até o evento 'result' ou até 'timeout' segundos.
+        Com 'keepalive', gera None a cada intervalo sem eventos (para o SSE manter a conexão).
+        """
+        deadline = time.monotonic() + timeout
+        last_yield = time.monotonic()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # Espera curta: abaixo do socket_timeout do cliente e permite checar o prazo
+            message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, 1.0))
+            if message is None or message.get("type") != "message":
+                if keepalive and time.monotonic() - last_yield >= keepalive:
+                    last_yield = time.monotonic()
+                    yield None
+                continue
+            event = json.loads(message["data"])
+            last_yield = time.monotonic()
+            yield event
+            if event.get("event") == RESULT_EVENT:
+                return
+
+    async def wait_for_result(self, timeout: float) -> Optional[dict]:
+        """Espera o evento 'result' da tarefa. Retorna None se o prazo acabar antes."""
+        async for event in self.events(timeout):
+            if event and event.get("event") == RESULT_EVENT:
+                return event
+        return None
+
+    async def close(self):
+        try:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.aclose()
+        except Exception as e:
+            print(f"[TASK_EVENTS] Falha ao encerrar a inscrição em {self.channel}: {e}")
+
+
+class TaskEventStream:
+    """
+    Publica o progresso de uma tarefa (manager escolhido, ferramenta em execução,
+    tokens da resposta final e o resultado) no pub/sub do Redis, canal
+    TASK_EVENTS_CHANNEL_PREFIX + task_id. Só tarefas enviadas com 'stream_events' no
+    payload publicam o progresso; o 'result' é publicado sempre, para quem se inscreveu
+    depois (submissão duplicada do mesmo task_id).
+
+    A tarefa atual fica num contextvar, propagado para as threads de asyncio.to_thread;
+    o Orquestrador e os executores apenas chamam 'emit'.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskEventStream, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def channel(task_id: str) -> str:
+        return f"{settings.TASK_EVENTS_CHANNEL_PREFIX}{task_id}"
+
+    @contextmanager
+    def bind(self, job_payload: dict):
+        """Ativa a publicação para a tarefa do payload enquanto o bloco executa (se ela pediu eventos)."""
+        if not job_payload.get("stream_events"):
+            yield
+            return
+        token = _current_task.set(job_payload.get("task_id"))
+        try:
+            yield
+        finally:
+            _current_task.reset(token)
+
+    def is_streaming(self) -> bool:
+        return _current_task.get() is not None
+
+    def emit(self, event: str, **data):
+        """Publica um evento da tarefa atual. Falhas no Redis não interrompem a tarefa."""
+        task_id = _current_task.get()
+        if task_id is None:
+            return
+        self.publish(task_id, event, **data)
+
+    def publish(self, task_id: str, event: str, **data):
+        """Publica um evento de qualquer tarefa, mesmo sem 'stream_events' (ex.: o 'result' para uma submissão duplicada)."""
+        message = json.dumps({"event": event, "task_id": task_id, "ts": time.time(), "data": data},
+                             ensure_ascii=False, default=str)
+        try:
+            redis_connection.get_client().publish(self.channel(task_id), message)
+        except Exception as e:
+            print(f"[TASK_EVENTS] Falha ao publicar '{event}' da tarefa {task_id}: {e}")
+
+    async def subscribe(self, task_id: str) -> TaskSubscription:
+        """Abre a inscrição no canal da tarefa (uma conexão do Redis enquanto estiver aberta)."""
+        pubsub = redis_connection.get_async_client().pubsub()
+        channel = self.channel(task_id)
+        await pubsub.subscribe(channel)
+        return TaskSubscription(pubsub, channel)
+
+
+_current_task: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("task_events_task_id", default=None)
+
+task_events = TaskEventStream()
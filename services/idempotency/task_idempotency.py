@@ -0,0 +1,237 @@
+# services/idempotency/task_idempotency.py
+import json
+import time
+from typing import Dict, List, Optional
+
+from redis.exceptions import RedisError
+
+from config import settings
+from services.cache.redis_connection import redis_connection
+from services.monitoring.metrics import metrics
+
+# Decisões de 'acquire' para uma mensagem da tarefa
+RUN = "run"              # executar agora
+WAIT = "wait"            # outra tarefa da sessão vem antes: reenviar com atraso
+DUPLICATE = "duplicate"  # a mesma tarefa está em execução por outra mensagem
+DONE = "done"            # a tarefa já terminou: descartar a mensagem
+
+IDEMPOTENCY_EVENTS = metrics.counter(
+    "agent_idempotency_events_total",
+    "Duplicatas e esperas detectadas: duplicate_submission (API), duplicate_message, already_done e session_wait (worker).",
+    ("outcome",),
+)
+
+# Decide se a mensagem de uma tarefa pode executar.
+# 1) Lease por tarefa: o dono é a submissão (retries e reentregas da mesma mensagem têm o
+#    mesmo dono e podem retomar; outra submissão com o mesmo task_id é duplicata).
+# 2) Ordem da sessão: só executa a tarefa mais antiga da sessão. Uma tarefa à frente que
+#    não está executando e foi enfileirada há mais de 'stale' segundos é descartada da fila
+#    (mensagem perdida ou lease expirado de um worker que caiu).
+# ARGV: prefixo, task_id, dono, session_id, agora (s), validade (s)
+_ACQUIRE_SCRIPT = """
+local prefix, task_id, owner, session = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local now, ttl = tonumber(ARGV[5]), tonumber(ARGV[6])
+local lease = prefix .. 'lease:' .. task_id
+local holder = redis.call('GET', lease)
+if holder and holder ~= owner then
+    return 'duplicate'
+end
+
+if session ~= '' then
+    local order = prefix .. 'session:' .. session
+    while true do
+        local head = redis.call('ZRANGE', order, 0, 0, 'WITHSCORES')
+        if #head == 0 or head[1] == task_id then
+            break
+        end
+        if redis.call('EXISTS', prefix .. 'lease:' .. head[1]) == 1 or tonumber(head[2]) > now - ttl then
+            return 'wait'
+        end
+        redis.call('ZREM', order, head[1])
+    end
+end
+
+redis.call('SET', lease, owner, 'EX', ttl)
+return 'run'
+"""
+
+# Remove o lease apenas se ainda pertence a esta submissão
+# KEYS: lease; ARGV: dono
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class TaskGuard:
+    """
+    Idempotência e ordem por sessão das tarefas.
+
+    Na API, 'register_submission' grava o task_id com SET NX: uma segunda submissão do
+    mesmo task_id (retry do cliente após timeout) não é enfileirada e a rota devolve o
+    resultado guardado ou acompanha a execução em andamento. A tarefa também entra na
+    fila da sessão (ZSET por enqueued_at).
+
+    No worker, 'acquire' decide se a mensagem executa: o lease por task_id impede duas
+    execuções da mesma tarefa, e a fila da sessão faz as mensagens de uma sessão rodarem
+    na ordem de chegada em vez de intercaladas. 'release' devolve o lease ao fim de cada
+    tentativa e tira a tarefa da fila da sessão quando ela termina de vez.
+
+    Falhas do Redis liberam a execução: a proteção é contra duplicatas, não um requisito.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskGuard, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def _key(*parts: str) -> str:
+        return settings.IDEMPOTENCY_KEY_PREFIX + ":".join(parts)
+
+    @staticmethod
+    def _owner(job_payload: dict) -> str:
+        return job_payload.get("submission_id") or job_payload["task_id"]
+
+    # --- API ---
+
+    def register_submission(self, job_payload: dict) -> Optional[dict]:
+        """
+        Registra a submissão da tarefa. Retorna None se for nova; se o task_id já foi
+        submetido, retorna o registro da primeira submissão (com o session_id dela).
+        """
+        if not settings.IDEMPOTENCY_ENABLED:
+            return None
+        task_id = job_payload["task_id"]
+        record = {"session_id": job_payload.get("session_id"), "submission_id": job_payload.get("submission_id")}
+        try:
+            client = redis_connection.get_client()
+            key = self._key("submission", task_id)
+            if not client.set(key, json.dumps(record), nx=True, ex=settings.TASK_STATUS_TTL_SECONDS):
+                IDEMPOTENCY_EVENTS.inc(outcome="duplicate_submission")
+                existing = client.get(key)
+                return json.loads(existing) if existing else record
+            if settings.SESSION_ORDERING_ENABLED and job_payload.get("session_id"):
+                order = self._key("session", job_payload["session_id"])
+                with client.pipeline(transaction=False) as pipe:
+                    pipe.zadd(order, {task_id: job_payload.get("enqueued_at") or time.time()}, nx=True)
+                    pipe.expire(order, settings.TASK_STATUS_TTL_SECONDS)
+                    pipe.execute()
+        except RedisError as e:
+            print(f"[IDEMPOTENCY] Falha ao registrar a submissão da tarefa {task_id}: {e}")
+        return None
+
+    def register_submissions(self, job_payloads: List[dict]) -> Dict[str, dict]:
+        """
+        'register_submission' de várias tarefas com duas idas ao Redis (POST /ask/batch).
+        Retorna {task_id: registro da primeira submissão} apenas para as duplicadas.
+        """
+        if not settings.IDEMPOTENCY_ENABLED or not job_payloads:
+            return {}
+        duplicates = {}
+        try:
+            client = redis_connection.get_client()
+            with client.pipeline(transaction=False) as pipe:
+                for job_payload in job_payloads:
+                    record = {"session_id": job_payload.get("session_id"), "submission_id": job_payload.get("submission_id")}
+                    pipe.set(self._key("submission", job_payload["task_id"]), json.dumps(record),
+                             nx=True, ex=settings.TASK_STATUS_TTL_SECONDS)
+                created = pipe.execute()
+
+            repeated = [job_payload for job_payload, was_created in zip(job_payloads, created) if not was_created]
+            with client.pipeline(transaction=False) as pipe:
+                # Primeiro os registros das duplicadas, depois a fila da sessão das novas
+                for job_payload in repeated:
+                    pipe.get(self._key("submission", job_payload["task_id"]))
+                for job_payload, was_created in zip(job_payloads, created):
+                    if was_created and settings.SESSION_ORDERING_ENABLED and job_payload.get("session_id"):
+                        order = self._key("session", job_payload["session_id"])
+                        pipe.zadd(order, {job_payload["task_id"]: job_payload.get("enqueued_at") or time.time()}, nx=True)
+                        pipe.expire(order, settings.TASK_STATUS_TTL_SECONDS)
+                results = pipe.execute()
+
+            for job_payload, existing in zip(repeated, results):
+                duplicates[job_payload["task_id"]] = (
+                    json.loads(existing) if existing else {"session_id": job_payload.get("session_id")}
+                )
+        except RedisError as e:
+            print(f"[IDEMPOTENCY] Falha ao registrar as submissões do lote: {e}")
+        if duplicates:
+            IDEMPOTENCY_EVENTS.inc(len(duplicates), outcome="duplicate_submission")
+        return duplicates
+
+    def forget_submission(self, job_payload: dict):
+        """Desfaz 'register_submission' de uma tarefa que não foi enfileirada (o cliente pode reenviar)."""
+        if not settings.IDEMPOTENCY_ENABLED:
+            return
+        try:
+            with redis_connection.get_client().pipeline(transaction=False) as pipe:
+                pipe.delete(self._key("submission", job_payload["task_id"]))
+                if job_payload.get("session_id"):
+                    pipe.zrem(self._key("session", job_payload["session_id"]), job_payload["task_id"])
+                pipe.execute()
+        except RedisError as e:
+            print(f"[IDEMPOTENCY] Falha ao remover a submissão da tarefa {job_payload['task_id']}: {e}")
+
+    # --- Worker ---
+
+    def acquire(self, job_payload: dict, already_done: bool = False) -> str:
+        """
+        RUN, WAIT, DUPLICATE ou DONE para esta mensagem da tarefa.
+        'already_done' indica que o estado guardado da tarefa já é final (consultado por quem chama).
+        """
+        if not settings.IDEMPOTENCY_ENABLED:
+            return RUN
+        task_id = job_payload.get("task_id")
+        if not task_id:
+            return RUN
+        if already_done:
+            IDEMPOTENCY_EVENTS.inc(outcome="already_done")
+            self._leave_session(job_payload)
+            return DONE
+        session_id = job_payload.get("session_id") if settings.SESSION_ORDERING_ENABLED else None
+        try:
+            decision = redis_connection.register_script(_ACQUIRE_SCRIPT)(args=[
+                settings.IDEMPOTENCY_KEY_PREFIX, task_id, self._owner(job_payload), session_id or "",
+                time.time(), settings.IDEMPOTENCY_LEASE_TTL_SECONDS
+            ])
+        except RedisError as e:
+            print(f"[IDEMPOTENCY] Redis indisponível, tarefa {task_id} executada sem lease: {e}")
+            return RUN
+        if isinstance(decision, bytes):
+            decision = decision.decode()
+        if decision == DUPLICATE:
+            IDEMPOTENCY_EVENTS.inc(outcome="duplicate_message")
+        elif decision == WAIT:
+            IDEMPOTENCY_EVENTS.inc(outcome="session_wait")
+        return decision
+
+    def release(self, job_payload: dict, finished: bool):
+        """
+        Fim de uma tentativa: devolve o lease. Com 'finished', tira a tarefa da fila da
+        sessão e a próxima da sessão pode executar; sem ele (a tentativa falhou e o
+        Dramatiq vai repetir), a tarefa continua à frente das demais.
+        """
+        if not settings.IDEMPOTENCY_ENABLED or not job_payload.get("task_id"):
+            return
+        try:
+            redis_connection.register_script(_RELEASE_LEASE_SCRIPT)(keys=[self._key("lease", job_payload["task_id"])], args=[self._owner(job_payload)])
+        except RedisError as e:
+            # O lease expira sozinho em IDEMPOTENCY_LEASE_TTL_SECONDS
+            print(f"[IDEMPOTENCY] Falha ao liberar o lease da tarefa {job_payload['task_id']}: {e}")
+        if finished:
+            self._leave_session(job_payload)
+
+    def _leave_session(self, job_payload: dict):
+        if not job_payload.get("session_id"):
+            return
+        try:
+            redis_connection.get_client().zrem(self._key("session", job_payload["session_id"]), job_payload["task_id"])
+        except RedisError as e:
+            print(f"[IDEMPOTENCY] Falha ao remover a tarefa {job_payload['task_id']} da fila da sessão: {e}")
+
+
+task_guard = TaskGuard()
@@ -0,0 +1,344 @@
+# services/llm/backends.py
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+from config import settings
+
+
+class LLMUsage:
+    """Contagem de tokens com os mesmos nomes do usage_metadata do Gemini."""
+
+    def __init__(self, prompt_token_count: int = 0, candidates_token_count: int = 0, total_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = total_token_count or prompt_token_count + candidates_token_count
+
+    def to_dict(self) -> dict:
+        return {
+            "prompt_token_count": self.prompt_token_count,
+            "candidates_token_count": self.candidates_token_count,
+            "total_token_count": self.total_token_count,
+        }
+
+
+class LLMResponse:
+    def __init__(self, text: str, usage: Optional[LLMUsage] = None):
+        self.text = text
+        self.usage = usage
+
+
+class LLMBackend(ABC):
+    """Interface entre o GeminiAdapter e quem de fato gera o texto."""
+    name = ""
+
+    @abstractmethod
+    def generate(self, model: str, prompt: str, system_instruction: str, operation: str) -> LLMResponse:
+        pass
+
+    def generate_stream(self, model: str, prompt: str, system_instruction: str, operation: str,
+                        on_chunk: Callable[[str], None]) -> LLMResponse:
+        """
+        Igual a 'generate', mas entrega o texto em pedaços a 'on_chunk' à medida que é gerado.
+        Backends sem streaming entregam o texto inteiro de uma vez.
+        """
+        response = self.generate(model, prompt, system_instruction, operation)
+        if response.text:
+            on_chunk(response.text)
+        return response
+
+
+class GeminiBackend(LLMBackend):
+    """Chama a API do Gemini (comportamento original do GeminiAdapter)."""
+    name = "gemini"
+
+    def __init__(self):
+        # Importado aqui: os backends locais não dependem do SDK do Gemini.
+        import google.generativeai as genai
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        self._genai = genai
+
+    @staticmethod
+    def _usage(response) -> Optional[LLMUsage]:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return None
+        return LLMUsage(
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+            getattr(usage, "total_token_count", 0) or 0,
+        )
+
+    def generate(self, model: str, prompt: str, system_instruction: str, operation: str) -> LLMResponse:
+        generative_model = self._genai.GenerativeModel(model, system_instruction=system_instruction)
+        response = generative_model.generate_content(prompt)
+        return LLMResponse(response.text, self._usage(response))
+
+    def generate_stream(self, model: str, prompt: str, system_instruction: str, operation: str,
+                        on_chunk: Callable[[str], None]) -> LLMResponse:
+        generative_model = self._genai.GenerativeModel(model, system_instruction=system_instruction)
+        response = generative_model.generate_content(prompt, stream=True)
+        parts = []
+        for chunk in response:
+            text = chunk.text if chunk.parts else ""
+            if text:
+                parts.append(text)
+                on_chunk(text)
+        # O usage_metadata fica completo depois de consumir o stream inteiro
+        return LLMResponse("".join(parts), self._usage(response))
+
+
+# Roteiro padrão do backend simulado: um manager, uma ferramenta, resposta final.
+# Cada operação escolhe a resposta pelo número de vezes que 'marker' aparece no prompt,
+# ou seja, pelo passo em que a tarefa está (a última resposta se repete).
+DEFAULT_SCRIPT = {
+    "seed": 42,
+    "operations": {
+        "delegator": {
+            "marker": "[ORCHESTRATOR_THOUGHT]:",
+            "latency": {"distribution": "lognormal", "median_ms": 700, "sigma": 0.35},
+            "responses": [
+                '{"thought": "Preciso consultar o especialista.", "decision": "call_manager", '
+                '"manager_id": "{manager_id}", "new_question": "Responda à pergunta do usuário."}',
+                '{"thought": "Já tenho o necessário.", "decision": "final_answer"}',
+            ],
+        },
+        "react": {
+            "marker": "[OBSERVATION]:",
+            "latency": {"distribution": "lognormal", "median_ms": 900, "sigma": 0.35},
+            "responses": [
+                '[THOUGHT]: Vou usar a ferramenta disponível.\n[ACTION]: {"tool_name": "{tool_name}", "params": {}}',
+                "[THOUGHT]: Tenho o resultado.\n[FINAL_ANSWER]: Resultado obtido com a ferramenta {tool_name}.",
+            ],
+        },
+        "consolidate": {
+            "latency": {"distribution": "lognormal", "median_ms": 1200, "sigma": 0.3},
+            "responses": ["Aqui está a resposta consolidada para a sua pergunta."],
+        },
+        "default": {
+            "latency": {"distribution": "fixed", "median_ms": 300},
+            "responses": ["Resposta simulada."],
+        },
+    },
+}
+
+# Placeholders das respostas roteirizadas, preenchidos com o primeiro valor encontrado no prompt.
+_PLACEHOLDER_PATTERNS = {
+    "manager_id": re.compile(r'"manager_id":\s*"([^"]+)"'),
+    "tool_name": re.compile(r"^\s*- (\w+)\(", re.MULTILINE),
+}
+
+
+class ScriptedBackend(LLMBackend):
+    """
+    LLM simulado para testes de carga: devolve respostas roteirizadas por operação
+    (delegator, react, consolidate...) após uma latência sorteada da distribuição configurada.
+    O roteiro padrão é DEFAULT_SCRIPT; um arquivo JSON com o mesmo formato pode substituí-lo.
+    """
+    name = "scripted"
+
+    def __init__(self, script: Optional[dict] = None, time_scale: float = 1.0):
+        self.script = script or DEFAULT_SCRIPT
+        self.time_scale = time_scale
+        self._random = random.Random(self.script.get("seed"))
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+
+    @classmethod
+    def from_file(cls, path: str, time_scale: float = 1.0) -> "ScriptedBackend":
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(json.load(file), time_scale)
+
+    def _operation_script(self, operation: str) -> dict:
+        operations = self.script["operations"]
+        return operations.get(operation) or operations["default"]
+
+    def _sample_latency_ms(self, latency: dict) -> float:
+        distribution = latency.get("distribution", "fixed")
+        median_ms = latency.get("median_ms", 0)
+        with self._lock:
+            if distribution == "lognormal":
+                # median_ms é a mediana; sigma controla a cauda (p99 ≈ mediana * e^(2.33*sigma))
+                return self._random.lognormvariate(0, latency.get("sigma", 0.3)) * median_ms
+            if distribution == "normal":
+                return max(0.0, self._random.gauss(median_ms, latency.get("stddev_ms", median_ms * 0.1)))
+            if distribution == "uniform":
+                return self._random.uniform(latency.get("min_ms", 0), latency.get("max_ms", median_ms * 2))
+        return median_ms
+
+    @staticmethod
+    def _fill_placeholders(template: str, prompt: str) -> str:
+        text = template
+        for name, pattern in _PLACEHOLDER_PATTERNS.items():
+            placeholder = "{" + name + "}"
+            if placeholder in text:
+                match = pattern.search(prompt)
+                text = text.replace(placeholder, match.group(1) if match else "")
+        return text
+
+    def _respond(self, prompt: str, operation: str) -> tuple:
+        """Escolhe a resposta roteirizada e sorteia a latência (ms) da chamada."""
+        operation_script = self._operation_script(operation)
+        responses = operation_script["responses"]
+        marker = operation_script.get("marker")
+        step = prompt.count(marker) if marker else 0
+        text = self._fill_placeholders(responses[min(step, len(responses) - 1)], prompt)
+        latency_ms = self._sample_latency_ms(operation_script.get("latency", {})) * self.time_scale
+
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        return text, latency_ms
+
+    def generate(self, model: str, prompt: str, system_instruction: str, operation: str) -> LLMResponse:
+        text, latency_ms = self._respond(prompt, operation)
+        if latency_ms > 0:
+            time.sleep(latency_ms / 1000)
+        # Estimativa grosseira (4 caracteres por token), só para alimentar as métricas.
+        return LLMResponse(text, LLMUsage(len(prompt) // 4, len(text) // 4))
+
+    def generate_stream(self, model: str, prompt: str, system_instruction: str, operation: str,
+                        on_chunk: Callable[[str], None]) -> LLMResponse:
+        """Entrega a resposta palavra a palavra, com a latência sorteada distribuída entre os pedaços."""
+        text, latency_ms = self._respond(prompt, operation)
+        chunks = re.findall(r"\S+\s*", text) or [text]
+        for chunk in chunks:
+            if latency_ms > 0:
+                time.sleep(latency_ms / len(chunks) / 1000)
+            on_chunk(chunk)
+        return LLMResponse(text, LLMUsage(len(prompt) // 4, len(text) // 4))
+
+
+# Trechos do prompt que mudam a cada execução e não devem alterar a chave da gravação.
+_VOLATILE_PATTERNS = [
+    re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}"),  # current_date
+    re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"),  # uuids (sessão, tarefa)
+    re.compile(r"exec_[0-9a-f]{8}"),
+    # chat_history entra no prompt como repr dos documentos do MongoDB
+    re.compile(r"datetime\.datetime\([^)]*\)"),
+    re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?"),
+    re.compile(r"ObjectId\('[0-9a-f]{24}'\)"),
+]
+
+
+def prompt_key(model: str, system_instruction: str, prompt: str) -> str:
+    """Hash do prompt normalizado: a mesma pergunta gera a mesma chave em execuções diferentes."""
+    normalized = prompt
+    for pattern in _VOLATILE_PATTERNS:
+        normalized = pattern.sub("<volatile>", normalized)
+    raw = "\x1f".join([model, system_instruction or "", normalized])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Grava (mode='record') as trocas reais com outro backend em JSON-lines, indexadas
+    pelo hash do prompt, e as reproduz offline (mode='replay'). No replay, prompts não
+    gravados caem no 'fallback' (se houver) ou geram erro.
+    """
+
+    def __init__(self, path: str, mode: str, inner: Optional[LLMBackend] = None,
+                 fallback: Optional[LLMBackend] = None, replay_latency: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo de gravação inválido: '{mode}'")
+        if mode == "record" and inner is None:
+            raise ValueError("O modo 'record' precisa de um backend real para gravar.")
+        self.name = mode
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.fallback = fallback
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._recordings: Dict[str, dict] = self._load()
+        self.misses = 0
+
+    def _load(self) -> Dict[str, dict]:
+        recordings = {}
+        if not os.path.exists(self.path):
+            return recordings
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["key"]] = entry  # a gravação mais recente prevalece
+        return recordings
+
+    def _append(self, entry: dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._recordings[entry["key"]] = entry
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def generate(self, model: str, prompt: str, system_instruction: str, operation: str) -> LLMResponse:
+        key = prompt_key(model, system_instruction, prompt)
+
+        if self.mode == "replay":
+            entry = self._recordings.get(key)
+            if entry is None:
+                with self._lock:
+                    self.misses += 1
+                if self.fallback is None:
+                    raise LookupError(f"Nenhuma gravação para o prompt {key[:12]} (operação '{operation}').")
+                return self.fallback.generate(model, prompt, system_instruction, operation)
+            if self.replay_latency and entry.get("latency_ms"):
+                time.sleep(entry["latency_ms"] / 1000)
+            usage = LLMUsage(**entry["usage"]) if entry.get("usage") else None
+            return LLMResponse(entry["text"], usage)
+
+        started = time.perf_counter()
+        response = self.inner.generate(model, prompt, system_instruction, operation)
+        self._append({
+            "key": key,
+            "operation": operation,
+            "model": model,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+            "prompt_preview": prompt.strip()[:200],
+            "text": response.text,
+            "usage": response.usage.to_dict() if response.usage else None,
+        })
+        return response
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _build_backend() -> LLMBackend:
+    backend_name = settings.LLM_BACKEND
+    if backend_name == "gemini":
+        return GeminiBackend()
+    if backend_name == "scripted":
+        if settings.LLM_SCRIPT_PATH:
+            return ScriptedBackend.from_file(settings.LLM_SCRIPT_PATH, settings.LLM_LATENCY_SCALE)
+        return ScriptedBackend(time_scale=settings.LLM_LATENCY_SCALE)
+    if backend_name == "record":
+        return RecordReplayBackend(settings.LLM_RECORDINGS_PATH, "record", inner=GeminiBackend())
+    if backend_name == "replay":
+        return RecordReplayBackend(settings.LLM_RECORDINGS_PATH, "replay", replay_latency=settings.LLM_REPLAY_LATENCY)
+    raise ValueError(f"LLM_BACKEND desconhecido: '{backend_name}'")
+
+
+def get_llm_backend() -> LLMBackend:
+    """Retorna o backend do processo, escolhido por LLM_BACKEND e criado no primeiro uso."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _build_backend()
+    return _backend
+
+
+def set_llm_backend(backend: Optional[LLMBackend]):
+    """Substitui o backend do processo (ex.: benchmarks). None volta a usar LLM_BACKEND."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -1,18 +1,22 @@
 # services/llm/gemini_adapter.py
-import google.generativeai as genai
 from datetime import datetime
 from models.schemas import ExecutionContext, ManagerSchema, ToolResult
 from typing import List
 from config import settings
+from services.events.task_events import task_events
+from services.llm.backends import get_llm_backend
+from services.monitoring.metrics import LLM_CALLS, record_llm_tokens, track_phase
+from services.monitoring.tracing import tracer
+from services.routing.catalog_pruning import CatalogPruner
 import json
 import logging
 import re
 
 class GeminiAdapter:
     def __init__(self):
-        genai.configure(api_key=settings.GEMINI_API_KEY)
         self.model = settings.GEMINI_MODEL
         self.logger = logging.getLogger(__name__)
+        self.catalog_pruner = CatalogPruner()
         self.system_instruction = self._load_system_instruction()
 
     def _load_system_instruction(self) -> str:
@@ -60,15 +64,34 @@ class GeminiAdapter:
 
         return simplified_list
 
-    def generate(self, prompt: str, system_instruction: str = None) -> str:
+    def generate(self, prompt: str, system_instruction: str = None, operation: str = "generate", on_chunk=None) -> str:
+        """
+        Gera texto com o backend de LLM do processo. 'operation' identifica a chamada nas métricas
+        (delegator, react, consolidate...). Com 'on_chunk', o texto é pedido em streaming e cada
+        pedaço é entregue à função assim que chega; o retorno continua sendo o texto completo.
+        """
         try:
-            model = genai.GenerativeModel(
-                self.model,
-                system_instruction=system_instruction if system_instruction else self.system_instruction
-            )
-            response = model.generate_content(prompt)
+            with track_phase("llm", operation), \
+                    tracer.start_span("llm", attributes={"model": self.model, "operation": operation}) as span:
+                instruction = system_instruction if system_instruction else self.system_instruction
+                # Resolvido a cada chamada: set_llm_backend vale também para os adapters já criados
+                backend = get_llm_backend()
+                if on_chunk is None:
+                    response = backend.generate(self.model, prompt, instruction, operation)
+                else:
+                    response = backend.generate_stream(self.model, prompt, instruction, operation, on_chunk)
+                usage = response.usage
+                span.set_attribute("backend", backend.name)
+                span.set_attribute("streamed", on_chunk is not None)
+                span.set_attribute("prompt_chars", len(prompt))
+                if usage is not None:
+                    span.set_attribute("prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0)
+                    span.set_attribute("completion_tokens", getattr(usage, "candidates_token_count", 0) or 0)
+            record_llm_tokens(self.model, operation, usage)
+            LLM_CALLS.inc(model=self.model, operation=operation, status="success")
             return response.text
         except Exception as e:
+            LLM_CALLS.inc(model=self.model, operation=operation, status="error")
             self.logger.error(f"Erro na geração Gemini: {str(e)}")
             return ""
         
@@ -87,6 +110,8 @@ class GeminiAdapter:
                 f"- {formatted_guidelines}"
             )
 
+        formatted_react_history = "\n".join(context.react_history)
+
         prompt = f"""
         ## 🤖 Persona
         Você é um Redator Chefe de IA, especialista em comunicação. Sua função é pegar dados brutos e rascunhos de uma equipe de agentes de IA e transformar tudo em uma resposta final, clara, coesa e perfeitamente formatada para um usuário humano.
@@ -105,7 +130,7 @@ class GeminiAdapter:
 
         ### Raciocínio Interno da Equipe (Para seu Contexto):
         ```
-        {"\n".join(context.react_history)}
+        {formatted_react_history}
         ```
         ---
         {guidelines_section}
@@ -119,7 +144,11 @@ class GeminiAdapter:
         
         Agora, gere a resposta final para o usuário.
         """
-        return self.generate(prompt).strip()
+        # Com um cliente esperando a tarefa (modo síncrono/SSE), os tokens são publicados à medida que chegam
+        on_chunk = None
+        if task_events.is_streaming():
+            on_chunk = lambda text: task_events.emit("token", text=text)
+        return self.generate(prompt, operation="consolidate", on_chunk=on_chunk).strip()
 
     def decide_next_manager_action(self, context: ExecutionContext, chat_history:list) -> dict:
         """
@@ -133,8 +162,8 @@ class GeminiAdapter:
             # Retorna uma resposta de erro que pode ser tratada pelo orquestrador
             return {"decision": "error", "final_answer": "Não consegui encontrar minhas instruções para decidir o próximo passo. Por favor, contate o suporte."}
 
-        # Formata os dados do contexto para o prompt
-        simplified_managers = self._create_simplified_manager_list(context.available_managers)
+        # Formata os dados do contexto para o prompt (apenas os managers relevantes, se a poda estiver ativa)
+        simplified_managers = self._create_simplified_manager_list(self.catalog_pruner.select(context, chat_history))
         formatted_managers = json.dumps(simplified_managers, indent=2, ensure_ascii=False)
 
         formatted_results = json.dumps(context.previous_results, indent=2, ensure_ascii=False)
@@ -150,7 +179,9 @@ class GeminiAdapter:
             current_date=datetime.now().strftime("%d/%m/%Y %H:%M")
         )
 
-        response_text = self.generate(prompt, system_instruction="Você é um orquestrador de IA que responde em JSON.")
+        response_text = self.generate(
+            prompt, system_instruction="Você é um orquestrador de IA que responde em JSON.", operation="delegator"
+        )
         
         try:
             return self.parse_json_response(response_text)
@@ -192,7 +223,7 @@ class GeminiAdapter:
             current_date=datetime.now().strftime("%d/%m/%Y %H:%M")
         )
 
-        response = self.generate(prompt)
+        response = self.generate(prompt, operation="react")
         self.logger.debug(f"Resposta ReAct: {response}")
 
         return self._parse_react_response(response)
@@ -0,0 +1,134 @@
+# services/logging/blob_store.py
+import hashlib
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import gridfs
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from config import settings
+from services.cache.ttl_cache import TTLCache
+from services.database.mongo_connection import mongo_connection
+
+try:
+    import zstandard
+except ImportError:  # Dependência opcional: sem ela, usamos zlib.
+    zstandard = None
+
+# Documentos do MongoDB têm limite de 16 MB; acima deste tamanho comprimido o blob vai para o GridFS.
+_GRIDFS_THRESHOLD_BYTES = 15 * 1024 * 1024
+
+
+class BlobStore:
+    """
+    Armazenamento endereçado por conteúdo para saídas grandes de ferramentas.
+    Cada blob é identificado pelo SHA-256 do conteúdo, comprimido (zstd, ou zlib se o
+    'zstandard' não estiver instalado) e gravado uma única vez, mesmo que apareça em várias execuções.
+    """
+    _instance = None
+    _collection_name = "execution_blobs"
+    _gridfs_collection_name = "execution_blobs_fs"
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(BlobStore, cls).__new__(cls)
+            # Hashes já gravados por este processo: evita o upsert de conteúdos repetidos.
+            cls._instance._known_blobs = TTLCache(max_size=10000, ttl_seconds=3600)
+        return cls._instance
+
+    def _reset_after_fork(self):
+        self._known_blobs = TTLCache(max_size=10000, ttl_seconds=3600)
+
+    @staticmethod
+    def _compress(data: bytes) -> tuple:
+        if zstandard is not None:
+            return "zstd", zstandard.ZstdCompressor(level=settings.EXECUTION_BLOB_ZSTD_LEVEL).compress(data)
+        return "zlib", zlib.compress(data, 6)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Blob comprimido com zstd, mas o pacote 'zstandard' não está instalado.")
+            return zstandard.ZstdDecompressor().decompress(data)
+        if codec == "zlib":
+            return zlib.decompress(data)
+        return data
+
+    def put(self, content: str) -> dict:
+        """Grava o conteúdo (se ainda não existir) e retorna a referência a ser guardada no log."""
+        raw = content.encode("utf-8")
+        blob_id = hashlib.sha256(raw).hexdigest()
+
+        known_ref = self._known_blobs.get(blob_id)
+        if known_ref is not None:
+            return known_ref
+
+        codec, compressed = self._compress(raw)
+        ref = {
+            "blob_id": blob_id,
+            "codec": codec,
+            "size": len(raw),
+            "compressed_size": len(compressed),
+            "storage": "gridfs" if len(compressed) > _GRIDFS_THRESHOLD_BYTES else "collection",
+        }
+
+        if ref["storage"] == "gridfs":
+            fs = gridfs.GridFS(mongo_connection.get_database(usage="logs"), collection=self._gridfs_collection_name)
+            if not fs.exists({"filename": blob_id}):
+                fs.put(compressed, filename=blob_id, codec=codec, size=len(raw))
+        else:
+            collection = mongo_connection.get_collection(self._collection_name, usage="logs")
+            try:
+                collection.update_one(
+                    {"_id": blob_id},
+                    {"$setOnInsert": {
+                        "codec": codec,
+                        "data": Binary(compressed),
+                        "size": len(raw),
+                        "compressed_size": len(compressed),
+                        "created_at": datetime.now(timezone.utc),
+                    }},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # Outro processo gravou o mesmo conteúdo ao mesmo tempo.
+                pass
+
+        self._known_blobs.set(blob_id, ref)
+        return ref
+
+    def get_many(self, refs: Iterable[dict]) -> Dict[str, str]:
+        """Carrega vários blobs de uma vez (uma consulta para a coleção) e retorna {blob_id: conteúdo}."""
+        refs = list(refs)
+        contents = {}
+
+        collection_ids = list({ref["blob_id"] for ref in refs if ref.get("storage") != "gridfs"})
+        if collection_ids:
+            collection = mongo_connection.get_collection(self._collection_name, usage="logs")
+            for doc in collection.find({"_id": {"$in": collection_ids}}):
+                contents[doc["_id"]] = self._decompress(doc["codec"], doc["data"]).decode("utf-8")
+
+        gridfs_ids = {ref["blob_id"] for ref in refs if ref.get("storage") == "gridfs"}
+        if gridfs_ids:
+            fs = gridfs.GridFS(mongo_connection.get_database(usage="logs"), collection=self._gridfs_collection_name)
+            for blob_id in gridfs_ids:
+                grid_out = fs.find_one({"filename": blob_id})
+                if grid_out is not None:
+                    contents[blob_id] = self._decompress(grid_out.codec, grid_out.read()).decode("utf-8")
+
+        return contents
+
+    def get(self, ref: dict) -> Optional[str]:
+        """Carrega o conteúdo de um único blob."""
+        return self.get_many([ref]).get(ref["blob_id"])
+
+
+blob_store = BlobStore()
+
+# Processos filhos não devem confiar no cache de hashes do pai.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=blob_store._reset_after_fork)
@@ -1,47 +1,154 @@
 import json
 import os
+import threading
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pymongo import MongoClient
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
 
 from config import settings
+from services.database.mongo_connection import mongo_connection
+from services.logging.blob_store import blob_store
 from models.schemas import ExecutionContext
 
+# Prefixos usados no react_history para cada tipo de evento do ciclo ReAct
+_REACT_PREFIXES = {
+    "thought": "[THOUGHT]",
+    "action": "[ACTION]",
+    "observation": "[OBSERVATION]",
+    "final_answer": "[FINAL_ANSWER]"
+}
+
 class ExecutionLogger:
+    """
+    Log de execução orientado a eventos. Cada passo da execução (pensamento, ação, observação,
+    resultado de ferramenta, resposta final) vira um evento pequeno, gravado em lotes na coleção
+    'execution_events'. Ao final, um documento-resumo materializado é gravado em 'execution_logs'.
+    O registro em memória é indexado por execution_id e guarda apenas o resumo e os eventos ainda não gravados.
+    """
     _instance = None
-    _client: MongoClient = None
-    _db = None
-    _collection: Collection = None
-
+    _collection_name = "execution_logs"
+    _events_collection_name = "execution_events"
+    _profiles_collection_name = "execution_profiles"
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ExecutionLogger, cls).__new__(cls)
-
-            # 3. Conectar ao MongoDB na primeira inicialização (padrão Singleton)
-            try:
-                cls._client = MongoClient(settings.MONGO_URI)
-                cls._db = cls._client[settings.MONGO_DB]
-                cls._collection = cls._db["execution_logs"]
-                # 4. Criar índices para otimizar buscas futuras
-                cls._collection.create_index("session_id")
-                cls._collection.create_index("execution_id", unique=True)
-                print("[EXECUTION_LOG] Conectado ao MongoDB com sucesso.")
-            except Exception as e:
-                print(f"[EXECUTION_LOG] ERRO CRÍTICO: Não foi possível conectar ao MongoDB. {e}")
-                cls._collection = None
-
+            # A conexão é compartilhada (mongo_connection) e aberta sob demanda no primeiro uso.
             cls._instance._execution_registry = {}
+            cls._instance._lock = threading.RLock()
         return cls._instance
 
-    def initialize_execution_log(self, session_id: str, context: dict):
-        """Inicializa um novo log de execução com estrutura hierárquica"""
-        log_entry = {
+    @classmethod
+    def _reset_after_fork(cls):
+        """Descarta os logs em andamento herdados do processo pai. A conexão é tratada pelo mongo_connection."""
+        if cls._instance is not None:
+            cls._instance._execution_registry = {}
+            cls._instance._lock = threading.RLock()
+
+    def _get_collection(self, name: str = None) -> Collection:
+        """
+        Retorna a coleção de logs (ou de eventos) usando o cliente compartilhado do processo
+        (ou None se a conexão falhar).
+        """
+        try:
+            return mongo_connection.get_collection(name or self._collection_name, usage="logs")
+        except Exception as e:
+            print(f"[EXECUTION_LOG] ERRO CRÍTICO: Não foi possível conectar ao MongoDB. {e}")
+            return None
+
+    def ensure_indexes(self):
+        """Cria os índices das coleções. Executado no bootstrap (job.ensure_indexes), não no import."""
+        collection = self._get_collection()
+        events_collection = self._get_collection(self._events_collection_name)
+        if collection is None or events_collection is None:
+            raise RuntimeError("Sem conexão com o MongoDB para criar os índices de execution_logs.")
+        # Índices para otimizar buscas futuras
+        collection.create_index("session_id")
+        collection.create_index("execution_id", unique=True)
+        events_collection.create_index([("execution_id", 1), ("seq", 1)], unique=True)
+        events_collection.create_index("session_id")
+        self._get_collection(self._profiles_collection_name).create_index("execution_id")
+
+    # --- Registro de eventos ---
+
+    def _append_event(self, execution_id: str, event_type: str, manager_id: str = None, **fields):
+        """Acrescenta um evento ao buffer da execução e grava o lote quando ele enche."""
+        with self._lock:
+            execution = self._execution_registry.get(execution_id)
+            if execution is None:
+                return None
+
+            execution["seq"] += 1
+            event = {
+                "execution_id": execution_id,
+                "session_id": execution["summary"]["session_id"],
+                "seq": execution["seq"],
+                "type": event_type,
+                "manager_id": manager_id,
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                **fields
+            }
+            execution["buffer"].append(event)
+            execution["summary"]["event_count"] = execution["seq"]
+            should_flush = len(execution["buffer"]) >= settings.EXECUTION_EVENTS_BATCH_SIZE
+
+        if should_flush:
+            self.flush_events(execution_id)
+        return event
+
+    def flush_events(self, execution_id: str) -> int:
+        """Grava no MongoDB os eventos pendentes da execução. Retorna quantos foram gravados."""
+        with self._lock:
+            execution = self._execution_registry.get(execution_id)
+            if execution is None or not execution["buffer"]:
+                return 0
+            batch, execution["buffer"] = execution["buffer"], []
+
+        events_collection = self._get_collection(self._events_collection_name)
+        if events_collection is None:
+            print(f"[EXECUTION_LOG] ERRO: Sem conexão com o MongoDB. {len(batch)} eventos de {execution_id} mantidos em memória.")
+            with self._lock:
+                execution["buffer"] = batch + execution["buffer"]
+            return 0
+
+        try:
+            events_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # (execution_id, seq) é único: chave duplicada indica evento já gravado numa tentativa anterior.
+            retry = [batch[err["index"]] for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if retry:
+                print(f"[EXECUTION_LOG] ERRO ao gravar {len(retry)} eventos da execução {execution_id}. Nova tentativa no próximo lote.")
+                with self._lock:
+                    execution["buffer"] = retry + execution["buffer"]
+            return len(batch) - len(retry)
+        except Exception as e:
+            print(f"[EXECUTION_LOG] ERRO ao gravar eventos da execução {execution_id}: {e}")
+            with self._lock:
+                execution["buffer"] = batch + execution["buffer"]
+            return 0
+        return len(batch)
+
+    def _find_manager_summary(self, execution_id: str, manager_id: str) -> Optional[dict]:
+        """Resumo do manager mais recente com este id na execução."""
+        execution = self._execution_registry.get(execution_id)
+        if execution is None:
+            return None
+        for manager in reversed(execution["summary"]["managers"]):
+            if manager["manager_id"] == manager_id:
+                return manager
+        return None
+
+    # --- API do logger ---
+
+    def initialize_execution_log(self, session_id: str, context: dict, execution_id: str = None):
+        """Inicializa um novo log de execução e registra o evento de início."""
+        execution_id = execution_id or f"exec_{uuid.uuid4().hex[:8]}"
+        summary = {
             "session_id": session_id,
-            "execution_id": f"exec_{uuid.uuid4().hex[:8]}",
+            "execution_id": execution_id,
             "user_id": context.get("user_id", ""),
             "user_question": context.get("user_question", ""),
             "start_timestamp": datetime.utcnow().isoformat() + "Z",
@@ -50,157 +157,313 @@ class ExecutionLogger:
             "managers": [],
             "final_output": "",
             "pending_actions": [],
+            "event_count": 0,
             "metadata": {
                 "api_version": settings.API_VERSION,
                 "llm_model": settings.GEMINI_MODEL,
-                "execution_mode": "orchestrator"
+                "execution_mode": "orchestrator",
+                "log_format": "events"
             }
         }
-        self._execution_registry[session_id] = log_entry
-        return log_entry
+        if context.get("trace_id"):
+            # Liga o log ao trace exportado (services.monitoring.tracing)
+            summary["metadata"]["trace_id"] = context["trace_id"]
+        with self._lock:
+            self._execution_registry[execution_id] = {"summary": summary, "buffer": [], "seq": 0}
+        self._append_event(execution_id, "execution_started", user_question=summary["user_question"])
+        return summary
 
-    def add_manager(self, session_id: str, manager_id: str, new_question: str):
+    def add_manager(self, execution_id: str, manager_id: str, new_question: str):
         """Adiciona um novo manager ao log de execução"""
-        if session_id not in self._execution_registry:
-            return None
+        with self._lock:
+            execution = self._execution_registry.get(execution_id)
+            if execution is None:
+                return None
 
-        manager_log = {
-            "manager_id": manager_id,
-            "new_question": new_question,
-            "previous_results": {},
-            "react_history": []
-        }
-        self._execution_registry[session_id]["managers"].append(manager_log)
-        if manager_id not in self._execution_registry[session_id]["orchestrator"]:
-            self._execution_registry[session_id]["orchestrator"].append(manager_id)
-        return manager_log
-
-    def get_manager_log(self, session_id: str, manager_id: str):
-        """Obtém o log específico de um manager"""
-        if session_id in self._execution_registry:
-            # Primeiro, verifica o registro em memória
-            for manager in self._execution_registry[session_id]["managers"]:
-                if manager["manager_id"] == manager_id:
-                    return manager
-        return None
+            manager_summary = {
+                "manager_id": manager_id,
+                "new_question": new_question,
+                "react_steps": 0,
+                "tools": []
+            }
+            execution["summary"]["managers"].append(manager_summary)
+            if manager_id not in execution["summary"]["orchestrator"]:
+                execution["summary"]["orchestrator"].append(manager_id)
+
+        self._append_event(execution_id, "manager_started", manager_id=manager_id, new_question=new_question)
+        return manager_summary
 
-    def add_manager_react_history(self, session_id: str, manager_id: str, entry: str, entry_type: str):
-        """Adiciona uma entrada ao histórico do ReAct de um manager específico"""
-        manager_log = self.get_manager_log(session_id, manager_id)
-        if not manager_log:
-            return
-        prefix = {
-            "thought": "[THOUGHT]",
-            "action": "[ACTION]",
-            "observation": "[OBSERVATION]",
-            "final_answer": "[FINAL_ANSWER]"
-        }.get(entry_type, "[UNKNOWN]")
+    def get_manager_log(self, execution_id: str, manager_id: str):
+        """Obtém o resumo em memória de um manager da execução"""
+        with self._lock:
+            return self._find_manager_summary(execution_id, manager_id)
+
+    @staticmethod
+    def _offload(content: str, label: str) -> Optional[dict]:
+        """
+        Grava no blob_store um conteúdo acima de EXECUTION_BLOB_THRESHOLD_BYTES e retorna
+        {"blob": referência, "summary": início do conteúdo}. None se ele cabe no evento
+        ou se o blob_store falhou (o conteúdo fica no próprio evento).
+        """
+        if len(content.encode("utf-8")) <= settings.EXECUTION_BLOB_THRESHOLD_BYTES:
+            return None
+        try:
+            return {"blob": blob_store.put(content), "summary": content[:300] + "..."}
+        except Exception as e:
+            print(f"[EXECUTION_LOG] ERRO ao gravar blob de {label}; mantendo o conteúdo no evento. {e}")
+            return None
+
+    def add_manager_react_history(self, execution_id: str, manager_id: str, entry: str, entry_type: str):
+        """
+        Registra uma entrada do ciclo ReAct de um manager específico. Entradas grandes (em geral
+        observações com a saída de uma ferramenta) vão para o blob_store: o evento guarda o resumo
+        em 'content' e a referência em 'blob'.
+        """
+        prefix = _REACT_PREFIXES.get(entry_type, "[UNKNOWN]")
         if entry.strip().startswith(prefix):
             formatted_entry = entry.strip()
         else:
             formatted_entry = f"{prefix}: {entry}"
-            
-        manager_log["react_history"].append(formatted_entry)
-
-    def add_tool_result(self, session_id: str, manager_id: str, agent_id: str, tool_name: str, result: dict):
-        """Adiciona o resultado de uma ferramenta ao log do manager"""
-        manager_log = self.get_manager_log(session_id, manager_id)
-        if not manager_log:
-            return
-        if agent_id not in manager_log["previous_results"]:
-            manager_log["previous_results"][agent_id] = {}
-        manager_log["previous_results"][agent_id][tool_name] = result
-
-    def update_final_output(self, session_id: str, final_output: str):
+
+        with self._lock:
+            manager_summary = self._find_manager_summary(execution_id, manager_id)
+            if not manager_summary:
+                return
+            manager_summary["react_steps"] += 1
+
+        offloaded = self._offload(formatted_entry, f"uma entrada ReAct ({entry_type})")
+        if offloaded is not None:
+            self._append_event(execution_id, entry_type, manager_id=manager_id,
+                               content=offloaded["summary"], blob=offloaded["blob"])
+        else:
+            self._append_event(execution_id, entry_type, manager_id=manager_id, content=formatted_entry)
+
+    def add_tool_result(self, execution_id: str, manager_id: str, agent_id: str, tool_name: str, result: dict):
+        """Registra o resultado de uma ferramenta executada por um manager"""
+        with self._lock:
+            manager_summary = self._find_manager_summary(execution_id, manager_id)
+            if not manager_summary:
+                return
+            if tool_name not in manager_summary["tools"]:
+                manager_summary["tools"].append(tool_name)
+
+        self._append_event(
+            execution_id, "tool_result", manager_id=manager_id,
+            agent_id=agent_id, tool_name=tool_name, result=result
+        )
+
+    def log_routing_decision(self, execution_id: str, decision: dict):
+        """Registra a decisão do roteador rápido (manager escolhido ou delegador, com os candidatos)"""
+        with self._lock:
+            execution = self._execution_registry.get(execution_id)
+            if execution is None:
+                return
+            execution["summary"]["routing"] = {key: decision[key] for key in ("outcome", "manager_id", "confidence", "margin")}
+        self._append_event(execution_id, "routing", **decision)
+
+    def update_final_output(self, execution_id: str, final_output: str):
         """Atualiza a saída final da execução"""
-        if session_id in self._execution_registry:
-            self._execution_registry[session_id]["final_output"] = final_output
+        with self._lock:
+            execution = self._execution_registry.get(execution_id)
+            if execution is None:
+                return
+            execution["summary"]["final_output"] = final_output
+        self._append_event(execution_id, "final", content=final_output)
 
-    def update_pending_actions(self, session_id: str, actions: list):
+    def update_pending_actions(self, execution_id: str, actions: list):
         """Atualiza as ações pendentes"""
-        if session_id in self._execution_registry:
-            self._execution_registry[session_id]["pending_actions"] = actions
+        with self._lock:
+            execution = self._execution_registry.get(execution_id)
+            if execution is None:
+                return
+            execution["summary"]["pending_actions"] = actions
+        self._append_event(execution_id, "pending_actions", actions=actions)
+
+    def finalize_execution_log(self, execution_id: str, status: str = "completed", timings: dict = None):
+        """
+        Grava os eventos restantes e materializa o documento-resumo da execução.
+        'timings' é o detalhamento de latência por fase da tarefa (ver services.monitoring.metrics).
+        """
+        with self._lock:
+            execution = self._execution_registry.get(execution_id)
+            if execution is None:
+                return None
+            summary = execution["summary"]
+
+        self._append_event(execution_id, "execution_finished", status=status)
+        try:
+            return self._persist_summary(execution_id, summary, status, timings)
+        finally:
+            # Limpa o registro em memória em qualquer saída (inclusive sem MongoDB): num worker de
+            # longa duração, uma execução não finalizada ficaria retida com os eventos pendentes.
+            with self._lock:
+                execution = self._execution_registry.pop(execution_id, None)
+            if execution and execution["buffer"]:
+                print(f"[EXECUTION_LOG] {len(execution['buffer'])} eventos da execução {execution_id} descartados sem gravação.")
+
+    def _persist_summary(self, execution_id: str, summary: dict, status: str, timings: Optional[dict]) -> Optional[dict]:
+        self.flush_events(execution_id)
 
-    def finalize_execution_log(self, session_id: str, status: str = "completed"):
-        """Finaliza e salva o log de execução no formato desejado"""
-        if session_id not in self._execution_registry:
-            return None
-        
         # Garante que a conexão com o DB esteja ativa
-        if self._collection is None:
+        collection = self._get_collection()
+        if collection is None:
             print(f"[EXECUTION_LOG] ERRO: Não é possível salvar o log. Sem conexão com o MongoDB.")
             return None
-        
-        log_entry = self._execution_registry[session_id]
+
         end_time = datetime.utcnow()
-        start_time = datetime.fromisoformat(log_entry["start_timestamp"].replace("Z", ""))
-        log_entry["end_timestamp"] = end_time.isoformat() + "Z"
-        log_entry["duration_ms"] = int((end_time - start_time).total_seconds() * 1000)
-        log_entry["status"] = status
+        start_time = datetime.fromisoformat(summary["start_timestamp"].replace("Z", ""))
+        summary["end_timestamp"] = end_time.isoformat() + "Z"
+        summary["duration_ms"] = int((end_time - start_time).total_seconds() * 1000)
+        summary["status"] = status
+        if timings:
+            summary["timings"] = timings
 
         try:
-            # A operação de inserção é atômica e segura contra concorrência.
-            self._collection.insert_one(log_entry)
-            execution_id = log_entry['execution_id']
+            # O resumo é pequeno e idempotente: reexecuções do finalize apenas o sobrescrevem.
+            collection.update_one({"execution_id": execution_id}, {"$set": summary}, upsert=True)
             if settings.DEBUG:
-                print(f"[EXECUTION_LOG] Log da execução {execution_id} salvo no MongoDB.")
+                print(f"[EXECUTION_LOG] Log da execução {execution_id} salvo no MongoDB ({summary['event_count']} eventos).")
         except Exception as e:
-            print(f"[EXECUTION_LOG] ERRO ao salvar log no MongoDB para a sessão {session_id}: {e}")
-
-        # Limpa o registro em memória para esta execução, liberando recursos
-        if session_id in self._execution_registry:
-            del self._execution_registry[session_id]
-
-    def log_react_thought(self, session_id: str, manager_id: str, thought: str):
-        self.add_manager_react_history(session_id, manager_id, thought, "thought")
-
-    def log_react_action(self, session_id: str, manager_id: str, action: str):
-        self.add_manager_react_history(session_id, manager_id, action, "action")
-
-    def log_react_observation(self, session_id: str, manager_id: str, observation: str):
-        self.add_manager_react_history(session_id, manager_id, observation, "observation")
-
-    def log_react_final_answer(self, session_id: str, manager_id: str, final_answer: str):
-        self.add_manager_react_history(session_id, manager_id, final_answer, "final_answer")
-
-    def log_tool_invocation_result(self, session_id: str, manager_id: str, agent_id: str, tool_name: str, success: bool, output: str):
-        """Registra o resultado de uma invocação de ferramenta"""
-        self.add_tool_result(
-            session_id,
-            manager_id,
-            agent_id,
-            tool_name,
-            {
-                "success": success,
-                "output_summary": output[:300] + "..." if len(output) > 300 else output,
-                "full_output": output
+            print(f"[EXECUTION_LOG] ERRO ao salvar log no MongoDB para a execução {execution_id}: {e}")
+        return summary
+
+    def log_react_thought(self, execution_id: str, manager_id: str, thought: str):
+        self.add_manager_react_history(execution_id, manager_id, thought, "thought")
+
+    def log_react_action(self, execution_id: str, manager_id: str, action: str):
+        self.add_manager_react_history(execution_id, manager_id, action, "action")
+
+    def log_react_observation(self, execution_id: str, manager_id: str, observation: str):
+        self.add_manager_react_history(execution_id, manager_id, observation, "observation")
+
+    def log_react_final_answer(self, execution_id: str, manager_id: str, final_answer: str):
+        self.add_manager_react_history(execution_id, manager_id, final_answer, "final_answer")
+
+    def log_tool_invocation_result(self, execution_id: str, manager_id: str, agent_id: str, tool_name: str, success: bool, output: str):
+        """
+        Registra o resultado de uma invocação de ferramenta. Saídas acima de EXECUTION_BLOB_THRESHOLD_BYTES
+        são gravadas comprimidas no blob_store e o evento guarda apenas a referência e um resumo.
+        """
+        if not isinstance(output, str):
+            output = json.dumps(output, ensure_ascii=False, default=str)
+
+        result = {"success": success}
+        offloaded = self._offload(output, f"saída da ferramenta '{tool_name}'")
+        if offloaded is not None:
+            result["blob"] = offloaded["blob"]
+            result["output_summary"] = offloaded["summary"]
+        else:
+            result["full_output"] = output
+
+        self.add_tool_result(execution_id, manager_id, agent_id, tool_name, result)
+
+    def save_profile(self, execution_id: Optional[str], task_id: str, session_id: Optional[str], collapsed: str,
+                     samples: int, interval_ms: int, duration_ms: float):
+        """
+        Grava o profile de uma tarefa em 'execution_profiles', ligado ao log pelo execution_id.
+        As pilhas colapsadas vão para o blob_store (comprimidas); o documento guarda só a referência.
+        """
+        collection = self._get_collection(self._profiles_collection_name)
+        if collection is None:
+            return None
+        try:
+            document = {
+                "execution_id": execution_id,
+                "task_id": task_id,
+                "session_id": session_id,
+                "created_at": datetime.utcnow(),
+                "samples": samples,
+                "interval_ms": interval_ms,
+                "duration_ms": duration_ms,
+                "format": "collapsed",
+                "blob": blob_store.put(collapsed),
             }
-        )
+            collection.insert_one(document)
+            print(f"[EXECUTION_LOG] Profile da execução {execution_id} salvo ({samples} amostras).")
+            return document
+        except Exception as e:
+            print(f"[EXECUTION_LOG] ERRO ao salvar profile da execução {execution_id}: {e}")
+            return None
+
+    def get_profile(self, execution_id: str = None, task_id: str = None) -> Optional[str]:
+        """Retorna as pilhas colapsadas do profile mais recente da execução (ou da tarefa)."""
+        collection = self._get_collection(self._profiles_collection_name)
+        if collection is None:
+            return None
+        query = {"execution_id": execution_id} if execution_id else {"task_id": task_id}
+        document = collection.find_one(query, sort=[("created_at", -1)])
+        if document is None:
+            return None
+        return blob_store.get(document["blob"])
+
+    # --- Consultas ---
 
     def get_execution_log(self, session_id: str) -> Optional[dict]:
-        """Recupera todos os logs de uma sessão do MongoDB, do mais novo para o mais antigo."""
-        if self._collection is None: return None
-        return list(self._collection.find({"session_id": session_id}).sort("start_timestamp", -1))
-
-    def reconstruct_context_from_log(self, session_id: str) -> Optional[ExecutionContext]:
-        """Recupera o ÚLTIMO log da sessão no MongoDB para reconstruir o contexto."""
-        if self._collection is None: return None
-        
-        log_entry = self._collection.find_one({"session_id": session_id}, sort=[("start_timestamp", -1)])
-        
+        """Recupera todos os resumos de execução de uma sessão do MongoDB, do mais novo para o mais antigo."""
+        collection = self._get_collection()
+        if collection is None: return None
+        return list(collection.find({"session_id": session_id}).sort("start_timestamp", -1))
+
+    def get_execution_events(self, execution_id: str) -> List[dict]:
+        """Recupera os eventos de uma execução, na ordem em que aconteceram."""
+        events_collection = self._get_collection(self._events_collection_name)
+        if events_collection is None: return []
+        return list(events_collection.find({"execution_id": execution_id}, {"_id": 0}).sort("seq", 1))
+
+    def reconstruct_context_from_log(self, session_id: str, resolve_blobs: bool = True) -> Optional[ExecutionContext]:
+        """
+        Recupera o ÚLTIMO log da sessão no MongoDB e reconstrói o contexto a partir dos seus eventos.
+        Saídas gravadas no blob_store só são carregadas aqui, e apenas as que entram no contexto;
+        com resolve_blobs=False o contexto fica com o resumo de cada saída grande.
+        """
+        collection = self._get_collection()
+        if collection is None: return None
+
+        log_entry = collection.find_one({"session_id": session_id}, sort=[("start_timestamp", -1)])
+
         if not log_entry:
             return None
-        
+
         consolidated_previous_results = {}
         consolidated_react_history = []
-        for manager_log in log_entry.get("managers", []):
-            consolidated_react_history.extend(manager_log.get("react_history", []))
-            for agent_id, tools in manager_log.get("previous_results", {}).items():
-                if agent_id not in consolidated_previous_results:
-                    consolidated_previous_results[agent_id] = {}
-                for tool_name, result_dict in tools.items():
-                    output_string = result_dict.get("full_output", str(result_dict))
-                    consolidated_previous_results[agent_id][tool_name] = output_string
+
+        if log_entry.get("metadata", {}).get("log_format") == "events":
+            blob_refs = {}
+            react_blob_refs = {}  # posição no react_history -> referência da entrada completa
+            for event in self.get_execution_events(log_entry["execution_id"]):
+                if event["type"] in _REACT_PREFIXES:
+                    if "blob" in event:
+                        react_blob_refs[len(consolidated_react_history)] = event["blob"]
+                    consolidated_react_history.append(event["content"])
+                elif event["type"] == "tool_result":
+                    agent_results = consolidated_previous_results.setdefault(event["agent_id"], {})
+                    result = event["result"]
+                    if "blob" in result:
+                        # Só os blobs que sobrevivem no contexto final são carregados, todos numa única consulta
+                        blob_refs[(event["agent_id"], event["tool_name"])] = result["blob"]
+                        agent_results[event["tool_name"]] = result.get("output_summary", "")
+                    else:
+                        blob_refs.pop((event["agent_id"], event["tool_name"]), None)
+                        agent_results[event["tool_name"]] = result.get("full_output", str(result))
+
+            if (blob_refs or react_blob_refs) and resolve_blobs:
+                contents = blob_store.get_many(list(blob_refs.values()) + list(react_blob_refs.values()))
+                for (agent_id, tool_name), ref in blob_refs.items():
+                    if ref["blob_id"] in contents:
+                        consolidated_previous_results[agent_id][tool_name] = contents[ref["blob_id"]]
+                for position, ref in react_blob_refs.items():
+                    if ref["blob_id"] in contents:
+                        consolidated_react_history[position] = contents[ref["blob_id"]]
+        else:
+            # Logs antigos guardavam a árvore completa no próprio documento
+            for manager_log in log_entry.get("managers", []):
+                consolidated_react_history.extend(manager_log.get("react_history", []))
+                for agent_id, tools in manager_log.get("previous_results", {}).items():
+                    if agent_id not in consolidated_previous_results:
+                        consolidated_previous_results[agent_id] = {}
+                    for tool_name, result_dict in tools.items():
+                        output_string = result_dict.get("full_output", str(result_dict))
+                        consolidated_previous_results[agent_id][tool_name] = output_string
 
         context = ExecutionContext(
             session_id=log_entry.get("session_id"),
@@ -216,4 +479,9 @@ class ExecutionLogger:
         return context
 
 
-execution_logger = ExecutionLogger()
\ No newline at end of file
+# Instância global do logger de execução. Nenhuma conexão é aberta aqui.
+execution_logger = ExecutionLogger()
+
+# Processos filhos (ex.: workers do Dramatiq) não devem herdar os logs em andamento do pai.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ExecutionLogger._reset_after_fork)
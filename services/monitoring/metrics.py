@@ -0,0 +1,351 @@
+# services/monitoring/metrics.py
+import contextvars
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Limites (em segundos) dos histogramas de latência. Cobrem desde operações de banco
+# (milissegundos) até chamadas de LLM e ferramentas externas (dezenas de segundos).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base das métricas: guarda as séries por combinação de valores de labels."""
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple, object] = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Métrica '{self.name}' espera os labels {self.labelnames}, recebeu {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in sorted(series):
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key: Tuple, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def mean(self, **labels) -> Optional[float]:
+        """Média das observações da série neste processo (None se ainda não houver nenhuma)."""
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if not series or not series["count"]:
+                return None
+            return series["sum"] / series["count"]
+
+    def _render_series(self, key: Tuple, value) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value["counts"]):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(round(value['sum'], 6))}")
+        lines.append(f"{self.name}_count{labels} {value['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas do processo, exposto no formato texto do Prometheus.
+    Cada processo (API e cada worker do Dramatiq) tem o seu; o Prometheus agrega.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MetricsRegistry, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._metrics = {}
+            cls._instance._collectors = []
+        return cls._instance
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], None]):
+        """
+        Registra uma função chamada antes de cada renderização, usada para atualizar
+        gauges a partir de estado que já existe em outro serviço (ex.: pool do MongoDB).
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Renderiza todas as métricas no formato de exposição texto do Prometheus."""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"[METRICS] Falha ao executar coletor {getattr(collector, '__name__', collector)}: {e}")
+
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Zera todas as séries (as métricas continuam registradas)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def _reset_after_fork(self):
+        """Cada processo filho começa com as próprias séries zeradas."""
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+        self.reset()
+
+
+metrics = MetricsRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=metrics._reset_after_fork)
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # O scrape periódico do Prometheus não precisa aparecer no log.
+        pass
+
+
+def start_metrics_server(port: int, attempts: int = 1, host: str = "0.0.0.0") -> Optional[int]:
+    """
+    Sobe um servidor HTTP em thread daemon servindo GET /metrics. Processos irmãos
+    (ex.: vários workers do Dramatiq) tentam as portas seguintes até 'attempts'.
+    Retorna a porta usada, ou None se nenhuma estiver livre.
+    """
+    for candidate in range(port, port + max(attempts, 1)):
+        try:
+            server = ThreadingHTTPServer((host, candidate), _MetricsHandler)
+        except OSError:
+            continue
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return candidate
+    return None
+
+# --- Métricas da aplicação ---
+
+PHASE_DURATION = metrics.histogram(
+    "agent_phase_duration_seconds",
+    "Duração de cada fase do processamento (ciclo de orquestração, chamada de LLM, ferramenta, banco, webhook).",
+    ("phase", "name"),
+)
+PHASE_ERRORS = metrics.counter(
+    "agent_phase_errors_total",
+    "Fases que terminaram com exceção.",
+    ("phase", "name"),
+)
+LLM_TOKENS = metrics.counter(
+    "agent_llm_tokens_total",
+    "Tokens consumidos nas chamadas de LLM, segundo o usage_metadata da resposta.",
+    ("model", "operation", "kind"),
+)
+LLM_CALLS = metrics.counter(
+    "agent_llm_calls_total",
+    "Chamadas de LLM por modelo, operação e resultado.",
+    ("model", "operation", "status"),
+)
+TOOL_CALLS = metrics.counter(
+    "agent_tool_calls_total",
+    "Execuções de ferramentas por manager, ferramenta e resultado.",
+    ("manager", "tool", "status"),
+)
+
+# --- Detalhamento por tarefa ---
+
+# Acumulador da tarefa em andamento. asyncio.to_thread copia o contexto, então as fases
+# executadas em threads auxiliares caem no mesmo acumulador.
+_task_breakdown: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("task_breakdown", default=None)
+
+
+def start_task_breakdown() -> dict:
+    """Inicia o acumulador de tempos da tarefa no contexto atual."""
+    breakdown = {"lock": threading.Lock(), "phases": {}, "tokens": {}}
+    _task_breakdown.set(breakdown)
+    return breakdown
+
+
+def get_task_breakdown() -> Optional[dict]:
+    """
+    Retorna o detalhamento da tarefa em andamento, pronto para ser gravado no log:
+    {"phases": {"fase": {"count", "total_ms", "max_ms"}, "fase:nome": {...}}, "tokens": {...}}.
+    """
+    breakdown = _task_breakdown.get()
+    if breakdown is None:
+        return None
+    with breakdown["lock"]:
+        return {
+            "phases": {key: dict(value) for key, value in breakdown["phases"].items()},
+            "tokens": dict(breakdown["tokens"]),
+        }
+
+
+def _add_to_breakdown(phase: str, name: str, elapsed_ms: float):
+    breakdown = _task_breakdown.get()
+    if breakdown is None:
+        return
+    with breakdown["lock"]:
+        for key in (phase, f"{phase}:{name}") if name else (phase,):
+            entry = breakdown["phases"].setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + elapsed_ms, 3)
+            entry["max_ms"] = round(max(entry["max_ms"], elapsed_ms), 3)
+
+
+def observe_phase(phase: str, name: str, seconds: float, error: bool = False):
+    """Registra uma fase já medida (ex.: duração informada pelo driver do MongoDB)."""
+    PHASE_DURATION.observe(seconds, phase=phase, name=name)
+    if error:
+        PHASE_ERRORS.inc(phase=phase, name=name)
+    _add_to_breakdown(phase, name, seconds * 1000)
+
+
+@contextmanager
+def track_phase(phase: str, name: str = ""):
+    """Mede o bloco e registra no histograma da fase e no detalhamento da tarefa atual."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe_phase(phase, name, time.perf_counter() - started, error)
+
+
+def record_llm_tokens(model: str, operation: str, usage) -> None:
+    """Contabiliza os tokens do usage_metadata de uma resposta do Gemini."""
+    if usage is None:
+        return
+    counts = {
+        "prompt": getattr(usage, "prompt_token_count", 0) or 0,
+        "completion": getattr(usage, "candidates_token_count", 0) or 0,
+        "total": getattr(usage, "total_token_count", 0) or 0,
+    }
+    for kind, amount in counts.items():
+        if amount:
+            LLM_TOKENS.inc(amount, model=model, operation=operation, kind=kind)
+
+    breakdown = _task_breakdown.get()
+    if breakdown is None:
+        return
+    with breakdown["lock"]:
+        for kind, amount in counts.items():
+            breakdown["tokens"][kind] = breakdown["tokens"].get(kind, 0) + amount
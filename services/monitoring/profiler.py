@@ -0,0 +1,211 @@
+# services/monitoring/profiler.py
+import asyncio
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config import settings
+
+# Profundidade máxima de pilha registrada por amostra.
+_MAX_STACK_DEPTH = 128
+
+
+def _frame_label(code) -> str:
+    """Nome do frame no formato colapsado: 'função (pasta/arquivo.py:linha_da_def)'."""
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    short_path = "/".join(parts[-2:])
+    return f"{code.co_name} ({short_path}:{code.co_firstlineno})"
+
+
+class TaskProfile:
+    """Amostras de pilha de uma tarefa, agregadas no formato colapsado (flame graph)."""
+
+    def __init__(self, task_id: str, interval_ms: int):
+        self.task_id = task_id
+        self.interval_ms = interval_ms
+        self.execution_id: Optional[str] = None
+        self.session_id: Optional[str] = None
+        self.thread_ids: Dict[int, int] = {}  # thread -> quantas vezes está vinculada
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def collapsed(self) -> str:
+        """Uma linha por pilha: 'raiz;...;folha contagem', aceito por flamegraph.pl e speedscope."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class TaskProfiler:
+    """
+    Profiler por amostragem, ativado por tarefa. Uma única thread por processo
+    lê sys._current_frames() a cada PROFILING_INTERVAL_MS, mas só registra as threads
+    vinculadas a uma tarefa em profiling (a thread do worker e as de asyncio.to_thread
+    abertas via 'to_thread'). Com nenhuma tarefa ativa a thread dorme.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskProfiler, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._active = set()
+            cls._instance._wakeup = threading.Event()
+            cls._instance._sampler = None
+        return cls._instance
+
+    def should_profile(self, job_payload: dict) -> bool:
+        """Flag 'profile' no payload força o profiling; senão vale a taxa de amostragem do Settings."""
+        if job_payload.get("profile"):
+            return True
+        return settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def _ensure_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name="task-profiler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                profiles = [(profile, list(profile.thread_ids)) for profile in self._active]
+            if not profiles:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            frames = sys._current_frames()
+            samples = []
+            for profile, thread_ids in profiles:
+                for thread_id in thread_ids:
+                    frame = frames.get(thread_id)
+                    if frame is None or thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    samples.append((profile, ";".join(reversed(stack))))
+            del frames
+
+            with self._lock:
+                for profile, stack in samples:
+                    # Um profile encerrado durante a amostragem já teve as pilhas gravadas.
+                    if profile in self._active:
+                        profile.stacks[stack] += 1
+                        profile.samples += 1
+            time.sleep(profiles[0][0].interval_ms / 1000)
+
+    def _attach(self, profile: TaskProfile, thread_id: int):
+        with self._lock:
+            profile.thread_ids[thread_id] = profile.thread_ids.get(thread_id, 0) + 1
+
+    def _detach(self, profile: TaskProfile, thread_id: int):
+        with self._lock:
+            remaining = profile.thread_ids.get(thread_id, 0) - 1
+            if remaining > 0:
+                profile.thread_ids[thread_id] = remaining
+            else:
+                profile.thread_ids.pop(thread_id, None)
+
+    @contextmanager
+    def profile_task(self, job_payload: dict, attach_current_thread: bool = True):
+        """
+        Amostra a thread atual (e as vinculadas depois) enquanto o bloco executa e
+        grava o resultado ao lado do log de execução. Sem profiling, não faz nada.
+        Com attach_current_thread=False só as threads de 'to_thread' são amostradas
+        (worker assíncrono: a thread do loop é dividida entre várias tarefas).
+        """
+        if not self.should_profile(job_payload):
+            yield None
+            return
+
+        profile = TaskProfile(job_payload.get("task_id", ""), settings.PROFILING_INTERVAL_MS)
+        profile.session_id = job_payload.get("session_id")
+        token = _current_profile.set(profile)
+        if attach_current_thread:
+            self._attach(profile, threading.get_ident())
+        with self._lock:
+            self._active.add(profile)
+        self._ensure_sampler()
+        self._wakeup.set()
+        try:
+            yield profile
+        finally:
+            with self._lock:
+                self._active.discard(profile)
+                profile.thread_ids.clear()
+                collapsed = profile.collapsed()
+            _current_profile.reset(token)
+            profile.duration_ms = round((time.perf_counter() - profile.started) * 1000, 3)
+            self._save(profile, collapsed)
+
+    def _save(self, profile: TaskProfile, collapsed: str):
+        # Importado aqui: o logger puxa o MongoDB, e este módulo é carregado também pela API.
+        from services.logging.execution_logger import execution_logger
+        execution_logger.save_profile(
+            execution_id=profile.execution_id,
+            task_id=profile.task_id,
+            session_id=profile.session_id,
+            collapsed=collapsed,
+            samples=profile.samples,
+            interval_ms=profile.interval_ms,
+            duration_ms=profile.duration_ms,
+        )
+
+    def annotate(self, **fields):
+        """Completa o profile da tarefa atual (ex.: execution_id, conhecido só no Orquestrador)."""
+        profile = _current_profile.get()
+        if profile is not None:
+            for key, value in fields.items():
+                setattr(profile, key, value)
+
+    @contextmanager
+    def bind_current_thread(self, profile: Optional[TaskProfile]):
+        """Inclui a thread atual nas amostras do profile enquanto o bloco executa."""
+        if profile is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        self._attach(profile, thread_id)
+        try:
+            yield
+        finally:
+            self._detach(profile, thread_id)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._active = set()
+        self._wakeup = threading.Event()
+        self._sampler = None
+
+
+_current_profile: contextvars.ContextVar[Optional[TaskProfile]] = contextvars.ContextVar("task_profile", default=None)
+
+task_profiler = TaskProfiler()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=task_profiler._reset_after_fork)
+
+
+async def to_thread(func, *args, **kwargs):
+    """
+    Igual a asyncio.to_thread, mas a thread auxiliar entra nas amostras
+    da tarefa em profiling (se houver).
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def bound():
+        with task_profiler.bind_current_thread(profile):
+            return func(*args, **kwargs)
+
+    return await asyncio.to_thread(bound)
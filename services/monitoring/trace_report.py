@@ -0,0 +1,173 @@
+# services/monitoring/trace_report.py
+"""
+Análise local dos spans exportados por services.monitoring.tracing.
+
+Uso:
+    python -m services.monitoring.trace_report traces/*.jsonl
+    python -m services.monitoring.trace_report traces/*.jsonl --trace <trace_id> --top 10
+
+Para cada trace imprime a árvore de spans, o caminho crítico (a cadeia de filhos
+que termina por último em cada nível) e as esperas seriais: tempo de um span não
+coberto por nenhum filho, e o intervalo entre o fim de um span e o início de um filho
+em outro processo (ex.: tempo na fila do Dramatiq).
+"""
+import argparse
+import glob
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+
+def _attribute_value(value: dict):
+    for key in ("stringValue", "boolValue", "doubleValue"):
+        if key in value:
+            return value[key]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def load_spans(paths: List[str]) -> Dict[str, List[dict]]:
+    """Lê os arquivos JSON-lines e agrupa os spans por trace_id."""
+    traces = defaultdict(list)
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    request = json.loads(line)
+                    for resource_spans in request.get("resourceSpans", []):
+                        for scope_spans in resource_spans.get("scopeSpans", []):
+                            for raw in scope_spans.get("spans", []):
+                                traces[raw["traceId"]].append({
+                                    "span_id": raw["spanId"],
+                                    "parent_span_id": raw.get("parentSpanId"),
+                                    "name": raw["name"],
+                                    "start": int(raw["startTimeUnixNano"]),
+                                    "end": int(raw["endTimeUnixNano"]),
+                                    "attributes": {a["key"]: _attribute_value(a["value"]) for a in raw.get("attributes", [])},
+                                    "error": raw.get("status", {}).get("code") == 2,
+                                })
+    return traces
+
+
+def _label(span: dict) -> str:
+    attributes = span["attributes"]
+    detail = attributes.get("manager_id") or attributes.get("tool_name") or attributes.get("operation") or ""
+    if "cycle" in attributes:
+        detail = f"{detail} #{attributes['cycle']}".strip()
+    return f"{span['name']} [{detail}]" if detail else span["name"]
+
+
+def _covered_ns(span: dict, children: List[dict]) -> int:
+    """Tempo do span coberto por ao menos um filho (união dos intervalos)."""
+    intervals = sorted(
+        (max(child["start"], span["start"]), min(child["end"], span["end"]))
+        for child in children if child["end"] > span["start"] and child["start"] < span["end"]
+    )
+    covered, current_start, current_end = 0, None, None
+    for start, end in intervals:
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                covered += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        covered += current_end - current_start
+    return covered
+
+
+def analyze_trace(spans: List[dict]) -> dict:
+    """Monta a árvore, o caminho crítico e as esperas seriais de um trace."""
+    by_id = {span["span_id"]: span for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span["parent_span_id"] in by_id:
+            children[span["parent_span_id"]].append(span)
+        else:
+            roots.append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda s: s["start"])
+    roots.sort(key=lambda s: s["start"])
+
+    trace_start = min(span["start"] for span in spans)
+    trace_end = max(span["end"] for span in spans)
+
+    # Caminho crítico: parte da raiz que termina por último e desce sempre
+    # pelo filho que termina por último.
+    critical_path = []
+    node = max(roots, key=lambda s: s["end"]) if roots else None
+    while node is not None:
+        critical_path.append(node)
+        node = max(children[node["span_id"]], key=lambda s: s["end"], default=None)
+
+    waits = []
+    for span in spans:
+        own_children = children[span["span_id"]]
+        self_ns = (span["end"] - span["start"]) - _covered_ns(span, own_children)
+        if own_children:
+            waits.append({"kind": "self_time", "span": _label(span), "ms": self_ns / 1e6})
+        for child in own_children:
+            if child["start"] > span["end"]:
+                waits.append({"kind": "handoff", "span": f"{_label(span)} -> {_label(child)}",
+                              "ms": (child["start"] - span["end"]) / 1e6})
+
+    return {
+        "roots": roots,
+        "children": children,
+        "trace_start": trace_start,
+        "duration_ms": (trace_end - trace_start) / 1e6,
+        "critical_path": critical_path,
+        "waits": sorted(waits, key=lambda w: w["ms"], reverse=True),
+    }
+
+
+def _print_tree(span: dict, children: dict, trace_start: int, depth: int = 0):
+    offset_ms = (span["start"] - trace_start) / 1e6
+    duration_ms = (span["end"] - span["start"]) / 1e6
+    marker = " !" if span["error"] else ""
+    print(f"{'  ' * depth}{_label(span):<{max(60 - 2 * depth, 10)}} +{offset_ms:>9.1f} ms {duration_ms:>9.1f} ms{marker}")
+    for child in children[span["span_id"]]:
+        _print_tree(child, children, trace_start, depth + 1)
+
+
+def print_report(trace_id: str, spans: List[dict], top: int):
+    report = analyze_trace(spans)
+    print(f"\n=== trace {trace_id} — {len(spans)} spans, {report['duration_ms']:.1f} ms ===")
+    for root in report["roots"]:
+        _print_tree(root, report["children"], report["trace_start"])
+
+    print("\nCaminho crítico:")
+    for span in report["critical_path"]:
+        print(f"  {_label(span)} ({(span['end'] - span['start']) / 1e6:.1f} ms)")
+
+    print(f"\nMaiores esperas seriais (top {top}):")
+    for wait in report["waits"][:top]:
+        print(f"  {wait['kind']:<10} {wait['ms']:>9.1f} ms  {wait['span']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatório dos traces exportados em JSON-lines.")
+    parser.add_argument("paths", nargs="+", help="Arquivos (ou padrões glob) gerados pelo exportador.")
+    parser.add_argument("--trace", help="Analisa apenas este trace_id.")
+    parser.add_argument("--top", type=int, default=5, help="Quantidade de esperas listadas por trace.")
+    parser.add_argument("--last", type=int, default=3, help="Quantos traces (os mais recentes) analisar.")
+    args = parser.parse_args()
+
+    traces = load_spans(args.paths)
+    if args.trace:
+        selected = [args.trace] if args.trace in traces else []
+    else:
+        selected = sorted(traces, key=lambda t: max(s["end"] for s in traces[t]))[-args.last:]
+    if not selected:
+        print("Nenhum trace encontrado.")
+        return
+    for trace_id in selected:
+        print_report(trace_id, traces[trace_id], args.top)
+
+
+if __name__ == "__main__":
+    main()
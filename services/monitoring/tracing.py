@@ -0,0 +1,260 @@
+# services/monitoring/tracing.py
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from config import settings
+
+# Códigos de status do OTLP (opentelemetry.proto.trace.v1.Status.StatusCode)
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class SpanContext:
+    """Identificadores propagados entre processos (formato W3C traceparent)."""
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def from_traceparent(cls, value: Optional[str]) -> Optional["SpanContext"]:
+        if not value:
+            return None
+        parts = value.strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            flags = int(parts[3], 16)
+            int(parts[1], 16), int(parts[2], 16)
+        except ValueError:
+            return None
+        return cls(parts[1], parts[2], sampled=bool(flags & 0x01))
+
+
+class Span:
+    def __init__(self, name: str, context: SpanContext, parent_span_id: Optional[str], attributes: Optional[dict]):
+        self.name = name
+        self.context = context
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.events: List[dict] = []
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def set_status(self, code: int, message: str = ""):
+        self.status_code = code
+        self.status_message = message
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1_000_000
+
+    def to_otlp(self) -> dict:
+        """Serializa no formato JSON de um Span do OTLP (ids em hexadecimal, como no OTLP/JSON)."""
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        if self.events:
+            span["events"] = [
+                {
+                    "timeUnixNano": str(event["time_ns"]),
+                    "name": event["name"],
+                    "attributes": [_otlp_attribute(k, v) for k, v in event["attributes"].items()],
+                }
+                for event in self.events
+            ]
+        return span
+
+
+class _NoopSpan:
+    """Span devolvido com o tracing desativado: aceita as mesmas chamadas e não registra nada."""
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+    def set_status(self, code: int, message: str = ""):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class JsonLinesSpanExporter:
+    """
+    Grava os spans em arquivo, um lote por linha no formato de uma requisição
+    ExportTraceServiceRequest do OTLP/JSON. O arquivo pode ser reenviado a um coletor
+    OTLP ou analisado localmente (ver services.monitoring.trace_report).
+    """
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]):
+        path = self.path.format(pid=os.getpid())
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _otlp_attribute("service.name", self.service_name),
+                    _otlp_attribute("process.pid", os.getpid()),
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "agent_tcc.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        # Uma única escrita por lote: processos que compartilham o arquivo não intercalam linhas.
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(request, ensure_ascii=False, default=str) + "\n")
+
+
+class Tracer:
+    """
+    Tracer em processo. Os spans formam uma árvore pelo contextvar do span atual,
+    que asyncio.to_thread propaga para as threads auxiliares. Entre processos
+    (API -> Dramatiq -> worker) o vínculo é feito pelo traceparent no payload.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(Tracer, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._buffer = []
+            cls._instance.exporter = None
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.TRACING_ENABLED
+
+    def _get_exporter(self) -> JsonLinesSpanExporter:
+        if self.exporter is None:
+            self.exporter = JsonLinesSpanExporter(settings.TRACING_EXPORT_PATH, settings.APP_NAME)
+        return self.exporter
+
+    def set_exporter(self, exporter):
+        """Substitui o exportador (ex.: um exportador em memória em benchmarks)."""
+        self.exporter = exporter
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def inject(self) -> Dict[str, str]:
+        """Contexto a ser enviado junto com a mensagem para o próximo processo."""
+        span = _current_span.get()
+        if span is None:
+            return {}
+        return {"traceparent": span.context.to_traceparent()}
+
+    @staticmethod
+    def extract(carrier: Optional[dict]) -> Optional[SpanContext]:
+        """Lê o contexto recebido de outro processo (payload da tarefa ou headers HTTP)."""
+        if not carrier:
+            return None
+        return SpanContext.from_traceparent(carrier.get("traceparent"))
+
+    @contextmanager
+    def start_span(self, name: str, attributes: Optional[dict] = None, parent: Optional[SpanContext] = None):
+        """
+        Abre um span filho do span atual (ou de 'parent', quando vem de outro processo).
+        Com o tracing desativado não cria nada e devolve um span vazio.
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        parent_span = _current_span.get()
+        parent_context = parent or (parent_span.context if parent_span else None)
+        if parent_context:
+            context = SpanContext(parent_context.trace_id, os.urandom(8).hex(), parent_context.sampled)
+        else:
+            sampled = random.random() < settings.TRACING_SAMPLE_RATE
+            context = SpanContext(os.urandom(16).hex(), os.urandom(8).hex(), sampled)
+
+        span = Span(name, context, parent_context.span_id if parent_context else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_status(STATUS_ERROR, f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            if context.sampled:
+                # O span raiz do processo fecha o lote: a árvore da tarefa sai inteira no mesmo flush.
+                self._on_end(span, is_local_root=parent_span is None)
+
+    def _on_end(self, span: Span, is_local_root: bool):
+        with self._lock:
+            self._buffer.append(span)
+            if not is_local_root and len(self._buffer) < settings.TRACING_EXPORT_BATCH_SIZE:
+                return
+            batch, self._buffer = self._buffer, []
+        try:
+            self._get_exporter().export(batch)
+        except Exception as e:
+            print(f"[TRACING] Falha ao exportar {len(batch)} spans: {e}")
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._buffer = []
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+tracer = Tracer()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=tracer._reset_after_fork)
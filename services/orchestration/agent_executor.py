@@ -1,5 +1,6 @@
 # services/orchestration/agent_executor.py
 from models.schemas import AgentSchema, ToolResult
+from services.monitoring.tracing import STATUS_ERROR, tracer
 from tools import get_tool_registry
 import logging
 
@@ -9,6 +10,17 @@ class AgentExecutor:
         self.logger = logging.getLogger(__name__)
     
     def execute_agent(self, agent: AgentSchema, tool_name: str, params: dict, context) -> ToolResult:
+        attributes = {"agent_id": getattr(agent, "agent_id", ""), "tool_name": tool_name}
+        with tracer.start_span("tool", attributes=attributes) as span:
+            result = self._execute_agent(agent, tool_name, params, context)
+            span.set_attribute("success", result.success)
+            if result.next_step:
+                span.set_attribute("next_step", result.next_step)
+            if not result.success:
+                span.set_status(STATUS_ERROR, str(result.output)[:200])
+            return result
+
+    def _execute_agent(self, agent: AgentSchema, tool_name: str, params: dict, context) -> ToolResult:
         try:
 
             # Validações iniciais
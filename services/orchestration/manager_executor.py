@@ -2,7 +2,10 @@ from collections import defaultdict
 from models.schemas import ManagerSchema, ExecutionContext, ToolResult
 from services.llm.gemini_adapter import GeminiAdapter
 from .agent_executor import AgentExecutor
+from services.events.task_events import task_events
 from services.logging.execution_logger import execution_logger
+from services.monitoring.metrics import TOOL_CALLS, track_phase
+from services.monitoring.tracing import tracer
 import json
 import logging
 import re
@@ -29,79 +32,80 @@ class ManagerExecutor:
         
         try:
             for cycle in range(MAX_REACT_CYCLES):
-                self.logger.info(f"Iniciando ciclo ReAct {cycle+1}/{MAX_REACT_CYCLES}")
+                with tracer.start_span("react.cycle", attributes={"manager_id": manager.manager_id, "cycle": cycle + 1}):
+                    self.logger.info(f"Iniciando ciclo ReAct {cycle+1}/{MAX_REACT_CYCLES}")
                 
-                # Executa ciclo ReAct
-                cycle_result = self.gemini.react_cycle(
-                    context.user_id,
-                    manager,
-                    context,
-                    context.react_history,
-                    original_question 
-                )
+                    # Executa ciclo ReAct
+                    cycle_result = self.gemini.react_cycle(
+                        context.user_id,
+                        manager,
+                        context,
+                        context.react_history,
+                        original_question 
+                    )
                 
-                thought = cycle_result["thought"]
-                action = cycle_result["action"]
-                final_answer = cycle_result["final_answer"]
+                    thought = cycle_result["thought"]
+                    action = cycle_result["action"]
+                    final_answer = cycle_result["final_answer"]
                 
-                # Registra thought no histórico
-                if thought:
-                    thought_entry = f"[THOUGHT]: {thought}"
-                    context.react_history.append(thought_entry)
-                    execution_logger.log_react_thought(
-                        session_id=context.session_id,
-                        manager_id=manager.manager_id,
-                        thought=thought
-                    )
-                    self.logger.info(thought_entry)
+                    # Registra thought no histórico
+                    if thought:
+                        thought_entry = f"[THOUGHT]: {thought}"
+                        context.react_history.append(thought_entry)
+                        execution_logger.log_react_thought(
+                            execution_id=context.execution_id,
+                            manager_id=manager.manager_id,
+                            thought=thought
+                        )
+                        self.logger.info(thought_entry)
                 
-                # Processa FINAL ANSWER
-                if final_answer:
-                    final_entry = f"[FINAL_ANSWER]: {final_answer}"
-                    context.react_history.append(final_entry)
-                    context.final_output = final_answer
+                    # Processa FINAL ANSWER
+                    if final_answer:
+                        final_entry = f"[FINAL_ANSWER]: {final_answer}"
+                        context.react_history.append(final_entry)
+                        context.final_output = final_answer
 
-                    execution_logger.log_react_final_answer(
-                        session_id=context.session_id,
-                        manager_id=manager.manager_id,
-                        final_answer=final_answer
-                    )
-                    self.logger.info(final_entry)
-                    return False
+                        execution_logger.log_react_final_answer(
+                            execution_id=context.execution_id,
+                            manager_id=manager.manager_id,
+                            final_answer=final_answer
+                        )
+                        self.logger.info(final_entry)
+                        return False
                 
-                # Processa ACTION
-                if action:
-                    action_entry = f"[ACTION]: {action}"
-                    context.react_history.append(action_entry)
-                    execution_logger.log_react_action(
-                        session_id=context.session_id,
-                        manager_id=manager.manager_id,
-                        action=action
-                    )
-                    self.logger.info(action_entry)
+                    # Processa ACTION
+                    if action:
+                        action_entry = f"[ACTION]: {action}"
+                        context.react_history.append(action_entry)
+                        execution_logger.log_react_action(
+                            execution_id=context.execution_id,
+                            manager_id=manager.manager_id,
+                            action=action
+                        )
+                        self.logger.info(action_entry)
                     
-                    # Executa a ação
-                    tool_result, requires_user_input = self._execute_react_action(
-                        manager, context, action
-                    )
+                        # Executa a ação
+                        tool_result, requires_user_input = self._execute_react_action(
+                            manager, context, action
+                        )
                     
-                    if requires_user_input:
-                        return True
+                        if requires_user_input:
+                            return True
                     
-                    # Se obtivemos resultado, registra como observação
-                    if tool_result:
-                        observation_entry = f"[OBSERVATION]: {tool_result}" #Se precisar colocar [OBSERVATION]:
-                        context.react_history.append(observation_entry)
-                        execution_logger.log_react_observation(
-                            session_id=context.session_id,
-                            manager_id=manager.manager_id,
-                            observation=observation_entry
-                        )
-                        self.logger.info(observation_entry)
+                        # Se obtivemos resultado, registra como observação
+                        if tool_result:
+                            observation_entry = f"[OBSERVATION]: {tool_result}" #Se precisar colocar [OBSERVATION]:
+                            context.react_history.append(observation_entry)
+                            execution_logger.log_react_observation(
+                                execution_id=context.execution_id,
+                                manager_id=manager.manager_id,
+                                observation=observation_entry
+                            )
+                            self.logger.info(observation_entry)
                 
-                # Limite de segurança
-                if cycle == MAX_REACT_CYCLES - 1:
-                    context.react_history.append("[OBSERVATION]: Limite máximo de ciclos atingido")
+                    # Limite de segurança
+                    if cycle == MAX_REACT_CYCLES - 1:
+                        context.react_history.append("[OBSERVATION]: Limite máximo de ciclos atingido")
             
             return requires_user_input
         
@@ -179,7 +183,15 @@ class ManagerExecutor:
             return f"Ferramenta '{tool_name}' ou seu agente não foram encontrados", False
         
         # Executar a ferramenta
-        result = self.agent_executor.execute_agent(agent, tool_name, params, context)
+        task_events.emit("tool", manager_id=manager.manager_id, agent_id=agent_id, tool_name=tool_name)
+        with track_phase("tool", tool_name):
+            result = self.agent_executor.execute_agent(agent, tool_name, params, context)
+
+        if result.next_step == "REQUEST_USER_INPUT":
+            tool_status = "needs_input"
+        else:
+            tool_status = "success" if result.success else "error"
+        TOOL_CALLS.inc(manager=manager.manager_id, tool=tool_name, status=tool_status)
         
         # Se precisar de input do usuário
         if result.next_step == "REQUEST_USER_INPUT":
@@ -192,7 +204,7 @@ class ManagerExecutor:
             observation = str(result.output)
 
         execution_logger.log_tool_invocation_result(
-            session_id=context.session_id,
+            execution_id=context.execution_id,
             manager_id=manager.manager_id,
             agent_id=agent_id,
             tool_name=tool_name,
@@ -4,28 +4,52 @@ import copy
 import json
 import logging
 import uuid
+from typing import List, Optional
+
+from config import settings
 from models.schemas import ExecutionContext, ManagerSchema
 from services.conversation.conversation_history import conversation_history
 from services.definitions.definition_loader import definition_loader
+from services.events.task_events import task_events
 from services.llm.gemini_adapter import GeminiAdapter
 from services.logging.execution_logger import execution_logger
+from services.monitoring.metrics import PHASE_DURATION, get_task_breakdown, metrics, start_task_breakdown, track_phase
+from services.monitoring.profiler import task_profiler, to_thread
+from services.monitoring.tracing import tracer
+from services.routing.fast_path_router import FastPathRouter
 
 from .manager_executor import ManagerExecutor
 
+FINAL_ANSWER_SHORTCUT = metrics.counter(
+    "agent_final_answer_shortcut_total",
+    "Respostas finais de manager avaliadas para o atalho: 'used' (sem delegador e consolidação) ou o motivo da recusa.",
+    ("outcome",),
+)
+FINAL_ANSWER_SHORTCUT_SAVED = metrics.counter(
+    "agent_final_answer_shortcut_saved_seconds_total",
+    "Latência estimada poupada pelo atalho: médias recentes do delegador e da consolidação neste processo.",
+)
+
+# Marcadores do ReAct: uma resposta que os contém não está pronta para o usuário
+_REACT_MARKERS = ("[THOUGHT]", "[ACTION]", "[OBSERVATION]", "[FINAL_ANSWER]")
+
 
 class Orchestrator:
     def __init__(self):
         self.gemini = GeminiAdapter()
         self.manager_executor = ManagerExecutor()
+        self.fast_path_router = FastPathRouter()
         self.definition_loader = definition_loader
         self.logger = logging.getLogger(__name__)
 
     def process_task_sync(self, job_payload: dict) -> dict:
         """
         Ponto de entrada síncrono para o worker.
-        Ele executa o loop de eventos asyncio internamente.
+        Ele executa o loop de eventos asyncio internamente. Se a tarefa for sorteada
+        para profiling (ou pedir 'profile' no payload), as pilhas são amostradas durante toda a execução.
         """
-        return asyncio.run(self.process_task_async(job_payload))
+        with task_profiler.profile_task(job_payload):
+            return asyncio.run(self.process_task_async(job_payload))
 
     async def process_task_async(self, job_payload: dict) -> dict:
         """
@@ -36,6 +60,7 @@ class Orchestrator:
         user_question = job_payload.get("user_input")
 
         self.logger.info(f"Orquestrador processando tarefa para a sessão {session_id}")
+        start_task_breakdown()
         
         if not user_id or not user_question:
             raise ValueError("user_id e user_input são obrigatórios no payload da tarefa.")
@@ -47,81 +72,120 @@ class Orchestrator:
             user_data={"user_id": user_id}
         )
 
-        await self.get_manager_agent(context)
+        with track_phase("load_definitions"):
+            await self.get_manager_agent(context)
 
         if not context.available_managers:
             self.logger.warning(f"Nenhum manager ativo encontrado para o usuário {context.user_id}.")
             return {"response": "Não tenho as ferramentas necessárias para responder à sua pergunta no momento."}
 
-        self._initialize_logs(context)
-        return await self._cooperative_execution_flow(context)
+        await to_thread(self._initialize_logs, context)
+        try:
+            return await self._cooperative_execution_flow(context)
+        except Exception:
+            # Garante que os eventos já coletados sejam gravados e o resumo materializado
+            await to_thread(execution_logger.finalize_execution_log, context.execution_id, status="failed", timings=get_task_breakdown())
+            raise
 
     def _initialize_logs(self, context: ExecutionContext):
         """Inicializa os logs de execução e de conversa."""
         execution_id = f"exec_{uuid.uuid4().hex[:8]}"
         context.execution_id = execution_id
+        task_profiler.annotate(execution_id=execution_id)
         conversation_history.log_message(
             session_id=context.session_id, execution_id=execution_id, role="user",
             user_id=context.user_id, message=context.user_question
         )
+        current_span = tracer.current_span()
         execution_logger.initialize_execution_log(
             session_id=context.session_id,
-            context={"user_id": context.user_id, "user_question": context.user_question}
+            context={
+                "user_id": context.user_id,
+                "user_question": context.user_question,
+                "trace_id": current_span.context.trace_id if current_span else None
+            },
+            execution_id=execution_id
         )
 
     async def _cooperative_execution_flow(self, context: ExecutionContext) -> dict:
-        """Executa um fluxo de delegação cooperativo, decidindo um passo de cada vez."""
+        """
+        Executa um fluxo de delegação cooperativo, decidindo um passo de cada vez.
+        Toda chamada bloqueante (LLM, ferramentas, MongoDB) vai para to_thread: no worker
+        assíncrono várias tarefas dividem o mesmo loop de eventos.
+        """
         MAX_CYCLES = 5  # Limite de segurança para evitar loops infinitos
 
-        chat_history = conversation_history.get_last_messages(context.session_id, num_messages=10)
+        with track_phase("chat_history"):
+            chat_history = await to_thread(conversation_history.get_last_messages, context.session_id, num_messages=10)
 
+        managers_run = set()
         for cycle in range(MAX_CYCLES):
-            self.logger.info(f"Ciclo de Orquestração [{cycle + 1}/{MAX_CYCLES}] para a sessão {context.session_id}")
+            with tracer.start_span("orchestrator.cycle", attributes={"cycle": cycle + 1}) as cycle_span:
+                self.logger.info(f"Ciclo de Orquestração [{cycle + 1}/{MAX_CYCLES}] para a sessão {context.session_id}")
 
-            # 1. Decidir a próxima ação usando o LLM
-            next_action_plan = await asyncio.to_thread(self.gemini.decide_next_manager_action, context, chat_history)
+                # 1. Decidir a próxima ação: no primeiro ciclo, o roteador rápido pode dispensar o LLM
+                next_action_plan = None
+                if cycle == 0:
+                    with track_phase("orchestration_cycle", "route"):
+                        next_action_plan = await to_thread(self.fast_path_router.route, context)
+                    cycle_span.set_attribute("fast_path", next_action_plan is not None)
+                if next_action_plan is None:
+                    with track_phase("orchestration_cycle", "decide"):
+                        next_action_plan = await to_thread(self.gemini.decide_next_manager_action, context, chat_history)
             
-            thought = next_action_plan.get('thought', 'Nenhum pensamento registrado.')
-            decision = next_action_plan.get('decision')
-
-            self.logger.info(f"[ORCHESTRATOR_THOUGHT]: {thought}")
-            context.react_history.append(f"[ORCHESTRATOR_THOUGHT]: {thought}")
-
-            # 2. Processar a decisão
-            if decision == "final_answer":
-                self.logger.info("Delegador decidiu que a coleta de dados terminou. Construindo resposta final formatada.")
-                # O Delegador apenas sinaliza. O Orquestrador agora é responsável por chamar o construtor.
-                final_answer = self._build_final_response_with_guidelines(context)
-                return self._handle_final_response(context, final_answer)
-
-            if decision == "call_manager":
-                manager_id = next_action_plan.get("manager_id")
-                new_question = next_action_plan.get("new_question")
-
-                if not manager_id or not new_question:
-                    msg = "Decisão de chamar manager inválida (faltando manager_id ou new_question)."
-                    self.logger.error(msg)
-                    return self._handle_final_response(context, f"Ocorreu um erro interno: {msg}")
+                thought = next_action_plan.get('thought', 'Nenhum pensamento registrado.')
+                decision = next_action_plan.get('decision')
+                cycle_span.set_attribute("decision", str(decision))
+
+                self.logger.info(f"[ORCHESTRATOR_THOUGHT]: {thought}")
+                context.react_history.append(f"[ORCHESTRATOR_THOUGHT]: {thought}")
+
+                # 2. Processar a decisão
+                if decision == "final_answer":
+                    self.logger.info("Delegador decidiu que a coleta de dados terminou. Construindo resposta final formatada.")
+                    # O Delegador apenas sinaliza. O Orquestrador agora é responsável por chamar o construtor.
+                    with track_phase("orchestration_cycle", "consolidate"):
+                        final_answer = await to_thread(self._build_final_response_with_guidelines, context)
+                    return await to_thread(self._handle_final_response, context, final_answer)
+
+                if decision == "call_manager":
+                    manager_id = next_action_plan.get("manager_id")
+                    new_question = next_action_plan.get("new_question")
+
+                    if not manager_id or not new_question:
+                        msg = "Decisão de chamar manager inválida (faltando manager_id ou new_question)."
+                        self.logger.error(msg)
+                        return await to_thread(self._handle_final_response, context, f"Ocorreu um erro interno: {msg}")
                 
-                self.logger.info(f"Decisão: Delegar para o Manager '{manager_id}' com a tarefa: '{new_question}'")
+                    self.logger.info(f"Decisão: Delegar para o Manager '{manager_id}' com a tarefa: '{new_question}'")
+                    cycle_span.set_attribute("manager_id", manager_id)
                 
-                # 3. Executar o manager escolhido
-                needs_input = await asyncio.to_thread(
-                    self._execute_single_manager, context, manager_id, new_question
-                )
+                    # 3. Executar o manager escolhido
+                    with track_phase("orchestration_cycle", "manager"):
+                        needs_input = await to_thread(
+                            self._execute_single_manager, context, manager_id, new_question
+                        )
+
+                    if needs_input:
+                        self.logger.info("Execução pausada, aguardando input do usuário.")
+                        return await to_thread(self._pending_response, context)
 
-                if needs_input:
-                    self.logger.info("Execução pausada, aguardando input do usuário.")
-                    return self._pending_response(context)
+                    if any(m.manager_id == manager_id for m in context.available_managers):
+                        managers_run.add(manager_id)
+                    final_answer = self._final_answer_shortcut(context, managers_run)
+                    if final_answer is not None:
+                        cycle_span.set_attribute("final_answer_shortcut", True)
+                        return await to_thread(self._handle_final_response, context, final_answer)
                 
-                continue
+                    continue
             
-            self.logger.error(f"Decisão desconhecida ou erro do LLM: '{decision}'. Finalizando.")
-            return self._handle_final_response(context, "Desculpe, ocorreu um erro no meu processo de decisão.")
+                self.logger.error(f"Decisão desconhecida ou erro do LLM: '{decision}'. Finalizando.")
+                return await to_thread(self._handle_final_response, context, "Desculpe, ocorreu um erro no meu processo de decisão.")
         
         self.logger.warning(f"Máximo de {MAX_CYCLES} ciclos atingido para a sessão {context.session_id}. Finalizando.")
-        final_answer = self._build_final_response_with_guidelines(context)
-        return self._handle_final_response(context, final_answer)
+        with track_phase("orchestration_cycle", "consolidate"):
+            final_answer = await to_thread(self._build_final_response_with_guidelines, context)
+        return await to_thread(self._handle_final_response, context, final_answer)
 
     def _execute_single_manager(self, context: ExecutionContext, manager_id: str, new_question: str) -> bool:
         """Executa um único manager e atualiza o contexto principal."""
@@ -132,16 +196,23 @@ class Orchestrator:
             context.react_history.append(f"[ORCHESTRATOR_OBSERVATION]: Tentativa de chamar um manager inválido '{manager_id}'.")
             return False
 
-        execution_logger.add_manager(context.session_id, manager_id, new_question)
+        execution_logger.add_manager(context.execution_id, manager_id, new_question)
+        task_events.emit("manager", manager_id=manager_id, question=new_question)
 
         step_context = copy.deepcopy(context)
         step_context.react_history = [] 
         step_context.user_question = new_question
+        step_context.final_output = None
         
-        needs_input = self.manager_executor.execute_manager(manager, step_context, context.user_question)
+        with track_phase("manager", manager_id), \
+                tracer.start_span("manager", attributes={"manager_id": manager_id}) as manager_span:
+            needs_input = self.manager_executor.execute_manager(manager, step_context, context.user_question)
+            manager_span.set_attribute("needs_input", needs_input)
 
         self._consolidate_results(context.previous_results, step_context.previous_results)
         context.react_history.extend(step_context.react_history)
+        # Resposta final do manager ([FINAL_ANSWER]), avaliada para o atalho da resposta final
+        context.final_output = step_context.final_output
         if needs_input:
             context.pending_actions = step_context.pending_actions
 
@@ -165,18 +236,68 @@ class Orchestrator:
         """Cria uma resposta quando o sistema precisa de input do usuário."""
         if not context.pending_actions:
             self.logger.error("Ação pendente solicitada mas não configurada.")
+            execution_logger.finalize_execution_log(context.execution_id, status="failed", timings=get_task_breakdown())
             return {"type": "error", "message": "Erro interno."}
         required_params = context.pending_actions[0].get("required_params", [])
-        execution_logger.update_pending_actions(context.session_id, context.pending_actions)
+        execution_logger.update_pending_actions(context.execution_id, context.pending_actions)
+        execution_logger.finalize_execution_log(context.execution_id, status="pending_input", timings=get_task_breakdown())
         return {
             "type": "pending", "session_id": context.session_id,
             "message": "Precisamos de mais informações para continuar.",
             "required_params": required_params, "context": context.dict()
         }
     
-    def _build_final_response_with_guidelines(self, context: ExecutionContext) -> str:
-        """Coleta as diretrizes dos agentes executados e gera a resposta final."""
-        
+    def _final_answer_shortcut(self, context: ExecutionContext, managers_run: set) -> Optional[str]:
+        """
+        Resposta final do manager que acabou de executar, quando ela pode ir direto ao usuário
+        sem o novo ciclo do delegador e a consolidação: apenas um manager executou na tarefa,
+        nenhum agente com resultado tem 'response_guideline' e a resposta passa nas
+        verificações básicas. Caso contrário, None (o fluxo segue como antes).
+        """
+        answer = (context.final_output or "").strip()
+        if not settings.FINAL_ANSWER_SHORTCUT_ENABLED or not answer:
+            return None
+
+        if len(managers_run) != 1:
+            outcome = "multiple_managers"
+        elif self._formatting_guidelines(context):
+            outcome = "guidelines"
+        elif not self._is_user_ready_answer(answer):
+            outcome = "answer_checks"
+        else:
+            outcome = "used"
+        FINAL_ANSWER_SHORTCUT.inc(outcome=outcome)
+        if outcome != "used":
+            self.logger.info(f"Atalho da resposta final recusado ({outcome}); seguindo com o delegador.")
+            return None
+
+        # Estimativa: o que o delegador e a consolidação custaram, em média, neste processo
+        saved = sum(
+            PHASE_DURATION.mean(phase="orchestration_cycle", name=name) or 0.0
+            for name in ("decide", "consolidate")
+        )
+        FINAL_ANSWER_SHORTCUT_SAVED.inc(saved)
+        self.logger.info(f"Resposta final do manager enviada direto ao usuário (economia estimada de {saved:.2f}s).")
+        context.react_history.append("[ORCHESTRATOR_THOUGHT]: Resposta final do único manager enviada sem consolidação.")
+        # Clientes em streaming recebem a resposta como um único pedaço
+        if task_events.is_streaming():
+            task_events.emit("token", text=answer)
+        return answer
+
+    @staticmethod
+    def _is_user_ready_answer(answer: str) -> bool:
+        """Verificações básicas: tamanho, sem marcadores do ReAct e sem JSON bruto de ferramenta."""
+        if len(answer) > settings.FINAL_ANSWER_SHORTCUT_MAX_CHARS:
+            return False
+        if any(marker in answer for marker in _REACT_MARKERS):
+            return False
+        try:
+            return not isinstance(json.loads(answer), (dict, list))
+        except ValueError:
+            return True
+
+    def _formatting_guidelines(self, context: ExecutionContext) -> List[str]:
+        """Diretrizes de formato dos agentes que produziram resultados."""
         formatting_guidelines = []
         # Itera sobre os IDs dos agentes que produziram resultados
         for agent_id in context.previous_results.keys():
@@ -188,8 +309,11 @@ class Orchestrator:
                     f"siga esta regra de formato: '{agent_def.response_guideline}'"
                 )
                 formatting_guidelines.append(guideline_with_context)
-        
-        return self.gemini.consolidate_final_response(context, formatting_guidelines)
+        return formatting_guidelines
+
+    def _build_final_response_with_guidelines(self, context: ExecutionContext) -> str:
+        """Coleta as diretrizes dos agentes executados e gera a resposta final."""
+        return self.gemini.consolidate_final_response(context, self._formatting_guidelines(context))
     
     def _log_final_response(self, context: ExecutionContext, response: str):
         """Loga a resposta final nos históricos."""
@@ -197,13 +321,13 @@ class Orchestrator:
             session_id=context.session_id, execution_id=context.execution_id,
             role="system", user_id="orchestrator", message=response
         )
-        execution_logger.update_final_output(context.session_id, response)
-        execution_logger.finalize_execution_log(context.session_id, status="completed")
+        execution_logger.update_final_output(context.execution_id, response)
+        execution_logger.finalize_execution_log(context.execution_id, status="completed", timings=get_task_breakdown())
 
     async def get_manager_agent(self, context: ExecutionContext) -> dict:
             """Carrega as definições de managers e agents para o usuário."""
             try:
-                managers, agents = await asyncio.to_thread(
+                managers, agents = await to_thread(
                     self.definition_loader.load_definitions_for_user, context.user_id
                 )
                 context.available_managers = managers
@@ -0,0 +1,167 @@
+# services/routing/catalog_index.py
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import settings
+from models.schemas import ManagerSchema
+from services.cache.ttl_cache import TTLCache
+
+# Palavras funcionais do português, sem valor para decidir o manager
+_STOPWORDS = frozenset("""
+a ao aos as ate com como da das de del do dos e ela elas ele eles em entre era essa esse esta este eu
+isso isto ja la lhe mais mas me meu meus minha minhas na nas nao nem no nos nossa nosso num numa o os
+ou para pela pelas pelo pelos por qual quais quando que quem se sem ser seu seus sua suas sobre so
+tambem te tem ter teu tua um uma uns umas vc vcs voce voces vos
+""".split())
+
+# Tamanho do prefixo usado como radical: 'consultar', 'consulta' e 'consultas' viram 'consul'
+_STEM_LENGTH = 6
+
+_CAMEL_CASE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Parâmetros do BM25
+_K1 = 1.2
+_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Radicais dos termos do texto: sem acentos, em minúsculas, sem palavras funcionais e sem
+    números (identificadores como 'pedido 1234' não dizem nada sobre o manager).
+    """
+    if not text:
+        return []
+    text = _CAMEL_CASE.sub(" ", text).replace("_", " ")
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return [token[:_STEM_LENGTH] for token in _TOKEN.findall(text) if len(token) > 1 and not token.isdigit() and token not in _STOPWORDS]
+
+
+class CatalogIndex:
+    """
+    Índice lexical (BM25) das ferramentas ativas de um catálogo de managers. Cada documento
+    é uma ferramenta: descrição do manager e do agente, nome e descrição da ferramenta,
+    nomes dos parâmetros e os exemplos de pergunta ('routing_hints'), se houver.
+
+    'rank' ordena os managers pela melhor ferramenta de cada um e informa a cobertura:
+    a fração (ponderada por IDF) dos termos da pergunta presentes nessa ferramenta.
+    Termos que o catálogo não conhece contam como não cobertos.
+    """
+
+    def __init__(self, managers: List[ManagerSchema]):
+        self._documents: List[Tuple[str, str, Counter, int]] = []  # (manager_id, tool_name, termos, tamanho)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for manager in managers:
+            if not manager.isActive:
+                continue
+            for agent in manager.agents:
+                if not agent.isActive:
+                    continue
+                for tool in agent.tools:
+                    if not tool.isActive:
+                        continue
+                    text = " ".join([
+                        manager.description, agent.description, tool.tool_name, tool.description,
+                        " ".join(parameter.name for parameter in tool.parameters_mandatory),
+                        " ".join(tool.routing_hints or []),
+                    ])
+                    terms = Counter(tokenize(text))
+                    doc_id = len(self._documents)
+                    self._documents.append((manager.manager_id, tool.tool_name, terms, sum(terms.values())))
+                    for term in terms:
+                        self._postings[term].append(doc_id)
+
+        total = len(self._documents)
+        self._average_length = sum(doc[3] for doc in self._documents) / total if total else 0.0
+        self._idf = {term: self._compute_idf(len(doc_ids)) for term, doc_ids in self._postings.items()}
+        # IDF de um termo desconhecido: o maior possível
+        self._unknown_idf = self._compute_idf(0)
+
+    def _compute_idf(self, document_frequency: int) -> float:
+        total = len(self._documents)
+        return math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def rank(self, text: str, limit: Optional[int] = None) -> List[dict]:
+        """
+        Managers em ordem de relevância para o texto: [{manager_id, tool_name, score, coverage}],
+        com a melhor ferramenta de cada manager. Managers sem nenhum termo em comum ficam de fora.
+        """
+        query = set(tokenize(text))
+        if not query or not self._documents:
+            return []
+        query_weight = sum(self._idf.get(term, self._unknown_idf) for term in query)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in query:
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_id in self._postings[term]:
+                _, _, terms, length = self._documents[doc_id]
+                frequency = terms[term]
+                norm = _K1 * (1 - _B + _B * length / self._average_length)
+                scores[doc_id] += idf * frequency * (_K1 + 1) / (frequency + norm)
+
+        best: Dict[str, dict] = {}
+        for doc_id, score in scores.items():
+            manager_id, tool_name, terms, _ = self._documents[doc_id]
+            current = best.get(manager_id)
+            if current is not None and current["score"] >= score:
+                continue
+            covered = sum(self._idf[term] for term in query if term in terms)
+            best[manager_id] = {
+                "manager_id": manager_id,
+                "tool_name": tool_name,
+                "score": round(score, 4),
+                "coverage": round(covered / query_weight, 4),
+            }
+        ranked = sorted(best.values(), key=lambda candidate: candidate["score"], reverse=True)
+        return ranked[:limit] if limit else ranked
+
+    def coverage(self, text: str, manager_ids: Set[str]) -> Optional[float]:
+        """
+        Fração (ponderada por IDF) dos termos do texto que o catálogo conhece e que aparecem
+        em alguma ferramenta dos managers informados. None se nenhum termo é conhecido.
+        """
+        known = [term for term in set(tokenize(text)) if term in self._idf]
+        if not known:
+            return None
+        covered = sum(
+            self._idf[term] for term in known
+            if any(self._documents[doc_id][0] in manager_ids for doc_id in self._postings[term])
+        )
+        return covered / sum(self._idf[term] for term in known)
+
+
+def _fingerprint(managers: List[ManagerSchema]) -> tuple:
+    """Versão do catálogo: muda quando qualquer texto indexado ou o estado ativo muda."""
+    return tuple(
+        (manager.manager_id, manager.isActive, manager.description, tuple(
+            (agent.agent_id, agent.isActive, agent.description, tuple(
+                (tool.tool_name, tool.isActive, tool.description, tuple(tool.routing_hints or ()),
+                 tuple(parameter.name for parameter in tool.parameters_mandatory))
+                for tool in agent.tools
+            ))
+            for agent in manager.agents
+        ))
+        for manager in managers
+    )
+
+
+_index_cache = TTLCache(max_size=settings.CATALOG_INDEX_CACHE_SIZE, ttl_seconds=settings.CATALOG_INDEX_CACHE_TTL_SECONDS)
+
+
+def get_catalog_index(managers: List[ManagerSchema]) -> CatalogIndex:
+    """Índice do catálogo, reaproveitado entre tarefas de usuários com as mesmas definições."""
+    key = _fingerprint(managers)
+    index = _index_cache.get(key)
+    if index is None:
+        index = CatalogIndex(managers)
+        _index_cache.set(key, index)
+    return index
@@ -0,0 +1,97 @@
+# services/routing/catalog_pruning.py
+import logging
+from typing import List
+
+from config import settings
+from models.schemas import ExecutionContext, ManagerSchema
+from services.monitoring.metrics import metrics
+
+from .catalog_index import get_catalog_index
+
+CATALOG_PRUNING = metrics.counter(
+    "agent_catalog_pruning_total",
+    "Catálogos do prompt do delegador: 'pruned' (só os mais relevantes) ou o motivo de enviar o catálogo inteiro.",
+    ("outcome",),
+)
+CATALOG_MANAGERS_SENT = metrics.histogram(
+    "agent_delegator_catalog_managers",
+    "Managers enviados no prompt do delegador, por resultado da poda.",
+    ("outcome",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+class CatalogPruner:
+    """
+    Poda do catálogo no prompt do delegador: em vez de todos os managers do usuário,
+    vão os CATALOG_PRUNING_TOP_K mais relevantes para a pergunta e para as últimas
+    mensagens do usuário na sessão (índice lexical do catálogo, o mesmo do roteador rápido).
+    Managers do sistema e os que já produziram resultados na tarefa vão sempre.
+
+    Se a seleção não cobre a pergunta (termos da pergunta conhecidos pelo catálogo que só
+    aparecem em managers de fora), o catálogo vai inteiro. Numa pergunta sem nenhum termo
+    conhecido, a cobertura é a das mensagens recentes; sem elas, o catálogo também vai inteiro.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def select(self, context: ExecutionContext, chat_history: list) -> List[ManagerSchema]:
+        """Managers que entram no prompt do delegador, na ordem original do catálogo."""
+        managers = context.available_managers
+        if not settings.CATALOG_PRUNING_ENABLED:
+            return managers
+        active = [manager for manager in managers if manager.isActive]
+        if len(active) <= settings.CATALOG_PRUNING_MIN_MANAGERS:
+            return self._full(managers, "small_catalog")
+
+        index = get_catalog_index(managers)
+        query = " ".join([context.user_question] + self._recent_user_messages(chat_history, context.user_question))
+        ranked = index.rank(query, limit=settings.CATALOG_PRUNING_TOP_K)
+        selected = {candidate["manager_id"] for candidate in ranked}
+
+        confidence = index.coverage(context.user_question, selected)
+        if confidence is None:
+            # Pergunta de continuação ("e do mês passado?"): vale a cobertura do contexto da sessão
+            confidence = index.coverage(query, selected)
+        if confidence is None:
+            return self._full(managers, "no_match")
+        if confidence < settings.CATALOG_PRUNING_MIN_CONFIDENCE:
+            self.logger.info(
+                f"[CATALOG_PRUNING] Cobertura {confidence:.2f} abaixo do limite na sessão {context.session_id}: catálogo inteiro."
+            )
+            return self._full(managers, "low_confidence")
+
+        # Sempre presentes: managers do sistema e os que já executaram nesta tarefa
+        agents_with_results = set(context.previous_results)
+        pruned = [
+            manager for manager in active
+            if manager.manager_id in selected
+            or manager.is_system_tool
+            or any(agent.agent_id in agents_with_results for agent in manager.agents)
+        ]
+        CATALOG_PRUNING.inc(outcome="pruned")
+        CATALOG_MANAGERS_SENT.observe(len(pruned), outcome="pruned")
+        self.logger.info(
+            f"[CATALOG_PRUNING] {len(pruned)} de {len(active)} managers no prompt do delegador "
+            f"(cobertura {confidence:.2f}) na sessão {context.session_id}."
+        )
+        return pruned
+
+    @staticmethod
+    def _recent_user_messages(chat_history: list, question: str) -> List[str]:
+        limit = settings.CATALOG_PRUNING_HISTORY_MESSAGES
+        if not limit or not chat_history:
+            return []
+        # A pergunta atual já foi gravada no histórico antes da orquestração
+        messages = [
+            entry.get("message", "") for entry in chat_history
+            if isinstance(entry, dict) and entry.get("role") == "user" and entry.get("message") != question
+        ]
+        return messages[-limit:]
+
+    @staticmethod
+    def _full(managers: List[ManagerSchema], outcome: str) -> List[ManagerSchema]:
+        CATALOG_PRUNING.inc(outcome=outcome)
+        CATALOG_MANAGERS_SENT.observe(sum(1 for manager in managers if manager.isActive), outcome=outcome)
+        return managers
@@ -0,0 +1,91 @@
+# services/routing/fast_path_router.py
+import logging
+from typing import Optional
+
+from config import settings
+from models.schemas import ExecutionContext
+from services.logging.execution_logger import execution_logger
+from services.monitoring.metrics import metrics
+
+from .catalog_index import get_catalog_index
+
+ROUTER_DECISIONS = metrics.counter(
+    "agent_router_decisions_total",
+    "Decisões do roteador rápido no primeiro ciclo: 'fast_path' (direto ao manager) ou 'delegator' (LLM).",
+    ("outcome",),
+)
+ROUTER_CONFIDENCE = metrics.histogram(
+    "agent_router_confidence",
+    "Confiança (cobertura da pergunta pela melhor ferramenta) do roteador rápido, por decisão.",
+    ("outcome",),
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+
+class FastPathRouter:
+    """
+    Roteamento antes do delegador: pontua a pergunta contra as descrições dos managers e
+    ferramentas (índice lexical do catálogo) e, quando um manager se destaca com folga,
+    delega direto a ele, sem a chamada ao LLM delegador no primeiro ciclo.
+
+    O manager é escolhido quando:
+      - a confiança (fração da pergunta coberta pela melhor ferramenta) é pelo menos
+        FAST_PATH_MIN_CONFIDENCE;
+      - a margem sobre o segundo manager (1 - pontuação do segundo / do primeiro) é pelo
+        menos FAST_PATH_MIN_MARGIN.
+
+    Toda decisão, com os candidatos e as pontuações, vai para o log da aplicação, para o
+    log de execução (evento 'routing') e para as métricas, para calibrar os limites.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def route(self, context: ExecutionContext) -> Optional[dict]:
+        """Plano de ação 'call_manager' quando a confiança é alta; None para seguir com o delegador."""
+        if not settings.FAST_PATH_ROUTER_ENABLED:
+            return None
+
+        index = get_catalog_index(context.available_managers)
+        candidates = index.rank(context.user_question, limit=settings.FAST_PATH_LOG_CANDIDATES)
+        best = candidates[0] if candidates else None
+        confidence = best["coverage"] if best else 0.0
+        if len(candidates) > 1 and best["score"] > 0:
+            margin = 1 - candidates[1]["score"] / best["score"]
+        else:
+            margin = 1.0 if best else 0.0
+
+        fast_path = (
+            best is not None
+            and confidence >= settings.FAST_PATH_MIN_CONFIDENCE
+            and margin >= settings.FAST_PATH_MIN_MARGIN
+        )
+        outcome = "fast_path" if fast_path else "delegator"
+        decision = {
+            "outcome": outcome,
+            "manager_id": best["manager_id"] if fast_path else None,
+            "confidence": round(confidence, 4),
+            "margin": round(margin, 4),
+            "candidates": candidates,
+        }
+
+        ROUTER_DECISIONS.inc(outcome=outcome)
+        ROUTER_CONFIDENCE.observe(confidence, outcome=outcome)
+        self.logger.info(
+            f"[ROUTER] {outcome} (confiança={confidence:.2f}, margem={margin:.2f}) "
+            f"sessão {context.session_id}: "
+            + ", ".join(f"{c['manager_id']}/{c['tool_name']}={c['score']:.2f}" for c in candidates)
+        )
+        execution_logger.log_routing_decision(context.execution_id, decision)
+
+        if not fast_path:
+            return None
+        return {
+            "thought": (
+                f"[FAST_PATH] Pergunta roteada direto para '{best['manager_id']}' "
+                f"(ferramenta '{best['tool_name']}', confiança {confidence:.2f}, margem {margin:.2f})."
+            ),
+            "decision": "call_manager",
+            "manager_id": best["manager_id"],
+            "new_question": context.user_question,
+        }
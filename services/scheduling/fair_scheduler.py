@@ -0,0 +1,243 @@
+# services/scheduling/fair_scheduler.py
+import json
+import time
+from typing import List, Optional, Tuple
+
+from config import settings
+from services.cache.redis_connection import redis_connection
+from services.monitoring.metrics import metrics
+
+# Da maior para a menor prioridade. Cada uma é uma fila do Dramatiq (SCHEDULER_QUEUE_PREFIX + nome).
+PRIORITIES = ("high", "default", "low")
+
+SCHEDULER_DEFERRALS = metrics.counter(
+    "agent_scheduler_deferrals_total",
+    "Tickets adiados porque todos os usuários com tarefas na fila estavam no limite de concorrência.",
+    ("priority",),
+)
+
+# Enfileira a tarefa na fila do usuário e o coloca no anel da prioridade, se ainda não estiver.
+# KEYS: fila do usuário, anel, membros do anel, pesos, limites
+# ARGV: user_id, payload, peso, limite
+_SUBMIT_SCRIPT = """
+redis.call('RPUSH', KEYS[1], ARGV[2])
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[5], ARGV[1], ARGV[4])
+if redis.call('SADD', KEYS[3], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+return redis.call('LLEN', KEYS[1])
+"""
+
+# Deficit round-robin entre os usuários do anel de uma prioridade. Cada visita a um usuário
+# sem crédito soma o peso dele ao crédito; cada tarefa entregue custa 1. Com crédito
+# sobrando o usuário volta ao início do anel (é servido de novo na próxima chamada).
+# Usuários no limite de tarefas em voo são pulados. O ticket fica associado à tarefa
+# entregue (claimed:<ticket>), então um ticket reprocessado (retry, worker que caiu)
+# recebe a mesma tarefa em vez de consumir outra.
+# ARGV: prefixo, prioridade, ticket_id, agora (s), validade da reserva (s)
+_CLAIM_SCRIPT = """
+local prefix, priority, ticket = ARGV[1], ARGV[2], ARGV[3]
+local now, ttl = tonumber(ARGV[4]), tonumber(ARGV[5])
+local claimed_key = prefix .. 'claimed:' .. ticket
+local claimed = redis.call('GET', claimed_key)
+if claimed then
+    -- Ticket reprocessado (retry): a reserva vale por mais um período
+    redis.call('EXPIRE', claimed_key, ttl)
+    return claimed
+end
+
+local ring = prefix .. priority .. ':ring'
+local members = prefix .. priority .. ':members'
+local deficit = prefix .. priority .. ':deficit'
+local weights = prefix .. 'weights'
+local caps = prefix .. 'caps'
+
+for _ = 1, redis.call('LLEN', ring) do
+    local user = redis.call('LPOP', ring)
+    local queue = prefix .. priority .. ':q:' .. user
+    if redis.call('LLEN', queue) == 0 then
+        redis.call('SREM', members, user)
+        redis.call('HDEL', deficit, user)
+    else
+        local inflight = prefix .. 'inflight:' .. user
+        redis.call('ZREMRANGEBYSCORE', inflight, '-inf', now)
+        local cap = tonumber(redis.call('HGET', caps, user) or '0')
+        if cap > 0 and redis.call('ZCARD', inflight) >= cap then
+            redis.call('RPUSH', ring, user)
+        else
+            local credit = tonumber(redis.call('HGET', deficit, user) or '0')
+            if credit < 1 then
+                credit = credit + tonumber(redis.call('HGET', weights, user) or '1')
+            end
+            credit = credit - 1
+            local job = redis.call('LPOP', queue)
+            redis.call('ZADD', inflight, now + ttl, ticket)
+            redis.call('EXPIRE', inflight, ttl)
+            redis.call('SET', claimed_key, job, 'EX', ttl)
+            if redis.call('LLEN', queue) == 0 then
+                redis.call('SREM', members, user)
+                redis.call('HDEL', deficit, user)
+            else
+                redis.call('HSET', deficit, user, credit)
+                if credit >= 1 then
+                    redis.call('LPUSH', ring, user)
+                else
+                    redis.call('RPUSH', ring, user)
+                end
+            end
+            return job
+        end
+    end
+end
+return false
+"""
+
+# Devolve à fila do usuário a tarefa reservada por um ticket, liberando a vaga em voo.
+# Vai para o fim da fila: as demais tarefas do usuário não ficam presas atrás dela.
+# ARGV: prefixo, ticket_id
+_REQUEUE_SCRIPT = """
+local prefix, ticket = ARGV[1], ARGV[2]
+local claimed_key = prefix .. 'claimed:' .. ticket
+local job = redis.call('GET', claimed_key)
+if not job then
+    return false
+end
+local payload = cjson.decode(job)
+local user, priority = payload['user_id'], payload['priority']
+redis.call('DEL', claimed_key)
+redis.call('ZREM', prefix .. 'inflight:' .. user, ticket)
+redis.call('RPUSH', prefix .. priority .. ':q:' .. user, job)
+if redis.call('SADD', prefix .. priority .. ':members', user) == 1 then
+    redis.call('RPUSH', prefix .. priority .. ':ring', user)
+end
+return 1
+"""
+
+
+class FairScheduler:
+    """
+    Escalonamento justo das tarefas entre usuários, com filas por prioridade.
+
+    A rota /ask grava o payload na fila do usuário no Redis (por prioridade) e envia ao
+    Dramatiq apenas um ticket para a fila daquela prioridade. O worker, ao processar um
+    ticket, pede a próxima tarefa com 'claim': ela é escolhida por deficit round-robin
+    entre os usuários com tarefas pendentes (peso por tier), respeitando o limite de
+    tarefas em voo de cada usuário. Uma rajada de um usuário não passa na frente dos demais.
+
+    Tiers (SCHEDULER_TIERS) definem prioridade, peso e limite; SCHEDULER_USER_TIERS
+    associa usuários a tiers. A dica 'priority' da requisição substitui a do tier quando
+    SCHEDULER_ALLOW_PRIORITY_HINT está ativo.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FairScheduler, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def queue_name(priority: str) -> str:
+        return f"{settings.SCHEDULER_QUEUE_PREFIX}{priority}"
+
+    @staticmethod
+    def _key(*parts: str) -> str:
+        return settings.SCHEDULER_KEY_PREFIX + ":".join(parts)
+
+    def resolve(self, user_id: str, priority_hint: Optional[str] = None) -> Tuple[str, int, int]:
+        """(prioridade, peso, limite de tarefas em voo) do usuário segundo o tier dele."""
+        tier_name = settings.SCHEDULER_USER_TIERS.get(user_id, settings.SCHEDULER_DEFAULT_TIER)
+        tier = settings.SCHEDULER_TIERS.get(tier_name) or {}
+        priority = tier.get("priority", "default")
+        if priority_hint and settings.SCHEDULER_ALLOW_PRIORITY_HINT:
+            priority = priority_hint
+        if priority not in PRIORITIES:
+            priority = "default"
+        weight = max(1, int(tier.get("weight", 1)))
+        max_in_flight = max(0, int(tier.get("max_in_flight", 0)))
+        return priority, weight, max_in_flight
+
+    def submit(self, job_payload: dict, priority_hint: Optional[str] = None) -> str:
+        """Grava a tarefa na fila do usuário. Retorna a prioridade escolhida; o ticket é enviado por quem chamou."""
+        return self.submit_many([job_payload], [priority_hint])[0]
+
+    def submit_many(self, job_payloads: List[dict], priority_hints: List[Optional[str]]) -> List[str]:
+        """'submit' de várias tarefas num único pipeline do Redis (POST /ask/batch). Retorna as prioridades."""
+        submit_script = redis_connection.register_script(_SUBMIT_SCRIPT)
+        priorities = []
+        with redis_connection.get_client().pipeline(transaction=False) as pipe:
+            for job_payload, priority_hint in zip(job_payloads, priority_hints):
+                user_id = job_payload["user_id"]
+                priority, weight, max_in_flight = self.resolve(user_id, priority_hint)
+                job_payload["priority"] = priority
+                priorities.append(priority)
+                submit_script(
+                    keys=[
+                        self._key(priority, "q", user_id),
+                        self._key(priority, "ring"),
+                        self._key(priority, "members"),
+                        self._key("weights"),
+                        self._key("caps"),
+                    ],
+                    args=[user_id, json.dumps(job_payload, ensure_ascii=False), weight, max_in_flight],
+                    client=pipe,
+                )
+            pipe.execute()
+        return priorities
+
+    def claim(self, priority: str, ticket_id: str) -> Optional[dict]:
+        """Próxima tarefa da prioridade para este ticket, ou None se todos os usuários estiverem no limite."""
+        raw = redis_connection.register_script(_CLAIM_SCRIPT)(args=[
+            settings.SCHEDULER_KEY_PREFIX, priority, ticket_id, time.time(), settings.SCHEDULER_CLAIM_TTL_SECONDS
+        ])
+        if not raw:
+            SCHEDULER_DEFERRALS.inc(priority=priority)
+            return None
+        return json.loads(raw)
+
+    def requeue(self, ticket_id: str) -> bool:
+        """
+        Devolve à fila do usuário a tarefa reservada para o ticket e libera a vaga dele.
+        Usado quando a tarefa ainda não pode executar (outra da sessão vem antes): a reserva
+        não ocupa o limite de tarefas em voo enquanto ela espera. O ticket, ao voltar,
+        pede uma tarefa nova com 'claim'.
+        """
+        try:
+            return bool(redis_connection.register_script(_REQUEUE_SCRIPT)(args=[settings.SCHEDULER_KEY_PREFIX, ticket_id]))
+        except Exception as e:
+            # A reserva expira sozinha em SCHEDULER_CLAIM_TTL_SECONDS
+            print(f"[SCHEDULER] Falha ao devolver a tarefa do ticket {ticket_id} à fila: {e}")
+            return False
+
+    def withdraw(self, job_payload: dict) -> bool:
+        """
+        Retira da fila do usuário uma tarefa gravada por 'submit' e ainda não reservada
+        (ticket que não chegou ao Dramatiq). False se ela já foi reservada por outro ticket.
+        """
+        queue = self._key(job_payload["priority"], "q", job_payload["user_id"])
+        raw = json.dumps(job_payload, ensure_ascii=False)
+        return redis_connection.get_client().lrem(queue, 1, raw) > 0
+
+    def release(self, ticket_id: str) -> Optional[dict]:
+        """
+        Libera a vaga do usuário ao fim da tarefa do ticket (sucesso ou tentativas esgotadas).
+        Retorna a tarefa que estava reservada para o ticket, se ainda havia reserva.
+        """
+        try:
+            client = redis_connection.get_client()
+            raw = client.get(self._key("claimed", ticket_id))
+            if raw is None:
+                return None
+            job_payload = json.loads(raw)
+            pipe = client.pipeline(transaction=False)
+            pipe.zrem(self._key("inflight", job_payload["user_id"]), ticket_id)
+            pipe.delete(self._key("claimed", ticket_id))
+            pipe.execute()
+            return job_payload
+        except Exception as e:
+            # A reserva expira sozinha em SCHEDULER_CLAIM_TTL_SECONDS
+            print(f"[SCHEDULER] Falha ao liberar o ticket {ticket_id}: {e}")
+            return None
+
+
+fair_scheduler = FairScheduler()
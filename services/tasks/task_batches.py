@@ -0,0 +1,112 @@
+# services/tasks/task_batches.py
+import json
+import time
+from typing import List, Optional
+
+from redis.exceptions import RedisError
+
+from config import settings
+from services.cache.redis_connection import redis_connection
+
+# Marca a tarefa como concluída no lote. Retorna 1 apenas para quem concluiu a última
+# tarefa (uma única vez por lote): essa chamada envia o callback agregado.
+# KEYS: concluídas (SET), disparo (flag); ARGV: task_id, total, validade (s)
+_FINISH_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if redis.call('SCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    return 0
+end
+if redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[3]) then
+    return 1
+end
+return 0
+"""
+
+
+class TaskBatchTracker:
+    """
+    Lotes enviados por POST /api/v1/ask/batch com 'webhook_url': o worker marca cada
+    tarefa do lote ao terminar de vez (resposta, falha final ou tentativas esgotadas) e,
+    na última, o lote recebe um único callback com o estado de todas as tarefas.
+
+    A contagem é feita por tarefa concluída, não por mensagem do Dramatiq: com o
+    escalonador e a ordem por sessão, uma mensagem pode terminar sem executar a tarefa
+    (ticket adiado), e uma tarefa reexecutada não conta duas vezes.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskBatchTracker, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def _key(batch_id: str, *parts: str) -> str:
+        return settings.TASK_BATCH_KEY_PREFIX + ":".join((batch_id,) + parts)
+
+    def create(self, batch_id: str, task_ids: List[str], webhook_url: str, addressing_info: Optional[dict] = None):
+        """Grava o lote antes do envio das tarefas (o worker pode terminar a primeira antes desta rota continuar)."""
+        record = {
+            "batch_id": batch_id,
+            "task_ids": task_ids,
+            "webhook_url": webhook_url,
+            "addressing_info": addressing_info or {},
+            "created_at": time.time(),
+        }
+        redis_connection.get_client().set(
+            self._key(batch_id), json.dumps(record, ensure_ascii=False), ex=settings.TASK_STATUS_TTL_SECONDS
+        )
+
+    def shrink(self, batch_id: str, task_ids: List[str]) -> Optional[dict]:
+        """
+        Reduz o lote às tarefas que chegaram ao worker (falha no meio do envio); sem nenhuma,
+        o lote é apagado. Retorna o registro se todas elas já terminaram: quem chamou envia
+        o callback agregado, que nenhum worker enviaria mais.
+        """
+        client = redis_connection.get_client()
+        batch = self.get(batch_id)
+        if batch is None:
+            return None
+        if not task_ids:
+            client.delete(self._key(batch_id))
+            return None
+        batch["task_ids"] = task_ids
+        client.set(self._key(batch_id), json.dumps(batch, ensure_ascii=False), ex=settings.TASK_STATUS_TTL_SECONDS)
+        done = client.smembers(self._key(batch_id, "done"))
+        if set(task_ids) <= set(done) and client.set(
+            self._key(batch_id, "fired"), "1", nx=True, ex=settings.TASK_STATUS_TTL_SECONDS
+        ):
+            return batch
+        return None
+
+    def get(self, batch_id: str) -> Optional[dict]:
+        raw = redis_connection.get_client().get(self._key(batch_id))
+        return json.loads(raw) if raw else None
+
+    def task_finished(self, job_payload: dict) -> Optional[dict]:
+        """
+        Marca a tarefa do payload como concluída no lote dela. Retorna o registro do lote
+        quando esta foi a última tarefa (quem chamou envia o callback agregado), senão None.
+        """
+        batch_id = job_payload.get("batch_id")
+        if not batch_id:
+            return None
+        try:
+            batch = self.get(batch_id)
+            if batch is None:
+                # Lote expirado (TASK_STATUS_TTL_SECONDS)
+                return None
+            finished = redis_connection.register_script(_FINISH_SCRIPT)(
+                keys=[self._key(batch_id, "done"), self._key(batch_id, "fired")],
+                args=[job_payload["task_id"], len(batch["task_ids"]), settings.TASK_STATUS_TTL_SECONDS],
+            )
+            return batch if finished else None
+        except RedisError as e:
+            print(f"[TASK_BATCH] Falha ao registrar a conclusão da tarefa {job_payload.get('task_id')} no lote {batch_id}: {e}")
+            return None
+
+
+task_batches = TaskBatchTracker()
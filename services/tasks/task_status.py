@@ -0,0 +1,168 @@
+# services/tasks/task_status.py
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo.collection import Collection
+from redis.exceptions import RedisError
+
+from config import settings
+from services.cache.redis_connection import redis_connection
+from services.database.mongo_connection import mongo_connection
+
+QUEUED = "queued"
+RUNNING = "running"
+RETRYING = "retrying"  # tentativa falhou e o Dramatiq vai repetir
+PENDING_INPUT = "pending_input"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Estados finais: também vão para o MongoDB, para que a resposta sobreviva à expiração no Redis
+# e a uma falha do webhook.
+TERMINAL_STATUSES = (PENDING_INPUT, COMPLETED, FAILED)
+
+
+class TaskStatusStore:
+    """
+    Estado e resultado de cada tarefa, por task_id. O Redis guarda o registro completo
+    com TTL (TASK_STATUS_TTL_SECONDS) e atende as consultas; estados finais são gravados
+    também na coleção 'task_results' do MongoDB, usada quando o Redis não tem a chave
+    (expirada ou Redis indisponível). Se o Redis falhar na escrita, qualquer estado vai para o MongoDB.
+    """
+    _instance = None
+    _collection_name = "task_results"
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskStatusStore, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def _key(task_id: str) -> str:
+        return f"{settings.TASK_STATUS_KEY_PREFIX}{task_id}"
+
+    def _get_collection(self) -> Optional[Collection]:
+        try:
+            return mongo_connection.get_collection(self._collection_name, usage="logs")
+        except Exception as e:
+            print(f"[TASK_STATUS] ERRO: Não foi possível conectar ao MongoDB. {e}")
+            return None
+
+    def ensure_indexes(self):
+        """Cria os índices da coleção. Executado no bootstrap (job.ensure_indexes), não no import."""
+        collection = self._get_collection()
+        if collection is None:
+            raise RuntimeError("Sem conexão com o MongoDB para criar os índices de task_results.")
+        collection.create_index("task_id", unique=True)
+        # O MongoDB apaga os resultados vencidos (o mesmo prazo do Redis, por padrão)
+        collection.create_index("expires_at", expireAfterSeconds=0)
+
+    @staticmethod
+    def _record(job_payload: dict, status: str, final_output: Optional[str] = None,
+                required_params: Optional[List[str]] = None) -> dict:
+        return {
+            "task_id": job_payload["task_id"],
+            "status": status,
+            "session_id": job_payload.get("session_id"),
+            "user_id": job_payload.get("user_id"),
+            "enqueued_at": job_payload.get("enqueued_at"),
+            "updated_at": time.time(),
+            "final_output": final_output,
+            "required_params": required_params,
+        }
+
+    def set_status(self, job_payload: dict, status: str, final_output: Optional[str] = None,
+                   required_params: Optional[List[str]] = None):
+        """Grava o estado atual da tarefa do payload. Falhas de armazenamento não interrompem a tarefa."""
+        task_id = job_payload.get("task_id")
+        if not task_id:
+            return
+        record = self._record(job_payload, status, final_output, required_params)
+
+        stored_in_redis = True
+        try:
+            redis_connection.get_client().set(
+                self._key(task_id), json.dumps(record, ensure_ascii=False), ex=settings.TASK_STATUS_TTL_SECONDS
+            )
+        except RedisError as e:
+            stored_in_redis = False
+            print(f"[TASK_STATUS] Falha ao gravar o estado da tarefa {task_id} no Redis: {e}")
+
+        if status in TERMINAL_STATUSES or not stored_in_redis:
+            self._save_to_mongo(record)
+
+    def set_status_many(self, job_payloads: List[dict], status: str):
+        """'set_status' de várias tarefas num único pipeline do Redis (POST /ask/batch)."""
+        records = [self._record(job_payload, status) for job_payload in job_payloads if job_payload.get("task_id")]
+        if not records:
+            return
+
+        stored_in_redis = True
+        try:
+            with redis_connection.get_client().pipeline(transaction=False) as pipe:
+                for record in records:
+                    pipe.set(self._key(record["task_id"]), json.dumps(record, ensure_ascii=False),
+                             ex=settings.TASK_STATUS_TTL_SECONDS)
+                pipe.execute()
+        except RedisError as e:
+            stored_in_redis = False
+            print(f"[TASK_STATUS] Falha ao gravar o estado de {len(records)} tarefas no Redis: {e}")
+
+        if status in TERMINAL_STATUSES or not stored_in_redis:
+            for record in records:
+                self._save_to_mongo(record)
+
+    def delete_many(self, task_ids: List[str]):
+        """Apaga do Redis o estado de tarefas que não chegaram à fila (falha no envio do lote)."""
+        if not task_ids:
+            return
+        try:
+            redis_connection.get_client().delete(*[self._key(task_id) for task_id in task_ids])
+        except RedisError as e:
+            print(f"[TASK_STATUS] Falha ao apagar o estado de {len(task_ids)} tarefas no Redis: {e}")
+
+    def _save_to_mongo(self, record: dict):
+        collection = self._get_collection()
+        if collection is None:
+            return
+        document = dict(record, expires_at=datetime.utcnow() + timedelta(seconds=settings.TASK_STATUS_TTL_SECONDS))
+        try:
+            collection.replace_one({"task_id": record["task_id"]}, document, upsert=True)
+        except Exception as e:
+            print(f"[TASK_STATUS] Falha ao gravar o resultado da tarefa {record['task_id']} no MongoDB: {e}")
+
+    def get(self, task_id: str) -> Optional[dict]:
+        return self.get_many([task_id]).get(task_id)
+
+    def get_many(self, task_ids: List[str]) -> Dict[str, Optional[dict]]:
+        """Estado de várias tarefas: um MGET no Redis e uma única consulta ao MongoDB para as que faltarem."""
+        task_ids = list(dict.fromkeys(task_ids))
+        results: Dict[str, Optional[dict]] = {task_id: None for task_id in task_ids}
+        if not task_ids:
+            return results
+
+        missing = task_ids
+        try:
+            raw_values = redis_connection.get_client().mget([self._key(task_id) for task_id in task_ids])
+            missing = []
+            for task_id, raw in zip(task_ids, raw_values):
+                if raw is None:
+                    missing.append(task_id)
+                else:
+                    results[task_id] = json.loads(raw)
+        except RedisError as e:
+            print(f"[TASK_STATUS] Falha ao ler estados no Redis, consultando o MongoDB: {e}")
+
+        if missing:
+            collection = self._get_collection()
+            if collection is not None:
+                try:
+                    for document in collection.find({"task_id": {"$in": missing}}, {"_id": 0, "expires_at": 0}):
+                        results[document["task_id"]] = document
+                except Exception as e:
+                    print(f"[TASK_STATUS] Falha ao consultar estados no MongoDB: {e}")
+        return results
+
+
+task_status_store = TaskStatusStore()
@@ -0,0 +1,209 @@
+# services/webhooks/webhook_delivery.py
+import asyncio
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+from pymongo.collection import Collection
+
+from config import settings
+from services.database.mongo_connection import mongo_connection
+from services.monitoring.metrics import metrics
+
+WEBHOOK_DELIVERIES = metrics.counter(
+    "agent_webhook_deliveries_total",
+    "Tentativas de entrega de callbacks por resultado (delivered, retry, rejected, dead_letter).",
+    ("status",),
+)
+
+# Respostas que indicam falha temporária do receptor: a entrega é tentada de novo.
+_RETRIABLE_STATUS = {408, 425, 429}
+
+
+class WebhookDeliveryError(Exception):
+    """Falha na entrega de um callback. 'retriable' é False quando o receptor recusou o conteúdo (4xx)."""
+
+    def __init__(self, message: str, retriable: bool = True, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.retriable = retriable
+        self.status_code = status_code
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.items: List[tuple] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class WebhookDelivery:
+    """
+    Entrega dos callbacks de tarefa. Um loop asyncio em thread própria mantém um único
+    httpx.AsyncClient com pool de conexões (WEBHOOK_POOL_MAX_CONNECTIONS); as threads do
+    worker apenas submetem a entrega e esperam o resultado.
+
+    Com WEBHOOK_BATCH_MAX_SIZE > 1, callbacks para a mesma URL que chegam dentro de
+    WEBHOOK_BATCH_MAX_WAIT_MS são enviados num único POST {"callbacks": [...]}; o resultado
+    do POST vale para todos os callbacks do lote.
+    """
+    _instance = None
+    _dead_letter_collection = "webhook_dead_letters"
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(WebhookDelivery, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._loop = None
+            cls._instance._client = None
+            cls._instance._batches = {}
+        return cls._instance
+
+    def _reset_after_fork(self):
+        # A thread do loop não existe no processo filho: ele cria a sua no primeiro uso.
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._batches = {}
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="webhook-delivery", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Criado dentro do loop: o pool de conexões pertence a ele.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.WEBHOOK_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.WEBHOOK_POOL_MAX_CONNECTIONS
+                )
+            )
+        return self._client
+
+    def deliver(self, url: str, payload: dict) -> int:
+        """
+        Envia o callback e bloqueia até a resposta. Retorna o status HTTP ou levanta
+        WebhookDeliveryError (o actor de entrega decide se tenta de novo).
+        """
+        timeout = settings.WEBHOOK_TIMEOUT_SECONDS + settings.WEBHOOK_BATCH_MAX_WAIT_MS / 1000 + 1
+        future = asyncio.run_coroutine_threadsafe(self._deliver(url, payload), self._get_loop())
+        try:
+            status_code = future.result(timeout=timeout)
+        except WebhookDeliveryError as e:
+            WEBHOOK_DELIVERIES.inc(status="retry" if e.retriable else "rejected")
+            raise
+        except Exception as e:
+            future.cancel()
+            WEBHOOK_DELIVERIES.inc(status="retry")
+            raise WebhookDeliveryError(f"Entrega para {url} não concluída: {e!r}") from e
+        WEBHOOK_DELIVERIES.inc(status="delivered")
+        return status_code
+
+    async def _deliver(self, url: str, payload: dict) -> int:
+        if settings.WEBHOOK_BATCH_MAX_SIZE <= 1:
+            return await self._post(url, payload)
+
+        future = asyncio.get_running_loop().create_future()
+        batch = self._batches.setdefault(url, _PendingBatch())
+        batch.items.append((payload, future))
+        if len(batch.items) >= settings.WEBHOOK_BATCH_MAX_SIZE:
+            self._flush(url)
+        elif batch.timer is None:
+            batch.timer = asyncio.get_running_loop().call_later(
+                settings.WEBHOOK_BATCH_MAX_WAIT_MS / 1000, self._flush, url
+            )
+        return await future
+
+    def _flush(self, url: str):
+        batch = self._batches.pop(url, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        asyncio.get_running_loop().create_task(self._send_batch(url, batch.items))
+
+    async def _send_batch(self, url: str, items: List[tuple]):
+        # Lote de um só callback segue no formato normal, sem o envelope.
+        body = items[0][0] if len(items) == 1 else {"callbacks": [payload for payload, _ in items]}
+        try:
+            status_code = await self._post(url, body)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in items:
+            if not future.done():
+                future.set_result(status_code)
+
+    async def _post(self, url: str, body: dict) -> int:
+        try:
+            response = await self._get_client().post(url, json=body)
+        except httpx.HTTPError as e:
+            raise WebhookDeliveryError(f"Erro de rede ao enviar para {url}: {e!r}") from e
+        if response.status_code < 300:
+            return response.status_code
+        retriable = response.status_code >= 500 or response.status_code in _RETRIABLE_STATUS
+        raise WebhookDeliveryError(
+            f"{url} respondeu {response.status_code}", retriable=retriable, status_code=response.status_code
+        )
+
+    # --- Dead-letter ---
+
+    def _get_collection(self) -> Optional[Collection]:
+        try:
+            return mongo_connection.get_collection(self._dead_letter_collection, usage="logs")
+        except Exception as e:
+            print(f"[WEBHOOK] ERRO: Não foi possível conectar ao MongoDB. {e}")
+            return None
+
+    def ensure_indexes(self):
+        """Cria os índices da coleção. Executado no bootstrap (job.ensure_indexes), não no import."""
+        collection = self._get_collection()
+        if collection is None:
+            raise RuntimeError("Sem conexão com o MongoDB para criar os índices de webhook_dead_letters.")
+        collection.create_index("task_id")
+        collection.create_index([("status", 1), ("failed_at", 1)])
+
+    def record_dead_letter(self, url: str, payload: dict, retries: int, error: Optional[str] = None):
+        """Guarda o callback que esgotou as tentativas, para consulta e reenvio (job.replay_webhooks)."""
+        WEBHOOK_DELIVERIES.inc(status="dead_letter")
+        collection = self._get_collection()
+        if collection is None:
+            return
+        try:
+            collection.insert_one({
+                "task_id": payload.get("task_id"),
+                "webhook_url": url,
+                "callback_payload": payload,
+                "retries": retries,
+                "error": error,
+                "status": "dead",
+                "failed_at": datetime.utcnow(),
+            })
+        except Exception as e:
+            print(f"[WEBHOOK] Falha ao gravar o callback da tarefa {payload.get('task_id')} na dead-letter: {e}")
+
+    def pending_dead_letters(self, limit: int = 100) -> List[Dict]:
+        collection = self._get_collection()
+        if collection is None:
+            return []
+        return list(collection.find({"status": "dead"}).sort("failed_at", 1).limit(limit))
+
+    def mark_replayed(self, document_id):
+        collection = self._get_collection()
+        if collection is not None:
+            collection.update_one({"_id": document_id}, {"$set": {"status": "replayed", "replayed_at": datetime.utcnow()}})
+
+
+webhook_delivery = WebhookDelivery()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=webhook_delivery._reset_after_fork)
@@ -0,0 +1,150 @@
+# test/test_lua_scripts.py
+"""
+Scripts Lua da idempotência (services/idempotency) e do escalonador (services/scheduling),
+executados no fakeredis. Requer `fakeredis[lua]`; sem ele os testes são pulados.
+"""
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("QDRANT_URL", "localhost")
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from config import settings
+from services.cache.redis_connection import redis_connection
+from services.idempotency.task_idempotency import DUPLICATE, RUN, WAIT, task_guard
+from services.scheduling.fair_scheduler import fair_scheduler
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_ENABLED", True)
+    monkeypatch.setattr(settings, "SESSION_ORDERING_ENABLED", True)
+    previous = redis_connection._client
+    client = fakeredis.FakeRedis(decode_responses=True)
+    redis_connection.set_client(client)
+    yield client
+    redis_connection.set_client(previous)
+
+
+def _job(task_id, session_id="s1", submission_id=None, enqueued_at=None, user_id="u1"):
+    return {
+        "task_id": task_id,
+        "session_id": session_id,
+        "user_id": user_id,
+        "submission_id": submission_id or f"sub-{task_id}",
+        "enqueued_at": enqueued_at or time.time(),
+    }
+
+
+# --- Idempotência ---
+
+def test_duplicate_submission_is_rejected():
+    first = _job("t1")
+    assert task_guard.register_submission(first) is None
+    assert task_guard.acquire(first) == RUN
+
+    retry = _job("t1", submission_id="sub-retry")
+    existing = task_guard.register_submission(retry)
+    assert existing["submission_id"] == first["submission_id"]
+    # Outra mensagem da mesma tarefa enquanto o lease é da primeira submissão
+    assert task_guard.acquire(retry) == DUPLICATE
+    # A reentrega da mensagem original (mesmo dono) retoma a execução
+    assert task_guard.acquire(first) == RUN
+
+
+def test_session_tasks_run_in_arrival_order():
+    now = time.time()
+    first, second = _job("t1", enqueued_at=now), _job("t2", enqueued_at=now + 1)
+    task_guard.register_submission(first)
+    task_guard.register_submission(second)
+
+    assert task_guard.acquire(second) == WAIT
+    assert task_guard.acquire(first) == RUN
+    assert task_guard.acquire(second) == WAIT
+
+    task_guard.release(first, finished=True)
+    assert task_guard.acquire(second) == RUN
+
+
+def test_failed_attempt_keeps_its_place_in_the_session():
+    now = time.time()
+    first, second = _job("t1", enqueued_at=now), _job("t2", enqueued_at=now + 1)
+    task_guard.register_submission(first)
+    task_guard.register_submission(second)
+
+    assert task_guard.acquire(first) == RUN
+    task_guard.release(first, finished=False)
+    assert task_guard.acquire(second) == WAIT
+    assert task_guard.acquire(first) == RUN
+
+
+def test_stale_session_head_is_evicted(fake_redis):
+    lost = _job("lost", enqueued_at=time.time() - settings.IDEMPOTENCY_LEASE_TTL_SECONDS - 60)
+    current = _job("t2")
+    task_guard.register_submission(lost)
+    task_guard.register_submission(current)
+
+    # A tarefa à frente não tem lease e foi enfileirada há mais que a validade: mensagem perdida
+    assert task_guard.acquire(current) == RUN
+    order = fake_redis.zrange(task_guard._key("session", "s1"), 0, -1)
+    assert order == ["t2"]
+
+
+def test_running_session_head_is_not_evicted():
+    old = _job("t1", enqueued_at=time.time() - settings.IDEMPOTENCY_LEASE_TTL_SECONDS - 60)
+    current = _job("t2")
+    task_guard.register_submission(old)
+    task_guard.register_submission(current)
+
+    assert task_guard.acquire(old) == RUN
+    assert task_guard.acquire(current) == WAIT
+
+
+# --- Escalonador ---
+
+@pytest.fixture
+def tiers(monkeypatch):
+    monkeypatch.setattr(settings, "SCHEDULER_TIERS", {
+        "default": {"priority": "default", "weight": 1, "max_in_flight": 0},
+        "limited": {"priority": "default", "weight": 1, "max_in_flight": 1},
+    })
+    monkeypatch.setattr(settings, "SCHEDULER_USER_TIERS", {"capped": "limited"})
+    monkeypatch.setattr(settings, "SCHEDULER_DEFAULT_TIER", "default")
+
+
+def test_capped_user_is_skipped(tiers):
+    fair_scheduler.submit(_job("c1", user_id="capped"))
+    fair_scheduler.submit(_job("c2", user_id="capped"))
+    fair_scheduler.submit(_job("f1", user_id="free"))
+
+    assert fair_scheduler.claim("default", "ticket-1")["task_id"] == "c1"
+    # 'capped' está no limite (1 em voo): a vez passa para 'free'
+    assert fair_scheduler.claim("default", "ticket-2")["task_id"] == "f1"
+    assert fair_scheduler.claim("default", "ticket-3") is None
+
+    fair_scheduler.release("ticket-1")
+    assert fair_scheduler.claim("default", "ticket-3")["task_id"] == "c2"
+
+
+def test_retried_ticket_gets_the_same_job(tiers):
+    fair_scheduler.submit(_job("t1", user_id="free"))
+    fair_scheduler.submit(_job("t2", user_id="free"))
+
+    claimed = fair_scheduler.claim("default", "ticket-1")
+    assert fair_scheduler.claim("default", "ticket-1") == claimed
+    assert fair_scheduler.claim("default", "ticket-2")["task_id"] == "t2"
+
+
+def test_requeued_job_frees_the_slot(tiers):
+    fair_scheduler.submit(_job("c1", user_id="capped"))
+    fair_scheduler.submit(_job("c2", user_id="capped"))
+
+    assert fair_scheduler.claim("default", "ticket-1")["task_id"] == "c1"
+    assert fair_scheduler.requeue("ticket-1")
+    # A tarefa devolvida vai para o fim da fila do usuário
+    assert fair_scheduler.claim("default", "ticket-2")["task_id"] == "c2"
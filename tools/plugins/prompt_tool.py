@@ -37,7 +37,7 @@ class PromptExecutionTool(BaseTool):
         try:
             gemini = GeminiAdapter()
             # Executa a LLM com o prompt formatado
-            result = gemini.generate(formatted_prompt)
+            result = gemini.generate(formatted_prompt, operation="prompt_tool")
             return ToolResult(success=True, output=result)
         except Exception as e:
             return ToolResult(success=False, output=f"Ocorreu um erro ao executar o prompt na LLM: {e}")
\ No newline at end of file
@@ -1,55 +1,153 @@
 # tools/registry.py
-from typing import Dict, Type
+from typing import Dict, List, Optional, Tuple
 from .base_tool import BaseTool
+import ast
 import pkgutil
 import importlib
 import inspect
 import logging
+import os
+import threading
 
 class ToolRegistry:
     def __init__(self):
         self._tools: Dict[str, BaseTool] = {}
+        # Manifesto: nome da ferramenta -> (módulo, classe). Nenhum plugin é importado para montá-lo.
+        self._manifest: Dict[str, Tuple[str, str]] = {}
+        # Módulos cujo nome de ferramenta não pôde ser determinado estaticamente.
+        self._unresolved_modules: List[str] = []
+        self._lock = threading.RLock()
         self.logger = logging.getLogger(__name__)
-        self._discover_and_register_tools()
+        self._build_manifest()
 
-    def _discover_and_register_tools(self):
+    def _build_manifest(self):
         """
-        Escaneia o pacote 'tools.plugins', encontra classes que herdam de BaseTool
-        e as registra automaticamente.
+        Escaneia o código-fonte do pacote 'tools.plugins' e registra, para cada classe
+        que herda de BaseTool, o nome da ferramenta e o módulo onde ela está definida.
+        Os módulos só são importados no primeiro 'get_tool' que precisar deles.
         """
         import tools.plugins as plugins_package
-        
-        self.logger.info("Iniciando descoberta de ferramentas...")
-        
-        # Itera sobre todos os módulos dentro do pacote 'tools.plugins'
-        for _, module_name, _ in pkgutil.iter_modules(plugins_package.__path__, plugins_package.__name__ + "."):
+
+        self.logger.info("Montando manifesto de ferramentas...")
+
+        for module_info in pkgutil.iter_modules(plugins_package.__path__):
+            module_name = f"{plugins_package.__name__}.{module_info.name}"
+            source_path = os.path.join(module_info.module_finder.path, f"{module_info.name}.py")
+            try:
+                with open(source_path, "r", encoding="utf-8") as file:
+                    tree = ast.parse(file.read(), filename=source_path)
+            except (OSError, SyntaxError) as e:
+                self.logger.warning(f"Não foi possível analisar '{module_name}' estaticamente ({e}). Será importado sob demanda.")
+                self._unresolved_modules.append(module_name)
+                continue
+
+            for class_name, tool_name in self._find_tool_classes(tree):
+                if tool_name is None:
+                    if module_name not in self._unresolved_modules:
+                        self._unresolved_modules.append(module_name)
+                    continue
+                if tool_name in self._manifest:
+                    self.logger.warning(f"Ferramenta '{tool_name}' já registrada no manifesto. Sobrescrevendo.")
+                self._manifest[tool_name] = (module_name, class_name)
+
+        self.logger.info(f"Manifesto de ferramentas pronto com {len(self._manifest)} entradas.")
+
+    @staticmethod
+    def _find_tool_classes(tree: ast.Module) -> List[Tuple[str, Optional[str]]]:
+        """
+        Retorna (nome_da_classe, nome_da_ferramenta) para cada classe que herda de BaseTool.
+        O nome da ferramenta é lido do 'return' literal da propriedade 'name'; quando
+        não é um literal, retorna None e o módulo é resolvido por importação.
+        """
+        found = []
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+            base_names = {
+                base.id if isinstance(base, ast.Name) else getattr(base, "attr", None)
+                for base in node.bases
+            }
+            if "BaseTool" not in base_names:
+                continue
+
+            tool_name = None
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef) and item.name == "name":
+                    returns = [n for n in ast.walk(item) if isinstance(n, ast.Return)]
+                    if len(returns) == 1 and isinstance(returns[0].value, ast.Constant) \
+                            and isinstance(returns[0].value.value, str):
+                        tool_name = returns[0].value.value
+            found.append((node.name, tool_name))
+        return found
+
+    def _register_instance(self, instance: BaseTool):
+        if instance.name in self._tools:
+            self.logger.warning(f"Ferramenta '{instance.name}' já registrada. Sobrescrevendo.")
+        self._tools[instance.name] = instance
+        self.logger.info(f"✅ Ferramenta '{instance.name}' registrada com sucesso.")
+
+    def _load_from_manifest(self, tool_name: str) -> Optional[BaseTool]:
+        """Importa o módulo do plugin e instancia a ferramenta indicada pelo manifesto."""
+        module_name, class_name = self._manifest[tool_name]
+        try:
+            module = importlib.import_module(module_name)
+            instance = getattr(module, class_name)({})
+        except Exception as e:
+            self.logger.error(f"Falha ao carregar a ferramenta '{tool_name}' do módulo '{module_name}': {e}")
+            return None
+
+        if instance.name != tool_name:
+            self.logger.warning(
+                f"Manifesto indicava '{tool_name}', mas '{class_name}' se registra como '{instance.name}'."
+            )
+        self._register_instance(instance)
+        return self._tools.get(tool_name)
+
+    def _load_unresolved_modules(self):
+        """
+        Importa os módulos que não puderam ser resolvidos pelo manifesto e registra
+        todas as classes que herdam de BaseTool encontradas neles.
+        """
+        while self._unresolved_modules:
+            module_name = self._unresolved_modules.pop(0)
             try:
                 module = importlib.import_module(module_name)
-                
-                for name, obj in inspect.getmembers(module, inspect.isclass):
-                    # Verifica se a classe é uma subclasse de BaseTool e não a própria BaseTool
-                    if issubclass(obj, BaseTool) and obj is not BaseTool:
-                        # Instancia a classe e a registra usando a propriedade 'name'
-                        instance = obj({})
-                        if instance.name in self._tools:
-                            self.logger.warning(f"Ferramenta '{instance.name}' já registrada. Sobrescrevendo.")
-                        
-                        self._tools[instance.name] = instance
-                        self.logger.info(f"✅ Ferramenta '{instance.name}' registrada com sucesso.")
-            
+                for _, obj in inspect.getmembers(module, inspect.isclass):
+                    if issubclass(obj, BaseTool) and obj is not BaseTool and obj.__module__ == module_name:
+                        self._register_instance(obj({}))
             except Exception as e:
                 self.logger.error(f"Falha ao carregar ou registrar ferramentas do módulo '{module_name}': {e}")
 
-
     def get_tool(self, tool_name: str) -> BaseTool:
-        """Obtém uma ferramenta pelo nome"""
+        """Obtém uma ferramenta pelo nome, importando o plugin no primeiro uso."""
         tool = self._tools.get(tool_name)
+        if tool:
+            return tool
+
+        with self._lock:
+            tool = self._tools.get(tool_name)
+            if not tool and tool_name in self._manifest:
+                tool = self._load_from_manifest(tool_name)
+            if not tool and self._unresolved_modules:
+                self._load_unresolved_modules()
+                tool = self._tools.get(tool_name)
+
         if not tool:
             raise ValueError(f"Ferramenta '{tool_name}' não registrada")
         return tool
-    
+
+    def list_tool_names(self) -> List[str]:
+        """Lista os nomes conhecidos pelo manifesto sem importar nenhum plugin."""
+        with self._lock:
+            return sorted(set(self._manifest) | set(self._tools))
+
     def list_tools(self) -> Dict[str, BaseTool]:
-        """Lista todas as ferramentas registradas"""
-        return self._tools.copy()
+        """Lista todas as ferramentas registradas. Força o carregamento de todos os plugins."""
+        with self._lock:
+            for tool_name in self._manifest:
+                if tool_name not in self._tools:
+                    self._load_from_manifest(tool_name)
+            self._load_unresolved_modules()
+            return self._tools.copy()
 
-global_tool_registry = ToolRegistry()
\ No newline at end of file
+global_tool_registry = ToolRegistry()
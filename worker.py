@@ -1,16 +1,81 @@
 # worker.py
+import asyncio
+import functools
 import logging
-import requests
-from requests.exceptions import RequestException
+import os
+import random
+import threading
+import time
+from typing import Optional
 import dramatiq
 from dramatiq.brokers.redis import RedisBroker
+from dramatiq.brokers.stub import StubBroker
 
-from services.orchestration.orchestrator import Orchestrator
+from config import settings
+from services.admission.admission_control import admission_control
+from services.events.task_events import RESULT_EVENT, task_events
+from services.idempotency import task_idempotency
+from services.idempotency.task_idempotency import task_guard
+from services.monitoring.metrics import observe_phase, start_metrics_server, track_phase
+from services.monitoring.profiler import task_profiler
+from services.monitoring.tracing import tracer
+from services.scheduling.fair_scheduler import PRIORITIES, fair_scheduler
+from services.tasks import task_status
+from services.tasks.task_batches import task_batches
+from services.tasks.task_status import task_status_store
+from services.webhooks.webhook_delivery import WebhookDeliveryError, webhook_delivery
 
 # 1. Configuração do Broker do Dramatiq
-# Aponta para o mesmo Redis que usávamos antes.
-redis_broker = RedisBroker(url="redis://localhost:6379/0")
-dramatiq.set_broker(redis_broker)
+# Aponta para o Redis configurado em REDIS_URL (o mesmo usado pelos caches dos serviços).
+# DRAMATIQ_BROKER=stub usa um broker em memória (benchmarks e testes locais, sem Redis).
+if settings.DRAMATIQ_BROKER == "stub":
+    broker = StubBroker()
+else:
+    broker = RedisBroker(url=settings.REDIS_URL)
+
+
+class ServiceShutdownMiddleware(dramatiq.Middleware):
+    """Grava o que ainda estiver em memória nos serviços antes de o processo worker encerrar."""
+
+    def before_worker_shutdown(self, broker, worker):
+        # Importado aqui para não carregar os serviços no processo da API.
+        from services.conversation.conversation_history import conversation_history
+        conversation_history.shutdown()
+
+
+class MetricsMiddleware(dramatiq.Middleware):
+    """
+    Expõe as métricas do processo worker em GET /metrics (porta WORKER_METRICS_PORT,
+    ou a seguinte livre quando há vários processos) e mede a duração de cada mensagem.
+    """
+
+    def __init__(self):
+        self._started = {}
+
+    def after_process_boot(self, broker):
+        if not settings.WORKER_METRICS_PORT:
+            return
+        port = start_metrics_server(settings.WORKER_METRICS_PORT, settings.WORKER_METRICS_PORT_ATTEMPTS)
+        if port is None:
+            logging.getLogger(__name__).warning("Nenhuma porta livre para o endpoint de métricas do worker.")
+        else:
+            logging.getLogger(__name__).info(f"Métricas do worker PID:{os.getpid()} em :{port}/metrics")
+
+    def before_process_message(self, broker, message):
+        self._started[message.message_id] = time.perf_counter()
+
+    def after_process_message(self, broker, message, *, result=None, exception=None):
+        started = self._started.pop(message.message_id, None)
+        if started is None:
+            return
+        observe_phase("task", message.actor_name, time.perf_counter() - started, error=exception is not None)
+
+    after_skip_message = after_process_message
+
+
+broker.add_middleware(ServiceShutdownMiddleware())
+broker.add_middleware(MetricsMiddleware())
+dramatiq.set_broker(broker)
 
 # Configuração do logger
 logging.basicConfig(
@@ -20,46 +85,401 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-orchestrator = Orchestrator()
+# O Orquestrador (e com ele o Gemini, o registro de ferramentas e as conexões com o MongoDB)
+# só é construído no primeiro uso dentro do processo do worker. A API, que apenas importa este
+# módulo para enfileirar mensagens, nunca paga esse custo.
+_orchestrator = None
+# As threads do worker recebem as primeiras mensagens ao mesmo tempo: só uma constrói o Orquestrador.
+_orchestrator_lock = threading.Lock()
+
+
+def get_orchestrator():
+    """Retorna o Orquestrador do processo atual, criando-o sob demanda."""
+    global _orchestrator
+    if _orchestrator is None:
+        with _orchestrator_lock:
+            if _orchestrator is None:
+                from services.orchestration.orchestrator import Orchestrator
+                _orchestrator = Orchestrator()
+    return _orchestrator
+
+
+def _reset_orchestrator_after_fork():
+    global _orchestrator, _orchestrator_lock
+    _orchestrator = None
+    _orchestrator_lock = threading.Lock()
+
+
+# Dramatiq cria os processos worker via fork; cada filho monta o próprio Orquestrador.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_orchestrator_after_fork)
+
+def _send_callback(job_payload: dict, task_id: str, status: str, final_result, started_at: Optional[float]):
+    """
+    Enfileira o callback do resultado da tarefa na fila de webhooks. A entrega (com retries)
+    fica com o actor deliver_webhook: a thread de orquestração é liberada assim que a resposta existe.
+    """
+    webhook_url = job_payload.get("callback_details", {}).get("webhook_url")
+    if webhook_url:
+        # Monta o payload do callback
+        callback_payload = {
+            "task_id": task_id,
+            "status": status,
+            "addressing_info": job_payload.get("callback_details", {}).get("addressing_info"),
+            # Instantes (epoch, segundos) para o cliente separar tempo de fila e de processamento
+            "timings": {
+                "enqueued_at": job_payload.get("enqueued_at"),
+                "started_at": started_at,
+                "finished_at": time.time()
+            }
+        }
+        if final_result:
+            callback_payload["final_output"] = final_result.get("response", "Nenhuma resposta gerada.")
+        else:
+            callback_payload["final_output"] = "A tarefa falhou após todas as tentativas."
+
+        try:
+            deliver_webhook.send(webhook_url, callback_payload, tracer.inject())
+        except Exception as e:
+            # O resultado continua disponível em GET /api/v1/tasks/{task_id}
+            logger.error(f"Falha CRÍTICA ao enfileirar o callback da tarefa {task_id}: {e}")
+    else:
+        logger.warning(f"Nenhuma webhook_url encontrada para a tarefa {task_id}.")
+
+
+def _should_retry_webhook(retries: int, exception: Exception) -> bool:
+    """Erros de rede, timeouts, 5xx e 429 são tentados de novo; outros 4xx vão direto para a dead-letter."""
+    if isinstance(exception, WebhookDeliveryError) and not exception.retriable:
+        return False
+    # Com retry_when o Dramatiq ignora max_retries: o limite é aplicado aqui.
+    return retries < settings.WEBHOOK_MAX_RETRIES
+
+
+@dramatiq.actor(
+    queue_name=settings.WEBHOOK_QUEUE_NAME,
+    retry_when=_should_retry_webhook,
+    # Backoff exponencial com jitter (compute_backoff do middleware Retries)
+    min_backoff=settings.WEBHOOK_MIN_BACKOFF_MS,
+    max_backoff=settings.WEBHOOK_MAX_BACKOFF_MS,
+    on_retry_exhausted="record_webhook_dead_letter",
+    time_limit=int((settings.WEBHOOK_TIMEOUT_SECONDS + 30) * 1000)
+)
+def deliver_webhook(webhook_url: str, callback_payload: dict, trace_context: dict = None):
+    """Entrega o callback de uma tarefa. Levanta WebhookDeliveryError para o Dramatiq reagendar."""
+    task_id = callback_payload.get("task_id", "N/A")
+    logger.info(f"Enviando callback para a tarefa {task_id} para a URL: {webhook_url}")
+    with track_phase("webhook"), tracer.start_span(
+        "webhook",
+        attributes={"task_id": task_id, "status": callback_payload.get("status", "")},
+        parent=tracer.extract(trace_context)
+    ):
+        try:
+            webhook_delivery.deliver(webhook_url, callback_payload)
+        except WebhookDeliveryError as e:
+            logger.warning(f"Falha ao entregar o callback da tarefa {task_id}: {e}")
+            raise
+
+
+@dramatiq.actor(queue_name=settings.WEBHOOK_QUEUE_NAME, max_retries=3)
+def record_webhook_dead_letter(message_data: dict, retry_info: dict):
+    """Recebe os callbacks que esgotaram as tentativas (on_retry_exhausted de deliver_webhook)."""
+    webhook_url, callback_payload = message_data["args"][:2]
+    logger.error(
+        f"Callback da tarefa {callback_payload.get('task_id')} movido para a dead-letter "
+        f"após {retry_info.get('retries', 0) + 1} tentativa(s)."
+    )
+    webhook_delivery.record_dead_letter(
+        webhook_url, callback_payload,
+        retries=retry_info.get("retries", 0),
+        error=message_data.get("options", {}).get("traceback")
+    )
+
+
+def _record_final_status(job_payload: dict, status: str, final_result):
+    """
+    Grava o estado final e a resposta da tarefa, consultáveis em GET /api/v1/tasks/{task_id}.
+    Uma tentativa com exceção não é final: o Dramatiq repete a tarefa e o FAILED só é gravado
+    quando as tentativas se esgotam (_fail_task).
+    """
+    if status == "failed":
+        task_status_store.set_status(job_payload, task_status.RETRYING)
+        return
+    state, final_output, required_params = _final_state(final_result)
+    task_status_store.set_status(job_payload, state, final_output=final_output, required_params=required_params)
+
+
+def _final_state(final_result) -> tuple:
+    """(estado, resposta, parâmetros pendentes) da tarefa terminada, a partir do resultado da orquestração."""
+    if not final_result:
+        return task_status.FAILED, None, None
+    if final_result.get("type") == "pending":
+        return task_status.PENDING_INPUT, final_result.get("message"), final_result.get("required_params")
+    if final_result.get("type") == "error":
+        return task_status.FAILED, final_result.get("message"), None
+    return task_status.COMPLETED, final_result.get("response"), None
+
+
+def _task_span(job_payload: dict):
+    """
+    O span da tarefa continua o trace aberto na rota /ask (traceparent no payload).
+    Com 'stream_events' no payload, o progresso é publicado para quem espera na rota /ask.
+    """
+    return tracer.start_span(
+        "process_ai_request",
+        attributes={"task_id": job_payload.get("task_id", "N/A"), "session_id": job_payload.get("session_id", ""),
+                    "user_id": job_payload.get("user_id", "")},
+        parent=tracer.extract(job_payload.get("trace_context"))
+    )
+
+
+def _start_task(job_payload: dict):
+    task_events.emit("started")
+    task_status_store.set_status(job_payload, task_status.RUNNING)
+
+
+def _finish_task(job_payload: dict, status: str, final_result, started_at: float):
+    """
+    Estado, evento 'result' e callback ao fim de cada tentativa. Uma tentativa com exceção será
+    repetida pelo Dramatiq: o resultado, o callback e a vaga da admissão ficam para _fail_task.
+    """
+    _record_final_status(job_payload, status, final_result)
+    if status != "failed":
+        _publish_result(job_payload, final_result)
+        _send_callback(job_payload, job_payload.get("task_id", "N/A"), status, final_result, started_at)
+        # Libera a vaga do usuário e alimenta a taxa de processamento usada na admissão
+        admission_control.task_finished(job_payload)
+    # Sem resultado o Dramatiq repete a tarefa: ela continua à frente das demais da sessão
+    finished = status != "failed" and final_result is not None
+    task_guard.release(job_payload, finished=finished)
+    if finished:
+        _finish_batch_task(job_payload)
+
+
+def _publish_result(job_payload: dict, final_result):
+    # Publicado mesmo sem 'stream_events': uma submissão duplicada pode estar esperando o resultado.
+    # Estado e resposta são os mesmos gravados por _record_final_status.
+    state, final_output, required_params = _final_state(final_result)
+    task_events.publish(
+        job_payload.get("task_id"),
+        RESULT_EVENT,
+        status=state,
+        final_output=final_output,
+        required_params=required_params
+    )
 
-@dramatiq.actor(max_retries=3, time_limit=600000) # Timeout de 10 minutos
+
+def _finish_batch_task(job_payload: dict):
+    """Conta a tarefa no lote dela (POST /ask/batch); a última do lote envia o callback agregado."""
+    batch = task_batches.task_finished(job_payload)
+    if batch is not None:
+        send_batch_callback(batch)
+
+
+def send_batch_callback(batch: dict):
+    """Enfileira o callback agregado do lote com o estado e a resposta de cada tarefa."""
+    records = task_status_store.get_many(batch["task_ids"])
+    tasks = [
+        {
+            "task_id": task_id,
+            "status": (record or {}).get("status"),
+            "final_output": (record or {}).get("final_output"),
+        }
+        for task_id, record in records.items()
+    ]
+    counts = {}
+    for task in tasks:
+        counts[task["status"]] = counts.get(task["status"], 0) + 1
+    logger.info(f"Lote {batch['batch_id']} concluído ({len(tasks)} tarefas): enviando o callback agregado.")
+    deliver_webhook.send(batch["webhook_url"], {
+        "batch_id": batch["batch_id"],
+        "total": len(tasks),
+        "counts": counts,
+        "tasks": tasks,
+        "addressing_info": batch.get("addressing_info") or {},
+    }, tracer.inject())
+
+
+def _acquire_task(job_payload: dict) -> str:
+    """Decisão do task_guard (idempotência e ordem da sessão) para esta mensagem da tarefa."""
+    record = task_status_store.get(job_payload["task_id"]) if settings.IDEMPOTENCY_ENABLED else None
+    already_done = record is not None and record.get("status") in (task_status.COMPLETED, task_status.PENDING_INPUT)
+    decision = task_guard.acquire(job_payload, already_done=already_done)
+    if decision in (task_idempotency.DUPLICATE, task_idempotency.DONE):
+        logger.warning(f"Mensagem da tarefa {job_payload['task_id']} descartada ({decision}).")
+    return decision
+
+
+def _defer_task(job_payload: dict):
+    # Outra tarefa da sessão está à frente; jitter para as adiadas não voltarem juntas
+    delay = int(settings.SESSION_ORDERING_DEFER_MS * (1 + random.random()))
+    process_ai_request.send_with_options(args=(job_payload,), delay=delay)
+
+
+@dramatiq.actor(max_retries=3, time_limit=600000, on_retry_exhausted="release_task_guard") # Timeout de 10 minutos
 def process_ai_request(job_payload: dict):
     """
     Esta é a tarefa assíncrona que o worker do Dramatiq executará.
     Dramatiq lida com retries automaticamente quando uma exceção é levantada.
+    Mensagens duplicadas da mesma tarefa são descartadas e as de uma sessão executam em ordem.
+    """
+    decision = _acquire_task(job_payload)
+    if decision == task_idempotency.WAIT:
+        _defer_task(job_payload)
+    elif decision == task_idempotency.RUN:
+        _process_task(job_payload)
+
+
+def _fail_task(job_payload: dict):
+    """
+    Fim definitivo da tarefa que esgotou as tentativas: estado FAILED, evento 'result',
+    callback, vaga da admissão, fila da sessão e lote.
     """
     task_id = job_payload.get("task_id", "N/A")
+    logger.error(f"Tarefa {task_id} falhou após todas as tentativas.")
+    task_status_store.set_status(job_payload, task_status.FAILED)
+    _publish_result(job_payload, None)
+    _send_callback(job_payload, task_id, "failed", None, None)
+    admission_control.task_finished(job_payload)
+    task_guard.release(job_payload, finished=True)
+    _finish_batch_task(job_payload)
+
+
+@dramatiq.actor(max_retries=3)
+def release_task_guard(message_data: dict, retry_info: dict):
+    """Encerra a tarefa que esgotou as tentativas (on_retry_exhausted de process_ai_request)."""
+    _fail_task(message_data["args"][0])
+
+
+def _process_task(job_payload: dict):
+    task_id = job_payload.get("task_id", "N/A")
+    started_at = time.time()
     logger.info(f"Iniciando processamento da tarefa: {task_id}")
 
     final_result = None
     status = "completed"
-    try:
-        final_result = orchestrator.process_task_sync(job_payload)
-
-    except Exception as e:
-        logger.exception(f"Erro CRÍTICO ao processar a tarefa {task_id}: {e}")
-        status = "failed"
-        raise e
-
-    finally:
-
-        webhook_url = job_payload.get("callback_details", {}).get("webhook_url")
-        if webhook_url:
-            # Monta o payload do callback
-            callback_payload = {
-                "task_id": task_id,
-                "status": status,
-                "addressing_info": job_payload.get("callback_details", {}).get("addressing_info")
-            }
-            if final_result:
-                callback_payload["final_output"] = final_result.get("response", "Nenhuma resposta gerada.")
-            else:
-                callback_payload["final_output"] = "A tarefa falhou após todas as tentativas."
-            
-            try:
-                logger.info(f"Enviando callback para a tarefa {task_id} para a URL: {webhook_url}")
-                requests.post(webhook_url, json=callback_payload, timeout=15)
-            except RequestException as re:
-                logger.error(f"Falha CRÍTICA ao enviar o callback para a tarefa {task_id}: {re}")
-        else:
-            logger.warning(f"Nenhuma webhook_url encontrada para a tarefa {task_id}.")
\ No newline at end of file
+    with _task_span(job_payload), task_events.bind(job_payload):
+        _start_task(job_payload)
+        try:
+            final_result = get_orchestrator().process_task_sync(job_payload)
+
+        except Exception as e:
+            logger.exception(f"Erro CRÍTICO ao processar a tarefa {task_id}: {e}")
+            status = "failed"
+            raise e
+
+        finally:
+            _finish_task(job_payload, status, final_result, started_at)
+
+
+async def process_ai_request_async(job_payload: dict):
+    """
+    Mesmo fluxo de process_ai_request, como corrotina: usado pelo worker assíncrono
+    (async_worker.py), que executa muitas tarefas no mesmo loop de eventos.
+    """
+    decision = await asyncio.to_thread(_acquire_task, job_payload)
+    if decision == task_idempotency.WAIT:
+        await asyncio.to_thread(_defer_task, job_payload)
+    elif decision == task_idempotency.RUN:
+        await _process_task_async(job_payload)
+
+
+async def _process_task_async(job_payload: dict):
+    task_id = job_payload.get("task_id", "N/A")
+    started_at = time.time()
+    logger.info(f"Iniciando processamento da tarefa: {task_id}")
+
+    final_result = None
+    status = "completed"
+    with _task_span(job_payload), task_events.bind(job_payload):
+        await asyncio.to_thread(_start_task, job_payload)
+        try:
+            with task_profiler.profile_task(job_payload, attach_current_thread=False):
+                final_result = await get_orchestrator().process_task_async(job_payload)
+
+        except Exception as e:
+            logger.exception(f"Erro CRÍTICO ao processar a tarefa {task_id}: {e}")
+            status = "failed"
+            raise e
+
+        finally:
+            await asyncio.to_thread(_finish_task, job_payload, status, final_result, started_at)
+
+
+# --- Filas por prioridade com fair share entre usuários (services/scheduling) ---
+# A rota /ask grava a tarefa no fair_scheduler e envia um ticket para a fila da prioridade.
+# O ticket não carrega a tarefa: ao ser processado, pede ao escalonador a próxima tarefa
+# elegível daquela prioridade (deficit round-robin entre usuários, com limite por usuário).
+
+def _defer_ticket(priority: str, ticket: dict):
+    # Jitter para os tickets adiados não voltarem todos juntos
+    delay = int(settings.SCHEDULER_DEFER_MS * (1 + random.random()))
+    SCHEDULED_TASK_ACTORS[priority].send_with_options(args=(ticket,), delay=delay)
+
+
+def _run_ticket(priority: str, ticket: dict):
+    job_payload = fair_scheduler.claim(priority, ticket["ticket_id"])
+    if job_payload is None:
+        _defer_ticket(priority, ticket)
+        return
+    decision = _acquire_task(job_payload)
+    if decision == task_idempotency.WAIT:
+        # Outra tarefa da sessão vem antes: a tarefa volta para a fila do usuário e libera a
+        # vaga dele (a da frente pode precisar dela); ao voltar, o ticket pede outra tarefa
+        fair_scheduler.requeue(ticket["ticket_id"])
+        _defer_ticket(priority, ticket)
+        return
+    if decision == task_idempotency.RUN:
+        # Uma exceção reagenda o ticket (Retries); o retry recebe a mesma tarefa
+        _process_task(job_payload)
+    fair_scheduler.release(ticket["ticket_id"])
+
+
+async def _run_ticket_async(priority: str, ticket: dict):
+    job_payload = await asyncio.to_thread(fair_scheduler.claim, priority, ticket["ticket_id"])
+    if job_payload is None:
+        await asyncio.to_thread(_defer_ticket, priority, ticket)
+        return
+    decision = await asyncio.to_thread(_acquire_task, job_payload)
+    if decision == task_idempotency.WAIT:
+        await asyncio.to_thread(fair_scheduler.requeue, ticket["ticket_id"])
+        await asyncio.to_thread(_defer_ticket, priority, ticket)
+        return
+    if decision == task_idempotency.RUN:
+        await _process_task_async(job_payload)
+    await asyncio.to_thread(fair_scheduler.release, ticket["ticket_id"])
+
+
+def _scheduled_task_actor(priority: str, rank: int):
+    def run_scheduled_task(ticket: dict):
+        _run_ticket(priority, ticket)
+
+    return dramatiq.actor(
+        run_scheduled_task,
+        actor_name=f"run_scheduled_task_{priority}",
+        queue_name=fair_scheduler.queue_name(priority),
+        # Prioridade local do Dramatiq (menor sai antes) entre mensagens já reservadas pelo worker
+        priority=rank * 10,
+        max_retries=3,
+        time_limit=600000,
+        on_retry_exhausted="release_scheduled_task",
+    )
+
+
+SCHEDULED_TASK_ACTORS = {priority: _scheduled_task_actor(priority, rank) for rank, priority in enumerate(PRIORITIES)}
+
+
+@dramatiq.actor(queue_name=fair_scheduler.queue_name("default"), max_retries=3)
+def release_scheduled_task(message_data: dict, retry_info: dict):
+    """Libera a vaga do usuário e a fila da sessão quando o ticket esgota as tentativas."""
+    job_payload = fair_scheduler.release(message_data["args"][0]["ticket_id"])
+    if job_payload is not None:
+        _fail_task(job_payload)
+
+
+# Corrotinas que o worker assíncrono executa no lugar do actor; os demais actors
+# rodam no pool de threads do worker assíncrono.
+ASYNC_HANDLERS = {
+    process_ai_request.actor_name: process_ai_request_async,
+    **{actor.actor_name: functools.partial(_run_ticket_async, priority)
+       for priority, actor in SCHEDULED_TASK_ACTORS.items()},
+}